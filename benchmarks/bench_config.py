@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+配置存储基准：10k 台服务器下 JSON 与 SQLite 存储的加载、查找、分页、修改与导入导出耗时
+用法: python benchmarks/bench_config.py [服务器数量]
+"""
+
+import json
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from echipa.config import BaseConfigManager, default_server
+
+
+def make_servers(count):
+    servers = []
+    for i in range(count):
+        server = default_server()
+        server.update({
+            'id': str(uuid.uuid4()),
+            'name': f'worker-{i:05d}',
+            'server': f'w{i}.example.workers.dev:443',
+            'tags': ['hk' if i % 3 == 0 else 'sg', f'group{i % 10}'],
+        })
+        servers.append(server)
+    return servers
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+
+def bench(manager, servers):
+    ids = [s['id'] for s in servers]
+    result = {}
+    result['load_ms'], _ = timed(manager.load_config)
+    result['get_current_us'] = timed(manager.get_current_server, 1000)[0] * 1000
+    result['get_by_id_us'] = timed(lambda: manager.get_server(ids[len(ids) // 2]), 1000)[0] * 1000
+    result['name_exists_us'] = timed(lambda: manager.name_exists('worker-09999'), 1000)[0] * 1000
+    result['page_first_ms'], _ = timed(lambda: manager.page_servers(0, 100))
+    result['page_mid_ms'], _ = timed(lambda: manager.page_servers(len(ids) // 2, 100))
+    result['search_prefix_ms'], _ = timed(lambda: manager.page_servers(0, 100, query='worker-05'))
+    result['search_tag_ms'], _ = timed(lambda: manager.page_servers(0, 100, tag='group3'))
+
+    def mutate():
+        server = dict(manager.get_server(ids[0]))
+        server['token'] = 'x'
+        manager.update_server(server)
+        manager.save_config()
+    result['update_and_save_us'] = timed(mutate, 100)[0] * 1000
+    result['flush_ms'], _ = timed(manager.flush)
+    return {k: round(v, 3) for k, v in result.items()}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    servers = make_servers(count)
+    report = {'servers': count}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_dir = Path(tmp) / 'json'
+        json_dir.mkdir()
+        payload = {'servers': servers, 'current_server_id': servers[-1]['id']}
+
+        # 旧实现：缩进 JSON 同步写入
+        report['legacy_indented_save_ms'], _ = timed(
+            lambda: (json_dir / 'legacy.json').write_text(
+                json.dumps(payload, indent=2, ensure_ascii=False), encoding='utf-8'))
+        (json_dir / 'config.json').write_text(json.dumps(payload, ensure_ascii=False), encoding='utf-8')
+        report['json'] = bench(BaseConfigManager(json_dir), servers)
+
+        sqlite_dir = Path(tmp) / 'sqlite'
+        sqlite_dir.mkdir()
+        manager = BaseConfigManager(sqlite_dir)
+        manager.use_sqlite()
+        report['sqlite_bulk_import_ms'], _ = timed(
+            lambda: manager.import_json(json_dir / 'config.json', replace=True))
+        report['sqlite'] = bench(BaseConfigManager(sqlite_dir), servers)
+        report['sqlite_export_ms'], _ = timed(lambda: manager.export_json(Path(tmp) / 'export.json'))
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
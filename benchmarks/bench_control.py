@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+控制接口基准：/metrics 抓取延迟（服务端处理耗时与客户端往返），TCP 与 Unix 套接字
+用法: python benchmarks/bench_control.py [次数]
+"""
+
+import json
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from echipa.control import ControlServer
+
+
+class SampleController:
+    """状态字段与守护进程一致的固定数据"""
+
+    def status(self):
+        return {
+            'server': '香港', 'server_id': 'x', 'listen': '127.0.0.1:30000',
+            'up': 1, 'uptime_seconds': 3600.5, 'restarts_total': 3,
+            'connections_total': 123456, 'connections_active': 42, 'connections_failed_total': 1,
+            'ready_ms': 180.2, 'log_backlog': 1000, 'dns_cache_hit_rate': 0.93,
+        }
+
+    def logs(self, since=0):
+        return since, []
+
+    def probe_addr(self):
+        return None
+
+    def command(self, name, arg=None):
+        return {'ok': True, 'queued': name}
+
+
+def scrape(sock, path):
+    sock.sendall(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+    data = b''
+    while b'\r\n\r\n' not in data:
+        data += sock.recv(65536)
+    head, body = data.split(b'\r\n\r\n', 1)
+    length = int([l for l in head.split(b'\r\n') if l.lower().startswith(b'content-length')][0].split(b':')[1])
+    while len(body) < length:
+        body += sock.recv(65536)
+    return body
+
+
+def bench(server, connect, runs, path):
+    sock = connect()
+    scrape(sock, path)  # 预热
+    client, handler = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        scrape(sock, path)
+        client.append((time.perf_counter() - start) * 1e6)
+        handler.append(server.last_scrape_us)
+    sock.close()
+    return {
+        'client_p50_us': round(statistics.median(client), 1),
+        'client_p99_us': round(sorted(client)[int(len(client) * 0.99)], 1),
+        'server_p50_us': round(statistics.median(handler), 1),
+    }
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    report = {'runs': runs}
+    server = ControlServer(SampleController(), '127.0.0.1:0').start()
+    addr = server.address
+    report['tcp_prometheus'] = bench(server, lambda: socket.create_connection(addr), runs, '/metrics')
+    report['tcp_json'] = bench(server, lambda: socket.create_connection(addr), runs, '/metrics?format=json')
+    server.stop()
+
+    if hasattr(socket, 'AF_UNIX'):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / 'control.sock')
+            server = ControlServer(SampleController(), 'unix:' + path).start()
+
+            def connect():
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(path)
+                return sock
+            report['unix_prometheus'] = bench(server, connect, runs, '/metrics')
+            server.stop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+本地 DNS 缓存基准：对本地替身 DoH 服务器测量命中率与延迟
+用法: python benchmarks/bench_dns.py [查询次数] [不同域名数]
+"""
+
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from echipa import doh
+from echipa.dnsproxy import DNSForwarder
+
+UPSTREAM_DELAY = 0.02  # 模拟公网 DoH 往返
+
+
+class StandInDoH(BaseHTTPRequestHandler):
+    """对任意 A 查询返回 192.0.2.1，TTL 300"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        query = self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(UPSTREAM_DELAY)
+        header = bytearray(query[:12])
+        header[2:4] = b'\x81\x80'
+        header[6:8] = b'\x00\x01'
+        answer = b'\xc0\x0c' + struct.pack('!HHIH', doh.TYPE_A, 1, 300, 4) + bytes([192, 0, 2, 1])
+        body = bytes(header) + query[12:] + answer
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/dns-message')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    names = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInDoH)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    upstream = f'http://127.0.0.1:{server.server_address[1]}/dns-query'
+
+    forwarder = DNSForwarder(listen='127.0.0.1:0', upstream=upstream)
+    forwarder.start()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(5)
+    latencies = []
+    for i in range(total):
+        query = doh.build_query(f'host{i % names}.example.com', doh.TYPE_A, qid=i & 0xFFFF)
+        start = time.perf_counter()
+        sock.sendto(query, forwarder.address)
+        sock.recvfrom(4096)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    result = forwarder.stats()
+    result.update({
+        'queries': total,
+        'client_p50_ms': round(latencies[len(latencies) // 2], 3),
+        'client_p99_ms': round(latencies[int(len(latencies) * 0.99)], 3),
+        'client_mean_ms': round(sum(latencies) / len(latencies), 3),
+    })
+    forwarder.stop()
+    server.shutdown()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+分流判定查询基准（echipa.explain）：规则分流与跳过中国大陆两种模式下首次判定与缓存命中的单次耗时、
+批量查询速率、LRU 容量不足时的命中率，以及规则文件修改后（RuleSet.version 变化）旧结果是否失效
+用法: python benchmarks/bench_explain.py [规则数] [主机数] [缓存容量]
+"""
+
+import ipaddress
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from echipa.explain import RouteExplainer
+from echipa.ipindex import IPv6Index
+from echipa.routing import BypassRanges
+from echipa.rules import RuleSet
+
+TLDS = ('com', 'net', 'org', 'cn', 'io', 'jp')
+
+
+def random_domain(rng):
+    return '.'.join(''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(3, 9)))
+                    for _ in range(rng.randint(1, 2))) + '.' + rng.choice(TLDS)
+
+
+def timed_each(fn, items):
+    """每次调用的耗时（微秒）"""
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return {'p50_us': round(statistics.median(samples), 1), 'p99_us': round(samples[int(len(samples) * 0.99)], 1)}
+
+
+def bench(rule_count, host_count, capacity):
+    rng = random.Random(1)
+    domains = [random_domain(rng) for _ in range(rule_count)]
+    lines = [f"DOMAIN-SUFFIX,{d},{rng.choice(('DIRECT', 'PROXY', 'REJECT'))}" for d in domains]
+    for _ in range(rule_count // 4):
+        prefix = rng.randint(8, 24)
+        network = ipaddress.IPv4Network((rng.getrandbits(32) >> (32 - prefix) << (32 - prefix), prefix))
+        lines.append(f"IP-CIDR,{network},{rng.choice(('DIRECT', 'PROXY'))}")
+    lines.append('MATCH,PROXY')
+    hosts = [f"www.{rng.choice(domains)}" if rng.random() < 0.5 else random_domain(rng) for _ in range(host_count)]
+    fake_dns = {host: [str(ipaddress.IPv4Address(rng.getrandbits(32)))] for host in hosts}
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'rules.txt'
+        path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        rules = RuleSet([path])
+        rules.refresh()
+        explainer = RouteExplainer('rules', rules=rules, resolver=fake_dns.get, max_entries=capacity)
+        cold = timed_each(explainer.explain, hosts)
+        warm = timed_each(explainer.explain, hosts)
+        start = time.perf_counter()
+        explainer.explain_many(hosts)
+        batch_s = time.perf_counter() - start
+        report['rules'] = {'rules': len(rules.rules), 'cold': summary(cold), 'cached': summary(warm),
+                           'batch_hosts_per_s': round(len(hosts) / batch_s), **explainer.stats()}
+
+        # 规则文件修改后重新编译：版本变化，缓存中的旧结果不再使用
+        path.write_text('DOMAIN-SUFFIX,com,DIRECT\n' + '\n'.join(lines) + '\n', encoding='utf-8')
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        rules.refresh()
+        stale = sum(explainer.explain(host).verdict != 'DIRECT' for host in hosts if host.endswith('.com'))
+        report['rules']['stale_after_refresh'] = stale
+
+    # 跳过中国大陆：合成的 IPv4/IPv6 段
+    starts = sorted(rng.sample(range(1 << 20), 8000))
+    bases6 = [0x240e << 112 | rng.getrandbits(20) << 92 for _ in range(2000)]
+    ranges = BypassRanges([(s << 12, (s << 12) + 4095) for s in starts],
+                          IPv6Index.from_ranges((base, base + (1 << 92) - 1) for base in bases6))
+    explainer = RouteExplainer('bypass_cn', ranges, resolver=fake_dns.get, max_entries=capacity)
+    cold = timed_each(explainer.explain, hosts)
+    warm = timed_each(explainer.explain, hosts)
+    report['bypass_cn'] = {'cold': summary(cold), 'cached': summary(warm), **explainer.stats()}
+    return report
+
+
+def main():
+    rule_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    host_count = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    capacity = int(sys.argv[3]) if len(sys.argv) > 3 else 4096
+    print(json.dumps(bench(rule_count, host_count, capacity), indent=2))
+
+
+if __name__ == '__main__':
+    main()
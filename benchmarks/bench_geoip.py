@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+国家数据库基准：.mmdb（echipa.geoip，mmap 遍历搜索树）与中国 IP 列表（load_china_ip_list 的 JSON 缓存 + 二分查找）
+的加载耗时、单个 IP 查询速率，以及生成分流用 IPv4 段与 Windows 绕过列表的耗时
+用法: python benchmarks/bench_geoip.py [网络数量] [查询次数] [数据库文件]
+
+未指定数据库文件时生成一个 GeoLite2-Country 格式的合成数据库（IPv6 树，IPv4 位于 ::/96，24 位记录），
+中国 IP 列表缓存使用合成数据库中 CN 的段，两条路径的数据量相同。
+"""
+
+import bisect
+import json
+import random
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from echipa.geoip import DATA_SEPARATOR, METADATA_MARKER, MMDBReader
+from echipa.routing import load_china_ip_list, ranges_to_wildcards, windows_bypass_list
+
+COUNTRIES = ['CN', 'HK', 'US', 'JP', 'SG', 'TW', 'KR', 'DE', 'GB', 'FR'] + [f'X{i:02d}' for i in range(240)]
+WEIGHTS = [12, 2, 25, 6, 2, 2, 4, 4, 4, 3] + [0.15] * 240
+
+
+def encode(value):
+    """MaxMind DB 数据区编码（只支持合成数据库用到的类型）"""
+    def head(kind, size):
+        assert size < 29
+        return bytes([kind << 5 | size]) if kind < 8 else bytes([size, kind - 7])
+    if isinstance(value, dict):
+        return head(7, len(value)) + b''.join(encode(k) + encode(v) for k, v in value.items())
+    if isinstance(value, list):
+        return head(11, len(value)) + b''.join(encode(v) for v in value)
+    if isinstance(value, str):
+        data = value.encode('utf-8')
+        return head(2, len(data)) + data
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return head(6 if value < 1 << 32 else 9, len(data)) + data
+
+
+def synthetic_networks(count, rng):
+    """从 1.0.0.0 开始依次分配对齐的 /12-/24 网络，随机留空；返回 [(起始地址, 前缀长度, 国家)]"""
+    networks = []
+    address = 1 << 24
+    while len(networks) < count and address < 224 << 24:
+        prefix = rng.choice((12, 14, 16, 18, 19, 20, 21, 22, 22, 23, 24, 24, 24))
+        prefix = max(prefix, 32 - ((address & -address).bit_length() - 1))  # 起始地址必须对齐
+        if rng.random() > 0.1:
+            networks.append((address, prefix, rng.choices(COUNTRIES, WEIGHTS)[0]))
+        address += 1 << (32 - prefix)
+    return networks
+
+
+def write_mmdb(path, networks):
+    """把 IPv4 网络写入 IPv6 搜索树的 ::/96 子树（与 GeoLite2 相同），每个国家一条数据记录"""
+    data = bytearray()
+    offsets = {}
+    for code in COUNTRIES:
+        offsets[code] = len(data)
+        data += encode({'country': {'iso_code': code, 'names': {'en': code}}})
+    left, right = [0], [0]  # 0 表示空（写出时换成 node_count）；叶子用 -(偏移 + 1)
+    for address, prefix, code in networks:
+        node = 0
+        for depth in range(96 + prefix):
+            bit = address >> (127 - depth) & 1 if depth >= 96 else 0
+            children = right if bit else left
+            if depth == 96 + prefix - 1:
+                children[node] = -(offsets[code] + 1)
+            else:
+                if children[node] <= 0:
+                    children[node] = len(left)
+                    left.append(0)
+                    right.append(0)
+                node = children[node]
+    count = len(left)
+
+    def record(value):
+        if value == 0:
+            return count
+        if value < 0:
+            return count + DATA_SEPARATOR + (-value - 1)
+        return value
+    tree = bytearray()
+    for l, r in zip(left, right):
+        tree += record(l).to_bytes(3, 'big') + record(r).to_bytes(3, 'big')
+    metadata = encode({'node_count': count, 'record_size': 24, 'ip_version': 6,
+                       'database_type': 'GeoLite2-Country', 'languages': ['en'],
+                       'binary_format_major_version': 2, 'binary_format_minor_version': 0,
+                       'build_epoch': int(time.time()), 'description': {'en': 'synthetic'}})
+    with open(path, 'wb') as f:
+        f.write(tree + bytes(DATA_SEPARATOR) + data + METADATA_MARKER + metadata)
+    return count
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+
+def bench(network_count, queries, db_path=None):
+    rng = random.Random(1)
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if db_path is None:
+            db_path = tmp / 'Country.mmdb'
+            networks = synthetic_networks(network_count, rng)
+            report['networks'] = len(networks)
+            report['nodes'] = write_mmdb(db_path, networks)
+        report['mmdb_kb'] = round(db_path.stat().st_size / 1024)
+
+        open_ms, reader = timed(lambda: MMDBReader(db_path))
+        ranges_ms, cn_ranges = timed(lambda: reader.country_ranges(['CN']))
+        reader._ranges.clear()
+        cn_hk_ms, cn_hk_ranges = timed(lambda: reader.country_ranges(['CN', 'HK']))
+
+        # 现有路径：load_china_ip_list 读取 24 小时内的 JSON 缓存
+        with open(tmp / 'china_ip_list.json', 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': time.time(), 'ranges': cn_ranges}, f)
+        list_ms, list_ranges = timed(lambda: load_china_ip_list(tmp), 5)
+        starts = [start for start, _ in list_ranges]
+
+        def in_list(ip):
+            i = bisect.bisect_right(starts, ip) - 1
+            return i >= 0 and ip <= list_ranges[i][1]
+
+        ips = [rng.getrandbits(32) for _ in range(queries)]
+        country = reader.country
+        for ip in ips[:1000]:  # 预热数据记录缓存
+            country(ip)
+        mmdb_s, codes = timed(lambda: [country(ip) for ip in ips])
+        list_s, hits = timed(lambda: [in_list(ip) for ip in ips])
+        mismatch = sum((code == 'CN') != hit for code, hit in zip(codes, hits))
+        text_ips = [f'{ip >> 24}.{ip >> 16 & 255}.{ip >> 8 & 255}.{ip & 255}' for ip in ips[:queries // 10]]
+        text_s, _ = timed(lambda: [country(ip) for ip in text_ips])
+
+        report.update({
+            'mmdb': {
+                'open_ms': round(open_ms, 2),
+                'cn_ranges_ms': round(ranges_ms, 1),
+                'cn_hk_ranges_ms': round(cn_hk_ms, 1),
+                'cn_ranges': len(cn_ranges),
+                'cn_hk_ranges': len(cn_hk_ranges),
+                'lookups_per_s': round(queries / mmdb_s * 1000),
+                'text_lookups_per_s': round(len(text_ips) / text_s * 1000),
+                'data_records_decoded': len(reader._countries),
+            },
+            'china_ip_list': {
+                'load_ms': round(list_ms, 1),
+                'ranges': len(list_ranges),
+                'lookups_per_s': round(queries / list_s * 1000),
+            },
+            'lookup_mismatches': mismatch,
+            'wildcards_ms': round(timed(lambda: ranges_to_wildcards(cn_hk_ranges))[0], 1),
+            'windows_bypass_chars': len(windows_bypass_list('bypass_cn_hk', cn_hk_ranges)),
+        })
+        reader.close()
+    return report
+
+
+def main():
+    network_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    db_path = Path(sys.argv[3]) if len(sys.argv) > 3 else None
+    print(json.dumps(bench(network_count, queries, db_path), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+IPv6 段索引基准：中国 IPv6 列表的文本解析与二进制缓存（IPv6Index.save/load）的加载耗时、
+查询速率（与 128 位整数列表二分查找对比，并与逐段扫描校验结果一致）、每段内存占用，
+以及 PAC 脚本与绕过列表通配符的生成耗时
+用法: python benchmarks/bench_ipv6.py [段数] [查询次数]
+
+段为合成数据：在 2400::/12 中依次分配 /20-/48 的网络，与 chn_ip_v6.txt 的形态相近。
+"""
+
+import bisect
+import ipaddress
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from echipa.ipindex import NO_MATCH, IPv6Index, parse_ranges
+from echipa.routing import BypassRanges, ipv6_wildcards, pac_script
+
+
+def synthetic_list(count, rng):
+    """`网络/前缀` 每行一个，按地址递增、随机留空"""
+    lines = []
+    address = int(ipaddress.IPv6Address('2400::'))
+    while len(lines) < count:
+        prefix = rng.choice((20, 28, 29, 32, 32, 32, 36, 40, 44, 48, 48))
+        size = 1 << (128 - prefix)
+        address = (address + size - 1) // size * size  # 起始地址必须对齐
+        if rng.random() > 0.2:
+            lines.append(f"{ipaddress.IPv6Address(address)}/{prefix}")
+        address += size
+    return '\n'.join(lines) + '\n'
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+
+def bench(count, queries):
+    rng = random.Random(1)
+    text = synthetic_list(count, rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        parse_ms, index = timed(lambda: IPv6Index.from_ranges(parse_ranges(text, 6)))
+        cache = tmp / 'china_ip_list_v6.bin'
+        save_ms, _ = timed(lambda: index.save(cache))
+        load_ms, (loaded, _) = timed(lambda: IPv6Index.load(cache), 5)
+        # 对照：与 IPv4 列表相同的 JSON 缓存（128 位整数对）
+        ranges = index.ranges()
+        with open(tmp / 'ranges.json', 'w', encoding='utf-8') as f:
+            json.dump(ranges, f)
+        json_ms, _ = timed(lambda: json.loads((tmp / 'ranges.json').read_text(encoding='utf-8')), 5)
+        json_kb = (tmp / 'ranges.json').stat().st_size / 1024
+
+        starts = [start for start, _ in ranges]
+
+        def in_list(n):
+            i = bisect.bisect_right(starts, n) - 1
+            return i >= 0 and n <= ranges[i][1]
+
+        numbers = []
+        for _ in range(queries):
+            if rng.random() < 0.5:
+                start, end = rng.choice(ranges)
+                numbers.append(rng.randint(start, end))
+            else:
+                numbers.append(int(ipaddress.IPv6Address('2400::')) + rng.getrandbits(116))
+        index_ms, found = timed(lambda: [loaded.find(n) != NO_MATCH for n in numbers])
+        list_ms, listed = timed(lambda: [in_list(n) for n in numbers])
+        sample = numbers[:max(1, queries // 100)]
+        expected = [any(start <= n <= end for start, end in ranges) for n in sample]
+        mismatch = sum(got != want for got, want in zip(found, expected)) + sum(a != b for a, b in zip(found, listed))
+
+        tuple_bytes = sys.getsizeof(ranges) + sum(sys.getsizeof(r) + sys.getsizeof(r[0]) + sys.getsizeof(r[1])
+                                                  for r in ranges)
+        bypass = BypassRanges([], loaded)
+        wildcards_ms, wildcards = timed(lambda: ipv6_wildcards(loaded.ranges()))
+        pac_ms, pac = timed(lambda: pac_script('127.0.0.1:30000', 'bypass_cn', bypass))
+        return {
+            'ranges': len(loaded),
+            'text_kb': round(len(text) / 1024),
+            'text_parse_ms': round(parse_ms, 1),
+            'binary_cache_kb': round(cache.stat().st_size / 1024),
+            'binary_save_ms': round(save_ms, 2),
+            'binary_load_ms': round(load_ms, 2),
+            'json_cache_kb': round(json_kb),
+            'json_load_ms': round(json_ms, 2),
+            'index_bytes_per_range': round(loaded.nbytes / len(loaded), 1),
+            'tuple_list_bytes_per_range': round(tuple_bytes / len(ranges), 1),
+            'index_lookups_per_s': round(queries / index_ms * 1000),
+            'tuple_list_lookups_per_s': round(queries / list_ms * 1000),
+            'mismatches': mismatch,
+            'wildcards': len(wildcards),
+            'wildcards_ms': round(wildcards_ms, 1),
+            'pac_ms': round(pac_ms, 1),
+            'pac_kb': round(len(pac) / 1024),
+        }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    print(json.dumps(bench(count, queries), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+端到端压测：本地替身 worker、目标服务与 DoH 全部在本机，N 个并发客户端经代理监听端口
+（SOCKS5 与 HTTP CONNECT）反复建立连接并收发数据，输出连接速率、吞吐、建连耗时分位数与子进程资源占用
+用法: python benchmarks/bench_load.py [-clients 64] [-duration 10] [-size 64] [-mode mixed]
+      python benchmarks/bench_load.py -exe ./ech-workers -server 域名/路径 -token 令牌 -target 主机:端口
+
+默认子进程为 python -m echipa.tunnel（进程内引擎）；-exe 改为运行 ech-workers，与 GUI 的 ProcessThread 相同
+先经替身 DoH 预取 ECH 配置（-echfile）。ech-workers 只能经支持 ECH 的 TLS 连接 worker，替身 worker
+不满足，需要用 -server 指定真实 worker，并用 -target 指定 worker 能访问到的回显服务。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+
+SRC = Path(__file__).parent.parent / 'src'
+sys.path.insert(0, str(SRC))
+
+from echipa.ech import DEFAULT_ECH_DOMAIN, ECHConfigCache
+from echipa.monitor import FIELDS, ResourceMonitor
+from echipa.runner import ProxyChild, build_command, free_port, local_addr, wait_port
+from echipa.standin import Sink, StandInDoH, StandInWorker
+from echipa.tunnel import percentile
+
+CHUNK = 16 * 1024
+CONNECT_TIMEOUT = 10
+SAMPLE_INTERVAL = 0.5
+
+
+class LoadStats:
+    def __init__(self):
+        self.connections = {'socks5': 0, 'http': 0}
+        self.failed = 0
+        self.bytes = 0
+        self.connect_ms = []
+        self.errors = {}
+
+    def fail(self, error):
+        self.failed += 1
+        name = type(error).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+
+async def open_socks5(proxy, host, port):
+    reader, writer = await asyncio.open_connection(*proxy)
+    writer.write(b'\x05\x01\x00')
+    await writer.drain()
+    if (await reader.readexactly(2))[1] != 0:
+        raise ConnectionError('SOCKS5 认证失败')
+    name = host.encode('idna')
+    writer.write(b'\x05\x01\x00\x03' + bytes([len(name)]) + name + struct.pack('!H', port))
+    reply = await reader.readexactly(4)
+    if reply[1] != 0:
+        raise ConnectionError(f'SOCKS5 连接失败: {reply[1]}')
+    if reply[3] == 3:
+        n = (await reader.readexactly(1))[0]
+    else:
+        n = 16 if reply[3] == 4 else 4
+    await reader.readexactly(n + 2)  # 绑定地址与端口
+    return reader, writer
+
+
+async def open_http(proxy, host, port):
+    reader, writer = await asyncio.open_connection(*proxy)
+    writer.write(f'CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n'.encode('latin-1'))
+    head = await reader.readuntil(b'\r\n\r\n')
+    if b' 200' not in head.split(b'\r\n', 1)[0]:
+        raise ConnectionError(head.split(b'\r\n', 1)[0].decode('latin-1'))
+    return reader, writer
+
+
+async def client(proxy, target, mode, size, deadline, stats, block):
+    """在 deadline 之前反复：建立连接 → 发送 size 字节 → 收回全部回显 → 关闭"""
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        writer = None
+        try:
+            opener = open_socks5 if mode == 'socks5' else open_http
+            reader, writer = await asyncio.wait_for(opener(proxy, *target), CONNECT_TIMEOUT)
+            stats.connect_ms.append((time.perf_counter() - start) * 1000)
+            sent = received = 0
+            while received < size:
+                if sent < size:
+                    n = min(CHUNK, size - sent)
+                    writer.write(block[:n])
+                    sent += n
+                    await writer.drain()
+                data = await asyncio.wait_for(reader.read(CHUNK), CONNECT_TIMEOUT)
+                if not data:
+                    raise ConnectionError('连接提前关闭')
+                received += len(data)
+            stats.connections[mode] += 1
+            stats.bytes += sent + received
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError) as e:
+            stats.fail(e)
+            await asyncio.sleep(0.01)  # 代理不可用时避免空转
+        finally:
+            if writer:
+                writer.close()
+
+
+def resource_report(monitor):
+    report = {'sample_us': round(monitor.sample_us, 1)}
+    for name in FIELDS:
+        values = monitor.series[name].values()
+        report[name] = {'last': values[-1], 'max': max(values)} if values else None
+    report['fd_limit'] = monitor.fd_limit
+    return report
+
+
+async def bench(args):
+    loop = asyncio.get_running_loop()
+    sink = await Sink().start()
+    resolver = await StandInDoH().start()
+    worker = await StandInWorker(token=args.token or None).start()
+    worker_host, worker_port = worker.address
+    target = args.target.rsplit(':', 1) if args.target else sink.address
+    target = (target[0], int(target[1]))
+
+    listen = f'127.0.0.1:{free_port()}'
+    server = {'listen': listen, 'token': args.token, 'ip': args.ip}
+    child_log = deque(maxlen=20)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        if args.exe:
+            server['server'] = args.server or f'{worker_host}:{worker_port}/'
+            server['dns'] = resolver.url
+            # 与 ProcessThread 相同：先预取 ECH 配置；DoH 在本事件循环中，查询放到线程里
+            cache = ECHConfigCache(Path(cache_dir))
+            ech_file = await loop.run_in_executor(None, cache.ensure, DEFAULT_ECH_DOMAIN, resolver.url)
+            cmd = build_command(args.exe, server, ech_file=ech_file)
+        else:
+            server['server'] = args.server or f'ws://{worker_host}:{worker_port}/'
+            os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, (str(SRC), os.environ.get('PYTHONPATH'))))
+            cmd = [sys.executable, '-m', 'echipa.tunnel'] + build_command('', server)[1:]
+
+        child = ProxyChild(cmd, child_log.append).start()
+        started = time.perf_counter()
+        ready = await loop.run_in_executor(None, wait_port, local_addr(listen), 15, lambda: child.alive)
+        ready_ms = (time.perf_counter() - started) * 1000
+        monitor = ResourceMonitor(lambda: child.pid, log=child_log.append, interval=SAMPLE_INTERVAL,
+                                  capacity=int(args.duration / SAMPLE_INTERVAL) + 10).start()
+
+        stats = LoadStats()
+        proxy = local_addr(listen)
+        if ready:
+            block = os.urandom(CHUNK)
+            modes = ['socks5', 'http'] if args.mode == 'mixed' else [args.mode]
+            deadline = time.monotonic() + args.duration
+            start = time.perf_counter()
+            await asyncio.gather(*(client(proxy, target, modes[i % len(modes)],
+                                          args.size * 1024, deadline, stats, block)
+                                   for i in range(args.clients)))
+            elapsed = time.perf_counter() - start
+        else:
+            elapsed = 0.0
+        monitor.stop()
+        child.stop()
+    await worker.stop()
+    await resolver.stop()
+    await sink.stop()
+
+    completed = sum(stats.connections.values())
+    report = {
+        'child': 'ech-workers' if args.exe else 'echipa.tunnel',
+        'clients': args.clients,
+        'mode': args.mode,
+        'kb_per_connection': args.size,
+        'ready': ready,
+        'ready_ms': round(ready_ms, 1),
+        'duration_s': round(elapsed, 2),
+        'connections': stats.connections,
+        'connections_failed': stats.failed,
+        'errors': stats.errors,
+        'connections_per_s': round(completed / elapsed, 1) if elapsed else 0.0,
+        'mb_per_s': round(stats.bytes / elapsed / 1e6, 2) if elapsed else 0.0,
+        'connect_ms': {name: round(percentile(stats.connect_ms, q), 2) if stats.connect_ms else None
+                       for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))},
+        'resources': resource_report(monitor),
+        'standin': {'worker_sessions': worker.sessions, 'worker_errors': worker.errors,
+                    'sink_connections': sink.connections, 'doh_queries': resolver.queries},
+    }
+    if stats.failed or not ready:
+        report['child_log'] = [line.rstrip() for line in child_log]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='经代理监听端口的端到端压测')
+    parser.add_argument('-clients', type=int, default=64, help='并发客户端数')
+    parser.add_argument('-duration', type=float, default=10, help='持续秒数')
+    parser.add_argument('-size', type=int, default=64, help='每个连接收发的 KB 数')
+    parser.add_argument('-mode', choices=('socks5', 'http', 'mixed'), default='mixed')
+    parser.add_argument('-exe', default=None, help='ech-workers 可执行文件（默认使用进程内引擎）')
+    parser.add_argument('-server', default=None, help='worker 地址（默认使用本地替身 worker）')
+    parser.add_argument('-token', default='')
+    parser.add_argument('-ip', default='')
+    parser.add_argument('-target', default=None, help='回显服务 主机:端口（默认使用本地目标服务）')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(bench(args)), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+分流规则基准：编译耗时、修改一个规则文件后的增量编译耗时、判定速率（与逐条顺序匹配对比并校验结果一致）
+以及 PAC 与系统代理绕过列表的生成耗时
+用法: python benchmarks/bench_rules.py [域名规则数] [IP 规则数] [查询次数]
+"""
+
+import ipaddress
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from echipa.routing import PRIVATE_RANGES, macos_bypass_list, windows_bypass_list
+from echipa.rules import NO_MATCH, RuleSet, ipv4_number
+
+TLDS = ('com', 'net', 'org', 'cn', 'io', 'jp')
+
+
+def random_domain(rng):
+    return '.'.join(''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(3, 9)))
+                    for _ in range(rng.randint(1, 2))) + '.' + rng.choice(TLDS)
+
+
+def make_rules(rng, domains, ips):
+    policies = ('DIRECT', 'PROXY', 'REJECT', 'Auto')
+    lines = []
+    for _ in range(domains):
+        kind = rng.choices(('DOMAIN-SUFFIX', 'DOMAIN', 'DOMAIN-KEYWORD'), (8, 2, 1))[0]
+        value = random_domain(rng) if kind != 'DOMAIN-KEYWORD' else random_domain(rng).split('.')[0][:5]
+        lines.append(f'{kind},{value},{rng.choice(policies)}')
+    for _ in range(ips):
+        prefix = rng.randint(8, 24)
+        network = ipaddress.IPv4Network((rng.getrandbits(32) >> (32 - prefix) << (32 - prefix), prefix))
+        lines.append(f"IP-CIDR,{network},{rng.choice(policies)}{',no-resolve' if rng.random() < 0.3 else ''}")
+    rng.shuffle(lines)
+    return lines
+
+
+def naive(rules, ranges, host, resolver):
+    """逐条顺序匹配（参照实现）；ranges[i] 为第 i 条 IP 规则的 [(起, 止)]"""
+    number = ipv4_number(host)
+    resolved = None
+    for index, rule in enumerate(rules):
+        if rule.kind == 'MATCH':
+            return index
+        if number is None and rule.kind == 'DOMAIN' and host == rule.value:
+            return index
+        if number is None and rule.kind == 'DOMAIN-SUFFIX' and (host == rule.value or host.endswith('.' + rule.value)):
+            return index
+        if number is None and rule.kind == 'DOMAIN-KEYWORD' and rule.value in host:
+            return index
+        if rule.kind in ('IP-CIDR', 'GEOIP'):
+            address = number
+            if address is None and rule.resolve:
+                if resolved is None:
+                    resolved = ipv4_number(resolver(host))
+                address = resolved
+            if address is not None and any(start <= address <= end for start, end in ranges[index]):
+                return index
+    return NO_MATCH
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+
+def bench(domain_rules, ip_rules, queries):
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        lines = make_rules(rng, domain_rules, ip_rules)
+        files = [tmp / 'custom.txt', tmp / 'main.txt', tmp / 'final.txt']
+        files[0].write_text('\n'.join(lines[:50]) + '\n', encoding='utf-8')
+        files[1].write_text('\n'.join(lines[50:]) + '\n', encoding='utf-8')
+        files[2].write_text('GEOIP,LAN,DIRECT\nMATCH,PROXY\n', encoding='utf-8')
+
+        rule_set = RuleSet(files)
+        compile_ms, _ = timed(rule_set.refresh)
+        files[0].write_text('\n'.join(lines[:49] + ['DOMAIN-SUFFIX,example.org,DIRECT']) + '\n', encoding='utf-8')
+        os.utime(files[0], ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        incremental_ms, _ = timed(rule_set.refresh)
+
+        # 解析结果固定，避免依赖网络
+        fake_dns = {}
+
+        def resolver(host):
+            if host not in fake_dns:
+                fake_dns[host] = str(ipaddress.IPv4Address(rng.getrandbits(32)))
+            return fake_dns[host]
+        values = [r.value for r in rule_set.rules if r.kind.startswith('DOMAIN')]
+        hosts = []
+        for _ in range(queries):
+            pick = rng.random()
+            if pick < 0.4 and values:
+                hosts.append(f"{random_domain(rng).split('.')[0]}.{rng.choice(values)}")
+            elif pick < 0.8:
+                hosts.append(random_domain(rng))
+            else:
+                hosts.append(str(ipaddress.IPv4Address(rng.getrandbits(32))))
+        for host in hosts:
+            resolver(host)
+        ranges = {}
+        for index, rule in enumerate(rule_set.rules):
+            if rule.kind == 'IP-CIDR':
+                network = ipaddress.IPv4Network(rule.value, strict=False)
+                ranges[index] = [(int(network.network_address), int(network.broadcast_address))]
+            elif rule.kind == 'GEOIP':
+                ranges[index] = PRIVATE_RANGES
+
+        engine_ms, engine = timed(lambda: [rule_set.match_index(h, resolver) for h in hosts])
+        sample = hosts[:max(1, queries // 20)]
+        naive_ms, expected = timed(lambda: [naive(rule_set.rules, ranges, h, resolver) for h in sample])
+        mismatch = [h for h, got, want in zip(sample, engine, expected) if got != want]
+
+        pac_ms, pac = timed(lambda: rule_set.pac_script('127.0.0.1:30000'))
+        windows_ms, windows = timed(lambda: windows_bypass_list('rules', rules=rule_set))
+        macos_ms, macos = timed(lambda: macos_bypass_list('rules', rules=rule_set))
+        return {
+            'rules': len(rule_set.rules),
+            'errors': len(rule_set.errors),
+            'ip_segments': len(rule_set._ip),
+            'compile_ms': round(compile_ms, 1),
+            'incremental_compile_ms': round(incremental_ms, 1),
+            'lookups_per_s': round(queries / engine_ms * 1000),
+            'naive_lookups_per_s': round(len(sample) / naive_ms * 1000),
+            'mismatches': len(mismatch),
+            'pac_ms': round(pac_ms, 1),
+            'pac_kb': round(len(pac) / 1024),
+            'windows_override_ms': round(windows_ms, 1),
+            'windows_override_chars': len(windows),
+            'macos_bypass_ms': round(macos_ms, 1),
+            'macos_bypass_entries': len(macos),
+        }
+
+
+def main():
+    domain_rules = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    ip_rules = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    queries = int(sys.argv[3]) if len(sys.argv) > 3 else 50000
+    print(json.dumps(bench(domain_rules, ip_rules, queries), indent=2))
+
+
+if __name__ == '__main__':
+    main()
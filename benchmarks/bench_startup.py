@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+gui.py 启动基准：重复冷启动，统计各阶段（含首帧绘制）耗时的中位数
+用法: python benchmarks/bench_startup.py [次数]
+需要 PyQt5；无显示环境时使用 QT_QPA_PLATFORM=offscreen
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+
+def run_once(home):
+    env = dict(os.environ, HOME=home, APPDATA=home)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(ROOT / 'gui.py'), '-profile-startup', '-exit-after-paint'],
+                   env=env, check=True, capture_output=True, timeout=60)
+    wall = (time.perf_counter() - start) * 1000
+    if sys.platform == 'win32':
+        config_dir = Path(home) / 'ECHWorkersClient'
+    elif sys.platform == 'darwin':
+        config_dir = Path(home) / 'Library' / 'Application Support' / 'ECHWorkersClient'
+    else:
+        config_dir = Path(home) / '.config' / 'ECHWorkersClient'
+    with open(config_dir / 'startup_profile.json', 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    report['phases']['process_wall'] = wall
+    return report
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    try:
+        import PyQt5  # noqa: F401
+    except ImportError:
+        print('需要安装 PyQt5', file=sys.stderr)
+        sys.exit(2)
+
+    phases = {}
+    slowest = {}
+    with tempfile.TemporaryDirectory() as home:
+        for _ in range(runs):
+            report = run_once(home)
+            for name, ms in report['phases'].items():
+                phases.setdefault(name, []).append(ms)
+            for item in report.get('imports', []):
+                if item['depth'] == 0:
+                    slowest.setdefault(item['module'], []).append(item['cumulative_us'])
+
+    result = {
+        'runs': runs,
+        'median_ms': {name: round(statistics.median(v), 1) for name, v in phases.items()},
+        'top_imports_us': dict(sorted(
+            ((name, round(statistics.median(v))) for name, v in slowest.items()),
+            key=lambda item: item[1], reverse=True)[:10]),
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
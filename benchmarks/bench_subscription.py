@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+订阅同步基准：本地 HTTP 服务提供大订阅，统计首次导入、304 未变化、无缓存校验头未变化、少量条目变化时的同步耗时
+用法: python benchmarks/bench_subscription.py [条目数量]
+"""
+
+import hashlib
+import json
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from echipa.config import BaseConfigManager
+from echipa.subscription import SubscriptionManager
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = self.server.bodies[self.path]
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.server.validators and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.server.validators:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_feed(count, prefix, changed=0):
+    entries = []
+    for i in range(count):
+        entries.append({
+            'name': f'{prefix}-{i:05d}',
+            'server': f'{prefix}{i}.example.workers.dev:443',
+            'ip': 'saas.sin.fan',
+            'token': f'token-{i}' if i >= changed else f'token-{i}-rotated',
+            'tags': [prefix],
+        })
+    return entries
+
+
+def encode(entries, lines):
+    if lines:
+        return '\n'.join(json.dumps(e) for e in entries).encode('utf-8')
+    return json.dumps(entries).encode('utf-8')
+
+
+def timed_sync(manager):
+    start = time.perf_counter()
+    results = manager.sync_all()
+    return round((time.perf_counter() - start) * 1000, 2), results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+    server.daemon_threads = True
+    server.validators = True
+    server.bodies = {
+        '/a.json': encode(make_feed(count, 'a'), lines=False),
+        '/b.jsonl': encode(make_feed(count, 'b'), lines=True),
+    }
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+
+    report = {'entries_per_feed': count, 'feeds': 2}
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = BaseConfigManager(Path(tmp))
+        manager.load_config()
+        subs = SubscriptionManager(manager)
+        subs.add(base + '/a.json', 'a')
+        subs.add(base + '/b.jsonl', 'b')
+
+        report['initial_ms'], results = timed_sync(subs)
+        report['initial_added'] = sum(r['added'] for r in results)
+        report['unchanged_304_ms'], _ = timed_sync(subs)
+
+        server.validators = False
+        report['unchanged_no_validators_ms'], _ = timed_sync(subs)
+
+        # 旋转少量令牌：去重键变化，相当于删除旧条目并新增
+        server.bodies['/a.json'] = encode(make_feed(count, 'a', changed=10), lines=False)
+        report['rotated_10_ms'], results = timed_sync(subs)
+        report['rotated_10_result'] = {k: results[0][k] for k in ('added', 'updated', 'removed')}
+        manager.flush()
+        report['servers_total'] = manager.server_count()
+    server.shutdown()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+进程内隧道引擎基准：经本地替身 worker 测量 SOCKS5 建连延迟、单连接吞吐与并发吞吐
+用法: python benchmarks/bench_tunnel.py [建连次数] [并发数] [每连接 MB]
+
+ech-workers 只能经支持 ECH 的 TLS 连接 worker，无法连接本地替身，不在此对比。
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import struct
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from echipa.standin import StandInWorker
+from echipa.tunnel import TunnelEngine
+
+CHUNK = 64 * 1024
+
+
+async def echo(reader, writer):
+    try:
+        while True:
+            data = await reader.read(CHUNK)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):  # 退出时仍未关闭的连接会被取消
+        pass
+    writer.close()
+
+
+async def socks5(proxy, port):
+    reader, writer = await asyncio.open_connection(*proxy)
+    writer.write(b'\x05\x01\x00\x05\x01\x00\x01\x7f\x00\x00\x01' + struct.pack('!H', port))
+    reply = await reader.readexactly(12)
+    if reply[3] != 0:
+        raise ConnectionError('SOCKS5 连接失败')
+    return reader, writer
+
+
+async def transfer(proxy, port, size):
+    """经代理向回显服务发送 size 字节并全部收回"""
+    reader, writer = await socks5(proxy, port)
+    block = os.urandom(CHUNK)
+
+    async def send():
+        for _ in range(size // CHUNK):
+            writer.write(block)
+            await writer.drain()
+    sender = asyncio.ensure_future(send())
+    received = 0
+    while received < size // CHUNK * CHUNK:
+        data = await reader.read(CHUNK * 4)
+        if not data:
+            break
+        received += len(data)
+    await sender
+    writer.close()
+    return received
+
+
+async def bench(connects, concurrency, megabytes):
+    sink = await asyncio.start_server(echo, '127.0.0.1', 0)
+    port = sink.sockets[0].getsockname()[1]
+    worker = await StandInWorker().start()
+    host, worker_port = worker.address
+    engine = await TunnelEngine(f'ws://{host}:{worker_port}/', '127.0.0.1:0', log=lambda text: None).start()
+    proxy = engine.address
+    report = {'connects': connects, 'concurrency': concurrency, 'mb_per_connection': megabytes}
+
+    latencies = []
+    for _ in range(connects):
+        start = time.perf_counter()
+        reader, writer = await socks5(proxy, port)
+        writer.write(b'x')
+        await reader.readexactly(1)
+        latencies.append((time.perf_counter() - start) * 1000)
+        writer.close()
+    latencies.sort()
+    report['connect_rtt_p50_ms'] = round(statistics.median(latencies), 2)
+    report['connect_rtt_p99_ms'] = round(latencies[int(len(latencies) * 0.99)], 2)
+
+    size = megabytes * 1024 * 1024
+    start = time.perf_counter()
+    received = await transfer(proxy, port, size)
+    report['single_mb_per_s'] = round(received * 2 / (time.perf_counter() - start) / 1e6, 1)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(transfer(proxy, port, size) for _ in range(concurrency)))
+    report['concurrent_mb_per_s'] = round(sum(results) * 2 / (time.perf_counter() - start) / 1e6, 1)
+    report['engine'] = engine.stats()
+
+    await engine.stop()
+    await worker.stop()
+    sink.close()
+    return report
+
+
+def main():
+    connects = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    megabytes = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    print(json.dumps(asyncio.run(bench(connects, concurrency, megabytes)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,7 @@ import (
 	"net"
 	"net/http"
 	"net/url"
+	"os"
 	"reflect"
 	"strings"
 	"sync"
@@ -26,6 +27,9 @@ import (
 
 // ======================== 全局参数 ========================
 
+// appVersion 可在编译时通过 -ldflags "-X main.appVersion=..." 覆盖
+var appVersion = "1.2.0"
+
 var (
 	listenAddr string
 	serverAddr string
@@ -33,9 +37,12 @@ var (
 	token      string
 	dnsServer  string
 	echDomain  string
+	echFile    string
+	showVer    bool
 
-	echListMu sync.RWMutex
-	echList   []byte
+	echListMu    sync.RWMutex
+	echList      []byte
+	echFileMtime time.Time
 )
 
 func init() {
@@ -45,18 +52,32 @@ func init() {
 	flag.StringVar(&token, "token", "", "身份验证令牌")
 	flag.StringVar(&dnsServer, "dns", "dns.alidns.com/dns-query", "ECH 查询 DoH 服务器")
 	flag.StringVar(&echDomain, "ech", "cloudflare-ech.com", "ECH 查询域名")
+	flag.StringVar(&echFile, "echfile", "", "预取的 ECH 配置文件（Base64，由客户端维护）")
+	flag.BoolVar(&showVer, "version", false, "显示版本并退出")
 }
 
 func main() {
 	flag.Parse()
 
+	if showVer {
+		fmt.Println("ech-workers " + appVersion)
+		return
+	}
+
 	if serverAddr == "" {
 		log.Fatal("必须指定服务端地址 -f\n\n示例:\n  ./client -l 127.0.0.1:1080 -f your-worker.workers.dev:443 -token your-token")
 	}
 
-	log.Printf("[启动] 正在获取 ECH 配置...")
-	if err := prepareECH(); err != nil {
-		log.Fatalf("[启动] 获取 ECH 配置失败: %v", err)
+	if echFile != "" {
+		if err := loadECHFile(); err != nil {
+			log.Printf("[启动] 读取 ECH 配置文件失败，改为在线查询: %v", err)
+		}
+	}
+	if _, err := getECHList(); err != nil {
+		log.Printf("[启动] 正在获取 ECH 配置...")
+		if err := prepareECH(); err != nil {
+			log.Fatalf("[启动] 获取 ECH 配置失败: %v", err)
+		}
 	}
 
 	runProxyServer(listenAddr)
@@ -101,8 +122,50 @@ func prepareECH() error {
 	return nil
 }
 
+// loadECHFile 从客户端预取的缓存文件加载 ECH 配置
+func loadECHFile() error {
+	info, err := os.Stat(echFile)
+	if err != nil {
+		return err
+	}
+	data, err := os.ReadFile(echFile)
+	if err != nil {
+		return err
+	}
+	raw, err := base64.StdEncoding.DecodeString(strings.TrimSpace(string(data)))
+	if err != nil {
+		return fmt.Errorf("ECH 解码失败: %w", err)
+	}
+	if len(raw) == 0 {
+		return errors.New("ECH 配置文件为空")
+	}
+	echListMu.Lock()
+	echList = raw
+	echFileMtime = info.ModTime()
+	echListMu.Unlock()
+	log.Printf("[ECH] 已从缓存文件加载配置，长度: %d 字节", len(raw))
+	return nil
+}
+
+// echFileUpdated 判断客户端是否已在后台刷新了缓存文件
+func echFileUpdated() bool {
+	if echFile == "" {
+		return false
+	}
+	info, err := os.Stat(echFile)
+	if err != nil {
+		return false
+	}
+	echListMu.RLock()
+	defer echListMu.RUnlock()
+	return info.ModTime().After(echFileMtime)
+}
+
 func refreshECH() error {
 	log.Printf("[ECH] 刷新配置...")
+	if echFileUpdated() && loadECHFile() == nil {
+		return nil
+	}
 	return prepareECH()
 }
 
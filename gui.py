@@ -6,14 +6,25 @@ ECH Workers 客户端 - 跨平台版本 (Python + PyQt5)
 """
 
 import sys
-import json
 import os
-import subprocess
-import threading
-import urllib.request
-import ipaddress
+import time
+from bisect import bisect_left
+from collections import deque
 from pathlib import Path
 
+# 共享核心模块位于 src/echipa（不依赖 Qt/Toga）
+sys.path.insert(0, str(Path(__file__).parent.absolute() / 'src'))
+
+# 无界面守护进程（服务器/路由器），不导入 PyQt5
+if __name__ == '__main__' and '-daemon' in sys.argv:
+    from echipa.daemon import main as daemon_main
+    sys.exit(daemon_main(sys.argv[1:]))
+
+# 启动耗时分析：-profile-startup 时统计各模块导入耗时，需在导入 PyQt5 之前开启
+# subprocess / threading / urllib / ipaddress / winreg 只在用到时才导入
+from echipa.startup import StartupProfile
+STARTUP = StartupProfile(trace_imports='-profile-startup' in sys.argv)
+
 # Windows 特殊处理
 if sys.platform == 'win32':
     # 隐藏控制台窗口
@@ -42,7 +53,8 @@ try:
                                   QHBoxLayout, QLabel, QLineEdit, QPushButton, 
                                   QComboBox, QTextEdit, QCheckBox, QGroupBox, 
                                   QMessageBox, QInputDialog, QSystemTrayIcon, QMenu, QAction)
-    from PyQt5.QtCore import Qt, QThread, pyqtSignal
+    from PyQt5.QtCore import (Qt, QThread, QTimer, pyqtSignal, QAbstractListModel,
+                              QModelIndex, QSortFilterProxyModel, QObject, QRunnable, QThreadPool)
     from PyQt5.QtGui import QIcon
     HAS_PYQT = True
     
@@ -57,120 +69,43 @@ except ImportError:
     print("安装命令: pip3 install PyQt5")
     sys.exit(1)
 
+from echipa.config import (DNS_CACHE_FIELDS, PROCESS_FIELDS, BaseConfigManager, DNS_CACHE_LISTEN, desktop_config_dir,
+                           dns_cache_listen)
+
+STARTUP.mark('imports')
+
 APP_VERSION = "1.2"
 APP_TITLE = f"ECH WK 客户端 v{APP_VERSION}"
 
-# 中国IP列表URL
-CHINA_IP_LIST_URL = "https://raw.githubusercontent.com/mayaxcn/china-ip-list/master/chn_ip.txt"
-
-# 复用原有的 ConfigManager, ProcessManager, AutoStartManager
-# 从原文件导入这些类（简化版本）
-class ConfigManager:
-    """配置管理器"""
+class ConfigManager(BaseConfigManager):
+    """配置管理器（存储与索引见 echipa.config）"""
     
     def __init__(self):
-        # 跨平台配置文件路径
-        if sys.platform == 'win32':
-            # Windows: %APPDATA%\ECHWorkersClient
-            self.config_dir = Path(os.getenv('APPDATA', Path.home())) / "ECHWorkersClient"
-        else:
-            # macOS/Linux: ~/Library/Application Support/ECHWorkersClient 或 ~/.config/ECHWorkersClient
-            if sys.platform == 'darwin':
-                self.config_dir = Path.home() / "Library" / "Application Support" / "ECHWorkersClient"
-            else:
-                self.config_dir = Path.home() / ".config" / "ECHWorkersClient"
-        
-        self.config_file = self.config_dir / "config.json"
-        self.config_dir.mkdir(parents=True, exist_ok=True)
-        self.servers = []
-        self.current_server_id = None
-        
-    def load_config(self):
-        """加载配置"""
-        if self.config_file.exists():
-            try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.servers = data.get('servers', [])
-                    self.current_server_id = data.get('current_server_id')
-            except Exception as e:
-                print(f"加载配置失败: {e}")
-                self.servers = []
-                self.current_server_id = None
-        
-        if not self.servers:
-            self.add_default_server()
-    
-    def save_config(self):
-        """保存配置"""
-        try:
-            data = {
-                'servers': self.servers,
-                'current_server_id': self.current_server_id
-            }
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"保存配置失败: {e}")
-    
-    def add_default_server(self):
-        """添加默认服务器"""
-        import uuid
-        default_server = {
-            'id': str(uuid.uuid4()),
-            'name': '默认服务器',
-            'server': 'example.com:443',
-            'listen': '127.0.0.1:30000',
-            'token': '',
-            'ip': 'saas.sin.fan',
-            'dns': 'dns.alidns.com/dns-query',
-            'ech': 'cloudflare-ech.com',
-            'routing_mode': 'bypass_cn'  # 默认跳过中国大陆
-        }
-        self.servers.append(default_server)
-        self.current_server_id = default_server['id']
-        self.save_config()
-    
-    def get_current_server(self):
-        """获取当前服务器配置"""
-        if self.current_server_id:
-            for server in self.servers:
-                if server['id'] == self.current_server_id:
-                    return server
-        return self.servers[0] if self.servers else None
-    
-    def update_server(self, server_data):
-        """更新服务器配置"""
-        for i, server in enumerate(self.servers):
-            if server['id'] == server_data['id']:
-                self.servers[i] = server_data
-                break
-    
-    def add_server(self, server_data):
-        """添加服务器"""
-        import uuid
-        if 'id' not in server_data:
-            server_data['id'] = str(uuid.uuid4())
-        self.servers.append(server_data)
-        self.current_server_id = server_data['id']
-    
-    def delete_server(self, server_id):
-        """删除服务器"""
-        self.servers = [s for s in self.servers if s['id'] != server_id]
-        if self.current_server_id == server_id:
-            self.current_server_id = self.servers[0]['id'] if self.servers else None
+        super().__init__(desktop_config_dir())
 
 
 class ProcessThread(QThread):
-    """进程线程"""
+    """进程线程（子进程的启动、重启与停止见 echipa.runner.ProxySupervisor）"""
     log_output = pyqtSignal(str)
     process_finished = pyqtSignal()
+    resource_sampled = pyqtSignal(str)  # 资源监控摘要（见 echipa.monitor）
     
-    def __init__(self, config):
+    def __init__(self, config, ech_cache=None, resolver=None):
         super().__init__()
         self.config = config
-        self.process = None
+        self.ech_cache = ech_cache
+        self.resolver = resolver
+        self.supervisor = None
+        self.monitor = None
         self.is_running = False
+        self.stopping = False  # stop() 可能早于子进程启动（在任务线程中调用）
+    
+    def _ech_file(self, config):
+        """预取 ECH 配置，子进程启动时无需再等待 DoH 查询；旧版本 ech-workers 不支持时由其自行查询"""
+        if not self.ech_cache or not (self.resolver and self.resolver.supports_ech_file):
+            return None
+        return self.ech_cache.ensure(config.get('ech') or 'cloudflare-ech.com',
+                                     config.get('dns') or 'dns.alidns.com/dns-query')
     
     def run(self):
         """运行进程"""
@@ -187,168 +122,396 @@ class ProcessThread(QThread):
             self.process_finished.emit()
             return
         
-        cmd = [exe_path]
-        if self.config.get('server'):
-            cmd.extend(['-f', self.config['server']])
-        if self.config.get('listen'):
-            cmd.extend(['-l', self.config['listen']])
-        if self.config.get('token'):
-            cmd.extend(['-token', self.config['token']])
-        if self.config.get('ip'):
-            cmd.extend(['-ip', self.config['ip']])
-        if self.config.get('dns') and self.config['dns'] != 'dns.alidns.com/dns-query':
-            cmd.extend(['-dns', self.config['dns']])
-        if self.config.get('ech') and self.config['ech'] != 'cloudflare-ech.com':
-            cmd.extend(['-ech', self.config['ech']])
-        
+        from echipa.runner import DRAIN_SECONDS, ProxySupervisor
+        self.supervisor = ProxySupervisor(
+            exe_path, self.log_output.emit,
+            graceful=self.config.get('graceful_restart', False),
+            drain=self.config.get('drain_seconds', DRAIN_SECONDS)
+        )
         try:
-            # Windows 上需要指定 UTF-8 编码，因为 Go 程序输出 UTF-8
-            # 同时隐藏子进程的控制台窗口
-            popen_kwargs = {
-                'stdout': subprocess.PIPE,
-                'stderr': subprocess.STDOUT,
-                'bufsize': 1
-            }
-            
-            # Windows: 使用 CREATE_NO_WINDOW 隐藏控制台
-            if sys.platform == 'win32':
-                CREATE_NO_WINDOW = 0x08000000
-                popen_kwargs['creationflags'] = CREATE_NO_WINDOW
-            
-            self.process = subprocess.Popen(cmd, **popen_kwargs)
-            self.is_running = True
-            
-            # 使用 UTF-8 解码，忽略无法解码的字符
-            while self.is_running:
-                line = self.process.stdout.readline()
-                if not line:
-                    break
-                try:
-                    # 尝试 UTF-8 解码
-                    decoded_line = line.decode('utf-8', errors='replace')
-                except:
-                    # 如果失败，尝试系统默认编码
-                    try:
-                        decoded_line = line.decode(errors='replace')
-                    except:
-                        decoded_line = str(line)
-                if decoded_line:
-                    self.log_output.emit(decoded_line)
-            
-            self.process.wait()
-            self.is_running = False
-            self.process_finished.emit()
+            self.supervisor.start(self.config, self._ech_file(self.config))
         except Exception as e:
             self.log_output.emit(f"错误: 启动失败 - {str(e)}\n")
             self.process_finished.emit()
+            return
+        self.is_running = True
+        if self.stopping:
+            self.supervisor.stop()
+        from echipa.monitor import ResourceMonitor
+        self.monitor = ResourceMonitor(
+            lambda: self.supervisor.pid, log=self.log_output.emit,
+            on_sample=lambda: self.resource_sampled.emit(self.monitor.summary())
+        ).start()
+        self.supervisor.wait()
+        self.monitor.stop()
+        self.is_running = False
+        self.process_finished.emit()
+    
+    def restart(self, config):
+        """按新配置重启（在后台线程中进行，不阻塞界面）"""
+        if not (self.supervisor and self.is_running):
+            return
+        self.config = config
+        
+        def do_restart():
+            try:
+                self.supervisor.restart(config, self._ech_file(config))
+            except Exception as e:
+                self.log_output.emit(f"错误: 重启失败 - {str(e)}\n")
+        
+        import threading
+        threading.Thread(target=do_restart, daemon=True).start()
     
     def stop(self):
         """停止进程"""
+        self.stopping = True
         self.is_running = False
-        if self.process:
-            try:
-                self.process.terminate()
-                self.process.wait(timeout=3)
-            except:
-                self.process.kill()
+        if self.supervisor:
+            self.supervisor.stop()
     
     def _find_executable(self):
-        """查找可执行文件（跨平台）"""
-        # 脚本所在目录
-        script_dir = Path(__file__).parent.absolute()
-        # 当前工作目录
-        current_dir = Path.cwd()
-        
-        # Windows 和 Unix 的可执行文件扩展名
-        exe_ext = '.exe' if sys.platform == 'win32' else ''
-        
-        # 可能的可执行文件路径（按优先级）
-        possible_paths = [
-            script_dir / f'ech-workers{exe_ext}',
-            current_dir / f'ech-workers{exe_ext}',
-            # Windows 特定路径
-            script_dir / 'ech-workers.exe' if sys.platform == 'win32' else None,
-            current_dir / 'ech-workers.exe' if sys.platform == 'win32' else None,
-            # Unix 路径（无扩展名）
-            script_dir / 'ech-workers' if sys.platform != 'win32' else None,
-            current_dir / 'ech-workers' if sys.platform != 'win32' else None,
-        ]
-        
-        # 过滤掉 None 值
-        possible_paths = [p for p in possible_paths if p is not None]
-        
-        for path in possible_paths:
-            if path.exists():
-                # Windows: 检查文件是否存在即可（.exe 文件）
-                # Unix: 检查文件权限
-                if sys.platform == 'win32':
-                    # Windows 上，.exe 文件可以直接运行
-                    if path.suffix.lower() == '.exe':
-                        return str(path)
-                    # 或者检查文件是否可执行
-                    try:
-                        with open(path, 'rb') as f:
-                            header = f.read(2)
-                            # PE 文件头
-                            if header == b'MZ':
-                                return str(path)
-                    except:
-                        pass
-                else:
-                    # Unix/Linux/macOS: 检查执行权限
-                    if os.access(path, os.X_OK):
-                        return str(path)
-                    # 或者检查是否是二进制文件
-                    try:
-                        with open(path, 'rb') as f:
-                            header = f.read(4)
-                            # ELF 或 Mach-O
-                            if (header.startswith(b'\x7fELF') or 
-                                header.startswith(b'\xfe\xed\xfa') or
-                                header.startswith(b'#!')):
-                                # 尝试添加执行权限
-                                try:
-                                    os.chmod(path, 0o755)
-                                except:
-                                    pass
-                                return str(path)
-                    except:
-                        pass
-        
-        # 尝试从 PATH 中查找
-        import shutil
-        exe = shutil.which('ech-workers')
+        """查找可执行文件（跨平台），结果经 stat 指纹校验后缓存"""
+        if self.resolver is None:
+            from echipa.locator import BinaryResolver, default_candidates
+            self.resolver = BinaryResolver(
+                desktop_config_dir(),
+                default_candidates(Path(__file__).parent.absolute(), Path.cwd())
+            )
+        exe = self.resolver.resolve()
         if exe:
-            return exe
-        
-        # 如果都找不到，返回 None
+            source = '缓存' if self.resolver.last_source == 'cache' else '探测'
+            self.log_output.emit(f"[系统] 可执行文件: {exe} ({self.resolver.version or '未知版本'}，"
+                                 f"{source} {self.resolver.last_lookup_ms:.1f}ms)\n")
+        return exe
+
+
+class ServerListModel(QAbstractListModel):
+    """按名称排序的服务器列表，分页加载，增删改以增量方式通知视图
+    
+    首次只读取一页，视图滚动到末尾时通过 canFetchMore/fetchMore 读取下一页；
+    增删改只影响已加载的部分，排在已加载范围之后的服务器随后续分页读取。
+    """
+    PAGE_SIZE = 200
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []  # [(name.lower(), name, id)]，与 page_servers 的排序一致
+        self._keys = {}  # id -> 排序键，行号通过二分查找得到
+        self._fetch_page = None  # fetch_page(offset, limit) -> 按名称排序的服务器
+        self._complete = True  # 已读取到最后一页
+    
+    @staticmethod
+    def _key(server):
+        return (server['name'].lower(), server['name'], server['id'])
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        _, name, server_id = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return name
+        if role == Qt.UserRole:
+            return server_id
         return None
+    
+    def row_of(self, server_id):
+        """服务器所在行，不存在时返回 -1"""
+        key = self._keys.get(server_id)
+        return -1 if key is None else bisect_left(self._rows, key)
+    
+    def reset(self, fetch_page):
+        """整体替换（首次加载、订阅同步等批量变化时使用），只读取第一页"""
+        self.beginResetModel()
+        self._fetch_page = fetch_page
+        self._rows, self._keys, self._complete = [], {}, False
+        self._rows = self._next_page()
+        self._keys = {key[2]: key for key in self._rows}
+        self.endResetModel()
+    
+    def _next_page(self):
+        """读取已加载部分之后的一页，返回其中尚未加载的排序键"""
+        servers = self._fetch_page(len(self._rows), self.PAGE_SIZE)
+        self._complete = len(servers) < self.PAGE_SIZE
+        return [key for key in map(self._key, servers) if key[2] not in self._keys]
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._complete
+    
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        keys = self._next_page()
+        if keys:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(keys) - 1)
+            self._rows.extend(keys)
+            self._keys.update((key[2], key) for key in keys)
+            self.endInsertRows()
+    
+    def ensure_loaded(self, server_id):
+        """继续分页读取直到该服务器已加载（选中排在后面的服务器时使用）"""
+        while server_id not in self._keys and not self._complete:
+            self.fetchMore()
+    
+    def _loaded(self, key):
+        """排序键是否落在已加载的范围内"""
+        return self._complete or bool(self._rows) and key < self._rows[-1]
+    
+    def insert_server(self, server):
+        key = self._key(server)
+        if not self._loaded(key):
+            return  # 之后分页读取时再加入
+        row = bisect_left(self._rows, key)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._rows.insert(row, key)
+        self._keys[key[2]] = key
+        self.endInsertRows()
+    
+    def remove_server(self, server_id):
+        row = self.row_of(server_id)
+        if row < 0:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._rows[row]
+        del self._keys[server_id]
+        self.endRemoveRows()
+    
+    def rename_server(self, server_id, name):
+        """改名后移动到新位置；用 beginMoveRows 保证视图当前选中项不变"""
+        row = self.row_of(server_id)
+        if row < 0:
+            return
+        key = (name.lower(), name, server_id)
+        if not self._loaded(key):
+            self.remove_server(server_id)  # 移到了已加载范围之后
+            return
+        del self._rows[row]
+        new_row = bisect_left(self._rows, key)
+        self._rows.insert(row, key)  # 先放回原处，通知视图后再移动
+        if new_row != row:
+            dest = new_row + 1 if new_row > row else new_row
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), dest)
+            del self._rows[row]
+            self._rows.insert(new_row, key)
+            self._keys[server_id] = key
+            self.endMoveRows()
+        else:
+            self._rows[row] = key
+            self._keys[server_id] = key
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+
+class SubscriptionThread(QThread):
+    """后台同步订阅"""
+    sync_finished = pyqtSignal(list)
+    
+    def __init__(self, manager):
+        super().__init__()
+        self.manager = manager
+    
+    def run(self):
+        self.sync_finished.emit(self.manager.sync_all())
+
+
+class TaskSignals(QObject):
+    """Task 的信号（QRunnable 不是 QObject，不能直接定义信号）"""
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    progress = pyqtSignal(str)
+    finished = pyqtSignal(float)  # 耗时（毫秒），取消或出错时也会发出
+
+
+class Task(QRunnable):
+    """在线程池中运行 fn(*args, **kwargs)，结果经信号回到界面线程"""
+    
+    def __init__(self, name, fn, args, kwargs, serial=None):
+        super().__init__()
+        self.setAutoDelete(False)  # 由 TaskExecutor 持有，完成后释放
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.serial = serial  # 同一 serial 键的任务依次执行（见 TaskExecutor）
+        self.signals = TaskSignals()
+        self.cancelled = False
+        self.elapsed_ms = None
+    
+    def cancel(self):
+        """取消：尚未开始的任务不再运行，已开始的任务不再回调结果"""
+        self.cancelled = True
+    
+    def progress(self, text):
+        if not self.cancelled:
+            self.signals.progress.emit(text)
+    
+    def run(self):
+        start = time.perf_counter()
+        try:
+            if not self.cancelled:
+                result = self.fn(*self.args, **self.kwargs)
+                if not self.cancelled:
+                    self.signals.result.emit(result)
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.error.emit(str(e))
+        finally:
+            self.elapsed_ms = (time.perf_counter() - start) * 1000
+            self.signals.finished.emit(self.elapsed_ms)
+
+
+class TaskExecutor(QObject):
+    """界面上的耗时操作（子进程、注册表、文件、网络）统一交给共享线程池，不阻塞事件循环"""
+    SLOW_TASK_MS = 1000  # 超过该耗时的任务写入日志
+    
+    def __init__(self, log, parent=None, max_threads=4):
+        super().__init__(parent)
+        self.log = log
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.timings = deque(maxlen=200)  # (任务名, 耗时毫秒)
+        self._tasks = set()
+        self._serial = {}  # serial 键 -> 等待中的任务队列；键存在表示该键有任务正在运行
+    
+    def submit(self, name, fn, *args, on_result=None, on_error=None, on_progress=None, serial=None, **kwargs):
+        """提交任务并返回 Task；回调都在界面线程执行
+        
+        on_progress 不为空时以 log=task.progress 传给 fn（与 echipa 模块的 log 参数一致），
+        serial 相同的任务按提交顺序依次执行：前一个完成（finished）后才把下一个交给线程池，
+        等待中的任务不占用线程。
+        """
+        task = Task(name, fn, args, kwargs, serial)
+        if on_progress is not None:
+            kwargs['log'] = task.progress
+            task.signals.progress.connect(on_progress)
+        if on_result is not None:
+            task.signals.result.connect(on_result)
+        task.signals.error.connect(on_error or (lambda e: self.log(f"[任务] {name} 失败: {e}\n")))
+        task.signals.finished.connect(lambda ms: self._on_finished(task, ms))
+        self._tasks.add(task)
+        if serial is None:
+            self.pool.start(task)
+        elif serial in self._serial:
+            self._serial[serial].append(task)
+        else:
+            self._serial[serial] = deque()
+            self.pool.start(task)
+        return task
+    
+    def _on_finished(self, task, elapsed_ms):
+        self._tasks.discard(task)
+        self._start_next(task.serial)
+        self.timings.append((task.name, elapsed_ms))
+        if elapsed_ms >= self.SLOW_TASK_MS and not task.cancelled:
+            self.log(f"[任务] {task.name} 耗时 {elapsed_ms:.0f}ms\n")
+    
+    def cancel(self, name):
+        """取消同名任务；尚在队列中的直接移出线程池"""
+        for task in list(self._tasks):
+            if task.name == name:
+                task.cancel()
+                queue = self._serial.get(task.serial)
+                if queue and task in queue:
+                    queue.remove(task)
+                    self._tasks.discard(task)
+                elif self.pool.tryTake(task):
+                    self._tasks.discard(task)
+                    self._start_next(task.serial)
+    
+    def _start_next(self, serial):
+        """serial 键的当前任务结束：启动队列中的下一个，队列为空时释放该键"""
+        if serial is None or serial not in self._serial:
+            return
+        queue = self._serial[serial]
+        if queue:
+            self.pool.start(queue.popleft())
+        else:
+            del self._serial[serial]
+    
+    def shutdown(self, timeout_ms=5000):
+        """退出前等待已提交的任务（如清理系统代理）完成；仍在排队的串行任务按顺序在当前线程执行"""
+        self.pool.waitForDone(timeout_ms)
+        queues, self._serial = self._serial, {}
+        for queue in queues.values():
+            for task in queue:
+                task.run()
 
 
 class MainWindow(QMainWindow):
     """主窗口"""
+    log_message = pyqtSignal(str)  # 供后台线程安全地写日志
+    config_changed = pyqtSignal(dict)  # config.json 被外部修改（监视线程发出）
+    control_command = pyqtSignal(str, str)  # 控制接口命令（控制线程发出，在界面线程执行）
     
     def __init__(self):
         super().__init__()
+        self.log_message.connect(self.append_log)
+        self.config_changed.connect(self.on_config_changed)
+        self.control_command.connect(self.on_control_command)
         self.config_manager = ConfigManager()
         self.config_manager.load_config()
+        if '-sqlite' in sys.argv:
+            # 迁移到 SQLite 存储并启用（适合大量服务器；之后启动时自动使用）
+            self.config_manager.use_sqlite()
         self.process_thread = None
+        self.ech_cache = None  # ECH 配置预取缓存（首次启动时创建）
+        self.binary_resolver = None  # ech-workers 路径解析缓存
         self.is_autostart = '-autostart' in sys.argv
-        self.china_ip_ranges = None  # 缓存中国IP列表
-        self.tray_icon = None  # 系统托盘图标
+        self.bypass_ranges = {}  # 绕过的国家/地区代码 -> IP 段（echipa.routing.load_bypass_ranges）
+        self.rule_set = None  # 规则分流（echipa.rules，首次使用时创建）
+        self.explainer = None  # 分流判定查询（echipa.explain，首次查询时创建）
+        self.control_explainer = None  # 控制接口 /explain 使用的判定对象（在控制线程的线程池中使用）
+        import threading
+        self._control_explain_lock = threading.Lock()
+        self.tray_icon = None  # 系统托盘图标（首帧后创建）
+        self._first_paint_done = False
+        self.dns_forwarder = None  # 本地 DNS 缓存转发器
+        self.subscription_manager = None  # 服务器订阅（首次使用时创建）
+        self.subscription_thread = None
+        self.doh_selector = None  # DoH 服务器测速（echipa.dohselect，首次使用时创建）
+        self.speed_store = None  # 测速结果（echipa.speedtest，首次测速时创建）
+        self.speed_testing = None  # 正在测速的服务器 id
+        self.control_server = None  # -control 开启的本地控制接口
+        self.process_started_at = None
+        self.log_backlog = deque(maxlen=1000)  # 供控制接口 /logs 读取
+        self.log_seq = 0
+        self.tasks = TaskExecutor(self.append_log, self)  # 耗时操作的共享线程池
         
         self.init_ui()
         self.init_server_combo()  # 初始化下拉框
         self.load_server_config()
-        self.init_tray_icon()  # 初始化系统托盘
-        
-        # 异步加载中国IP列表
-        self.load_china_ip_list_async()
-        
+        # 系统托盘、分流IP段和开机自动启动推迟到首帧之后（见 deferred_init）
+    
+    def paintEvent(self, event):
+        """首次绘制后再进行次要的初始化"""
+        super().paintEvent(event)
+        if not self._first_paint_done:
+            self._first_paint_done = True
+            STARTUP.mark('first_paint')
+            QTimer.singleShot(0, self.deferred_init)
+    
+    def deferred_init(self):
+        """首帧之后的初始化：系统托盘、分流IP段、开机自动启动"""
+        self._first_paint_done = True
+        self.init_tray_icon()
+        # 异步加载当前分流模式的IP段
+        self.load_bypass_ranges_async()
+        self.update_auto_start_checkbox()
+        # 监视其他程序对 config.json 的修改
+        self.config_manager.watch(self.config_changed.emit)
+        if '-control' in sys.argv[:-1]:
+            self.start_control_server(sys.argv[sys.argv.index('-control') + 1])
         if self.is_autostart:
-            self.hide()
-            QApplication.processEvents()
             self.auto_start()
+        STARTUP.mark('deferred_init')
+        
+        if '-profile-startup' in sys.argv:
+            STARTUP.save(self.config_manager.config_dir / 'startup_profile.json')
+        if '-exit-after-paint' in sys.argv:
+            # 仅供启动基准测试使用
+            QTimer.singleShot(0, self.quit_application)
     
     def init_ui(self):
         """初始化界面"""
@@ -363,13 +526,31 @@ class MainWindow(QMainWindow):
         server_group = QGroupBox("服务器管理")
         server_layout = QHBoxLayout()
         server_layout.addWidget(QLabel("选择服务器:"))
+        self.server_model = ServerListModel(self)
+        self.server_proxy = QSortFilterProxyModel(self)
+        self.server_proxy.setSourceModel(self.server_model)
+        self.server_proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
         self.server_combo = QComboBox()
+        self.server_combo.setModel(self.server_proxy)
+        # 服务器很多时避免按全部条目计算宽度和行高
+        self.server_combo.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLengthWithIcon)
+        self.server_combo.setMinimumContentsLength(20)
+        self.server_combo.view().setUniformItemSizes(True)
         self.server_combo.currentIndexChanged.connect(self.on_server_changed)
         server_layout.addWidget(self.server_combo)
+        self.server_filter_edit = QLineEdit()
+        self.server_filter_edit.setPlaceholderText("筛选")
+        self.server_filter_edit.setClearButtonEnabled(True)
+        self.server_filter_edit.setMaximumWidth(120)
+        self.server_filter_edit.textChanged.connect(self.on_server_filter_changed)
+        server_layout.addWidget(self.server_filter_edit)
         server_layout.addWidget(QPushButton("新增", clicked=self.add_server))
         server_layout.addWidget(QPushButton("保存", clicked=self.save_server))
         server_layout.addWidget(QPushButton("重命名", clicked=self.rename_server))
         server_layout.addWidget(QPushButton("删除", clicked=self.delete_server))
+        server_layout.addWidget(QPushButton("添加订阅", clicked=self.add_subscription))
+        self.sync_btn = QPushButton("同步订阅", clicked=self.sync_subscriptions)
+        server_layout.addWidget(self.sync_btn)
         server_group.setLayout(server_layout)
         layout.addWidget(server_group)
         
@@ -393,9 +574,24 @@ class MainWindow(QMainWindow):
         row1.addWidget(self.create_label_edit("优选IP或域名:", self.ip_edit))
         self.dns_edit = QLineEdit()
         row1.addWidget(self.create_label_edit("DOH服务器:", self.dns_edit))
+        self.dns_select_btn = QPushButton("自动选择")
+        self.dns_select_btn.setToolTip("并发测试常用 DoH 服务器查询 ECH 记录的延迟、成功率与一致性，选用最快的一个\n"
+                                       "结果在网络变化前会被缓存")
+        self.dns_select_btn.clicked.connect(self.select_doh_server)
+        row1.addWidget(self.dns_select_btn)
         advanced_layout.addLayout(row1)
         self.ech_edit = QLineEdit()
         advanced_layout.addWidget(self.create_label_edit("ECH域名:", self.ech_edit))
+        row2 = QHBoxLayout()
+        self.dns_cache_check = QCheckBox("本地DNS缓存")
+        row2.addWidget(self.dns_cache_check)
+        self.dns_cache_edit = QLineEdit()
+        self.dns_cache_edit.setPlaceholderText(DNS_CACHE_LISTEN)
+        row2.addWidget(self.create_label_edit("DNS监听地址:", self.dns_cache_edit))
+        self.graceful_check = QCheckBox("平滑重启")
+        self.graceful_check.setToolTip("经本地前置监听转发，修改配置后新进程就绪再切换，旧连接排空后结束")
+        row2.addWidget(self.graceful_check)
+        advanced_layout.addLayout(row2)
         advanced_group.setLayout(advanced_layout)
         layout.addWidget(advanced_group)
         
@@ -406,10 +602,24 @@ class MainWindow(QMainWindow):
         self.routing_combo = QComboBox()
         self.routing_combo.addItem("全局代理", "global")
         self.routing_combo.addItem("跳过中国大陆", "bypass_cn")
+        self.routing_combo.addItem("跳过中国大陆和香港", "bypass_cn_hk")
+        self.routing_combo.addItem("跳过本国/地区", "bypass_countries")
+        self.routing_combo.setItemData(3, "国家/地区取自服务器配置的 bypass_countries（如 CN,HK,MO），"
+                                          "未设置时为系统区域设置所在国家", Qt.ToolTipRole)
+        self.routing_combo.addItem("规则分流", "rules")
+        self.routing_combo.setItemData(4, "按配置目录 rules.txt（或服务器配置的 rule_files）中的 Clash 风格规则分流，"
+                                          "修改规则文件后重新设置系统代理生效", Qt.ToolTipRole)
         self.routing_combo.addItem("不改变代理", "none")
         self.routing_combo.currentIndexChanged.connect(self.on_routing_changed)
         routing_layout.addWidget(self.routing_combo)
         routing_layout.addStretch()
+        self.explain_edit = QLineEdit()
+        self.explain_edit.setPlaceholderText("域名、IP 或网址，多个用空格分隔")
+        self.explain_edit.returnPressed.connect(self.explain_hosts)
+        routing_layout.addWidget(self.explain_edit)
+        explain_btn = QPushButton("查询分流", clicked=self.explain_hosts)
+        explain_btn.setToolTip("按当前分流模式判断这些站点走直连还是代理，以及决定的规则或绕过条目")
+        routing_layout.addWidget(explain_btn)
         routing_group.setLayout(routing_layout)
         layout.addWidget(routing_group)
         
@@ -424,11 +634,16 @@ class MainWindow(QMainWindow):
         self.proxy_btn = QPushButton("设置系统代理")
         self.proxy_btn.clicked.connect(self.toggle_system_proxy)
         self.proxy_btn.setEnabled(False)  # 只有启动后才能设置
+        self.speed_btn = QPushButton("测速")
+        self.speed_btn.setToolTip("经本地代理端口测量当前服务器的下载与上传速度，结果按服务器保存并排序")
+        self.speed_btn.clicked.connect(lambda: self.run_speed_test())
+        self.speed_btn.setEnabled(False)
         self.auto_start_check = QCheckBox("开机启动")
         self.auto_start_check.stateChanged.connect(self.on_auto_start_changed)
         control_layout.addWidget(self.start_btn)
         control_layout.addWidget(self.stop_btn)
         control_layout.addWidget(self.proxy_btn)
+        control_layout.addWidget(self.speed_btn)
         control_layout.addWidget(self.auto_start_check)
         control_layout.addStretch()
         control_layout.addWidget(QPushButton("清空日志", clicked=self.clear_log))
@@ -441,6 +656,10 @@ class MainWindow(QMainWindow):
         # 日志
         log_group = QGroupBox("运行日志")
         log_layout = QVBoxLayout()
+        # 子进程资源占用：当前值与最近一分钟的走势
+        self.resource_label = QLabel()
+        self.resource_label.setToolTip("ech-workers 的 CPU、内存、打开的文件描述符与线程数（每 2 秒采样）")
+        log_layout.addWidget(self.resource_label)
         self.log_text = QTextEdit()
         self.log_text.setReadOnly(True)
         self.log_text.setFont(QApplication.font())
@@ -524,142 +743,86 @@ class MainWindow(QMainWindow):
         if self.tray_icon:
             self.tray_icon.hide()
         
+        if self.control_server:
+            self.control_server.stop()
+        self.config_manager.stop_watching()
+        self.config_manager.flush()
+        self.tasks.cancel('bypass_ranges')  # 不必等下载完成
+        self.tasks.shutdown()
         QApplication.quit()
     
-    def load_china_ip_list_async(self):
-        """异步加载中国IP列表"""
-        def load_in_thread():
-            try:
-                self.append_log("[系统] 正在加载中国IP列表...\n")
-                ranges = self._load_china_ip_list()
-                if ranges:
-                    self.china_ip_ranges = ranges
-                    self.append_log(f"[系统] 已加载中国IP列表，共 {len(ranges)} 个IP段\n")
-                else:
-                    self.append_log("[系统] 加载中国IP列表失败，使用默认列表\n")
-            except Exception as e:
-                self.append_log(f"[系统] 加载中国IP列表出错: {e}\n")
-        
-        thread = threading.Thread(target=load_in_thread, daemon=True)
-        thread.start()
+    def _bypass_countries(self):
+        """当前分流模式要绕过的国家/地区代码（bypass_countries 模式读取服务器配置）"""
+        from echipa.routing import bypass_countries
+        server = self.config_manager.get_current_server() or {}
+        return bypass_countries(self.routing_combo.currentData(), server.get('bypass_countries'))
     
-    def _load_china_ip_list(self):
-        """下载并解析中国IP列表"""
-        try:
-            # 尝试从缓存读取
-            cache_file = self.config_manager.config_dir / "china_ip_list.json"
-            if cache_file.exists():
-                try:
-                    with open(cache_file, 'r', encoding='utf-8') as f:
-                        cached_data = json.load(f)
-                        # 检查缓存是否过期（24小时）
-                        import time
-                        if time.time() - cached_data.get('timestamp', 0) < 86400:
-                            return cached_data.get('ranges', [])
-                except:
-                    pass
-            
-            # 下载IP列表
-            with urllib.request.urlopen(CHINA_IP_LIST_URL, timeout=10) as response:
-                content = response.read().decode('utf-8')
-            
-            # 解析IP范围
-            ranges = []
-            for line in content.strip().split('\n'):
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                
-                parts = line.split()
-                if len(parts) >= 2:
-                    start_ip = parts[0]
-                    end_ip = parts[1]
-                    try:
-                        start = ipaddress.IPv4Address(start_ip)
-                        end = ipaddress.IPv4Address(end_ip)
-                        ranges.append((int(start), int(end)))
-                    except:
-                        continue
-            
-            # 保存到缓存
-            try:
-                import time
-                with open(cache_file, 'w', encoding='utf-8') as f:
-                    json.dump({
-                        'timestamp': time.time(),
-                        'ranges': ranges
-                    }, f)
-            except:
-                pass
-            
-            return ranges
-        except Exception as e:
-            print(f"加载中国IP列表失败: {e}")
-            return None
+    def _get_rule_set(self):
+        """当前服务器 rule_files 对应的规则集（在后台任务中 refresh）"""
+        from echipa.rules import RuleSet, rule_files
+        server = self.config_manager.get_current_server() or {}
+        paths = rule_files(self.config_manager.config_dir, server.get('rule_files'))
+        if self.rule_set is None or self.rule_set.paths != paths:
+            self.rule_set = RuleSet(paths, self.config_manager.config_dir)
+        return self.rule_set
     
-    def _convert_ip_ranges_to_wildcards(self, ranges):
-        """将IP范围转换为Windows ProxyOverride通配符格式"""
-        if not ranges:
-            return []
+    def _get_explainer(self, routing_mode, explainer=None):
+        """分流判定（echipa.explain），使用已加载的 IP 段与规则集；没有加载时按默认列表判定
         
-        wildcards = set()
+        explainer 不为空时按当前设置更新并返回它，否则新建；不加载 IP 段，也不创建规则集。
+        """
+        from echipa.explain import RouteExplainer
+        from echipa.routing import bypass_countries
+        server = self.config_manager.get_current_server() or {}
+        countries = server.get('bypass_countries')
+        ranges = self.bypass_ranges.get(bypass_countries(routing_mode, countries))
+        rules = self.rule_set if routing_mode == 'rules' else None
+        if explainer is None:
+            return RouteExplainer(routing_mode, ranges, countries, rules)
+        explainer.update(routing_mode, ranges, countries, rules)
+        return explainer
+    
+    def explain_hosts(self):
+        """在后台查询输入框中各站点的分流判定，结果输出到日志"""
+        hosts = self.explain_edit.text().replace(',', ' ').split()
+        if not hosts:
+            return
+        routing_mode = self.routing_combo.currentData()
+        rules = self._get_rule_set() if routing_mode == 'rules' else None
+        explainer = self.explainer = self._get_explainer(routing_mode, self.explainer)
         
-        for start, end in ranges:
-            start_ip = ipaddress.IPv4Address(start)
-            end_ip = ipaddress.IPv4Address(end)
-            
-            start_parts = [int(x) for x in str(start_ip).split('.')]
-            end_parts = [int(x) for x in str(end_ip).split('.')]
-            
-            # 如果整个A段相同
-            if start_parts[0] == end_parts[0]:
-                # 检查是否是整个A段 (0.0.0.0 - 255.255.255.255)
-                if start_parts[1] == 0 and end_parts[1] == 255 and \
-                   start_parts[2] == 0 and end_parts[2] == 255 and \
-                   start_parts[3] == 0 and end_parts[3] == 255:
-                    wildcards.add(f"{start_parts[0]}.*")
-                # 检查是否是整个B段 (0.0.0.0 - 0.255.255.255)
-                elif start_parts[2] == 0 and end_parts[2] == 255 and \
-                     start_parts[3] == 0 and end_parts[3] == 255:
-                    wildcards.add(f"{start_parts[0]}.{start_parts[1]}.*")
-                # 检查是否是整个C段 (0.0.0.0 - 0.0.255.255)
-                elif start_parts[3] == 0 and end_parts[3] == 255:
-                    wildcards.add(f"{start_parts[0]}.{start_parts[1]}.{start_parts[2]}.*")
-                else:
-                    # 部分C段，添加所有涉及的IP
-                    # 为了减少数量，只添加C段通配符
-                    for c in range(start_parts[2], end_parts[2] + 1):
-                        wildcards.add(f"{start_parts[0]}.{start_parts[1]}.{c}.*")
-        
-        # 优化：合并可以合并的通配符
-        # 例如：1.0.*, 1.1.*, ..., 1.255.* 可以合并为 1.*
-        optimized = set()
-        a_segments = {}  # {A: set(B segments)}
-        
-        for wc in wildcards:
-            parts = wc.split('.')
-            if len(parts) == 2 and parts[1] == '*':
-                # A.* 格式，直接添加
-                optimized.add(wc)
-            elif len(parts) == 3 and parts[2] == '*':
-                # A.B.* 格式
-                a = parts[0]
-                if a not in a_segments:
-                    a_segments[a] = set()
-                a_segments[a].add(parts[1])
-            else:
-                # 其他格式，直接添加
-                optimized.add(wc)
+        def run(log):
+            if rules is not None:
+                rules.refresh(log)  # 只重新编译修改过的规则文件
+            return explainer.explain_many(hosts)
+        
+        def done(decisions):
+            for decision in decisions:
+                self.append_log(f"[分流] {decision}，{decision.elapsed_us:.0f}µs\n")
         
-        # 检查每个A段是否覆盖了所有B段（0-255），如果是则合并为A.*
-        for a, b_set in a_segments.items():
-            if len(b_set) >= 250:  # 如果覆盖了大部分B段，使用A.*
-                optimized.add(f"{a}.*")
+        self.tasks.submit('explain', run, on_result=done, on_progress=self.append_log,
+                          on_error=lambda e: self.append_log(f"[分流] 查询失败: {e}\n"))
+    
+    def load_bypass_ranges_async(self):
+        """异步加载当前分流模式要绕过的IP段（有 .mmdb 国家数据库时从中生成，否则为中国IP列表）"""
+        from echipa.routing import load_bypass_ranges
+        codes = self._bypass_countries()
+        if not codes or self.bypass_ranges.get(codes):
+            return
+        
+        def on_loaded(ranges):
+            if ranges is not None:
+                self.bypass_ranges[codes] = ranges
+                ipv6 = f"，IPv6 {len(ranges.ipv6)} 个" if ranges.ipv6 else ""
+                self.append_log(f"[系统] 已加载分流IP段（{'+'.join(codes)}），共 {len(ranges)} 个{ipv6}\n")
             else:
-                for b in b_set:
-                    optimized.add(f"{a}.{b}.*")
+                self.append_log("[系统] 加载分流IP段失败，使用默认列表\n")
         
-        return sorted(list(optimized))
+        self.append_log("[系统] 正在加载分流IP段...\n")
+        self.tasks.submit('bypass_ranges', load_bypass_ranges, self.config_manager.config_dir,
+                          self.routing_combo.currentData(), codes,
+                          on_result=on_loaded, on_progress=self.append_log,
+                          on_error=lambda e: self.append_log(f"[系统] 加载分流IP段出错: {e}\n"))
     
     def create_label_edit(self, label_text, edit_widget):
         """创建标签和输入框"""
@@ -671,27 +834,20 @@ class MainWindow(QMainWindow):
     
     def init_server_combo(self):
         """初始化服务器下拉框（首次加载）"""
-        # 暂时断开信号，避免触发 on_server_changed
-        try:
-            self.server_combo.currentIndexChanged.disconnect()
-        except:
-            pass
-        
-        self.server_combo.clear()
-        sorted_servers = sorted(self.config_manager.servers, key=lambda x: x['name'])
-        for server in sorted_servers:
-            self.server_combo.addItem(server['name'], server['id'])
-        
-        # 选中当前服务器
+        self.server_model.reset(self.config_manager.page_servers)
         current = self.config_manager.get_current_server()
         if current:
-            for i in range(self.server_combo.count()):
-                if self.server_combo.itemData(i) == current['id']:
-                    self.server_combo.setCurrentIndex(i)
-                    break
-        
-        # 重新连接信号
-        self.server_combo.currentIndexChanged.connect(self.on_server_changed)
+            self._select_server(current['id'])
+    
+    def _select_server(self, server_id):
+        """在下拉框中选中服务器（不触发 on_server_changed），被筛选掉时返回 False"""
+        self.server_model.ensure_loaded(server_id)
+        row = self.server_model.row_of(server_id)
+        index = self.server_proxy.mapFromSource(self.server_model.index(row)) if row >= 0 else QModelIndex()
+        self.server_combo.blockSignals(True)
+        self.server_combo.setCurrentIndex(index.row() if index.isValid() else -1)
+        self.server_combo.blockSignals(False)
+        return index.isValid()
     
     def load_server_config(self):
         """加载服务器配置"""
@@ -704,6 +860,9 @@ class MainWindow(QMainWindow):
             self.ip_edit.setText(server.get('ip', ''))
             self.dns_edit.setText(server.get('dns', ''))
             self.ech_edit.setText(server.get('ech', ''))
+            self.dns_cache_check.setChecked(server.get('dns_cache', False))
+            self.dns_cache_edit.setText(dns_cache_listen(server))
+            self.graceful_check.setChecked(server.get('graceful_restart', False))
             # 加载分流模式
             routing_mode = server.get('routing_mode', 'bypass_cn')
             for i in range(self.routing_combo.count()):
@@ -712,51 +871,36 @@ class MainWindow(QMainWindow):
                     break
     
     def refresh_server_combo(self):
-        """刷新服务器下拉框"""
-        # 暂时断开信号连接，避免递归
-        try:
-            self.server_combo.currentIndexChanged.disconnect()
-        except:
-            pass
-        
-        self.server_combo.clear()
-        
+        """服务器列表批量变化后整体刷新下拉框"""
         # 确保有服务器
-        if not self.config_manager.servers:
+        if not self.config_manager.server_count():
             # 如果没有服务器，添加默认服务器
             self.config_manager.add_default_server()
         
-        sorted_servers = sorted(self.config_manager.servers, key=lambda x: x['name'])
-        for server in sorted_servers:
-            self.server_combo.addItem(server['name'], server['id'])
+        self.server_model.reset(self.config_manager.page_servers)
         
-        # 确保有当前服务器
+        # 确保有当前服务器，找不到时选中第一个
         current = self.config_manager.get_current_server()
-        if current:
-            # 查找并选中当前服务器
-            found = False
-            for i in range(self.server_combo.count()):
-                if self.server_combo.itemData(i) == current['id']:
-                    self.server_combo.setCurrentIndex(i)
-                    found = True
-                    break
-            
-            # 如果找不到当前服务器，选中第一个
-            if not found and self.server_combo.count() > 0:
-                self.server_combo.setCurrentIndex(0)
-                # 更新当前服务器ID
-                if self.server_combo.itemData(0):
-                    self.config_manager.current_server_id = self.server_combo.itemData(0)
-        else:
-            # 如果没有当前服务器，选中第一个
-            if self.server_combo.count() > 0:
-                self.server_combo.setCurrentIndex(0)
-                # 更新当前服务器ID
-                if self.server_combo.itemData(0):
-                    self.config_manager.current_server_id = self.server_combo.itemData(0)
-        
-        # 重新连接信号
-        self.server_combo.currentIndexChanged.connect(self.on_server_changed)
+        if current is None:
+            current = self.config_manager.page_servers(0, 1)[0]
+            self.config_manager.current_server_id = current['id']
+        self._select_server(current['id'])
+    
+    def on_server_filter_changed(self, text):
+        """按名称筛选下拉框；当前服务器被筛选掉时切换到第一个匹配项"""
+        self.server_combo.blockSignals(True)
+        self.server_proxy.setFilterFixedString(text.strip())
+        # 已加载的部分没有匹配项时继续分页读取，之后的匹配项随视图滚动读取
+        while not self.server_proxy.rowCount() and self.server_model.canFetchMore():
+            self.server_model.fetchMore()
+        self.server_combo.blockSignals(False)
+        if self._select_server(self.config_manager.current_server_id):
+            return
+        if self.server_proxy.rowCount() and not (self.process_thread and self.process_thread.is_running):
+            self.server_combo.blockSignals(True)
+            self.server_combo.setCurrentIndex(0)
+            self.server_combo.blockSignals(False)
+            self.on_server_changed()
     
     def get_control_values(self):
         """获取界面输入值"""
@@ -769,6 +913,9 @@ class MainWindow(QMainWindow):
             server['ip'] = self.ip_edit.text()
             server['dns'] = self.dns_edit.text()
             server['ech'] = self.ech_edit.text()
+            server['dns_cache'] = self.dns_cache_check.isChecked()
+            server['dns_cache_listen'] = self.dns_cache_edit.text()
+            server['graceful_restart'] = self.graceful_check.isChecked()
             # 保存分流模式
             routing_mode = self.routing_combo.currentData()
             if routing_mode:
@@ -778,15 +925,8 @@ class MainWindow(QMainWindow):
     def on_server_changed(self):
         """服务器选择改变"""
         if self.process_thread and self.process_thread.is_running:
-            # 暂时断开信号，恢复选择
-            self.server_combo.currentIndexChanged.disconnect()
-            current = self.config_manager.get_current_server()
-            if current:
-                for i in range(self.server_combo.count()):
-                    if self.server_combo.itemData(i) == current['id']:
-                        self.server_combo.setCurrentIndex(i)
-                        break
-            self.server_combo.currentIndexChanged.connect(self.on_server_changed)
+            # 恢复选择
+            self._select_server(self.config_manager.current_server_id)
             QMessageBox.warning(self, "提示", "请先停止当前连接后再切换服务器")
             return
         
@@ -806,7 +946,7 @@ class MainWindow(QMainWindow):
         name, ok = QInputDialog.getText(self, "新增服务器", "请输入服务器名称:", text="新服务器")
         if ok and name.strip():
             name = name.strip()
-            if any(s['name'] == name for s in self.config_manager.servers):
+            if self.config_manager.name_exists(name):
                 QMessageBox.warning(self, "提示", "服务器名称已存在")
                 return
             
@@ -821,17 +961,18 @@ class MainWindow(QMainWindow):
                 'dns': current.get('dns', 'dns.alidns.com/dns-query') if current else 'dns.alidns.com/dns-query',
                 'ech': current.get('ech', 'cloudflare-ech.com') if current else 'cloudflare-ech.com',
                 'routing_mode': current.get('routing_mode', 'bypass_cn') if current else 'bypass_cn',
+                'dns_cache': current.get('dns_cache', False) if current else False,
+                'dns_cache_listen': dns_cache_listen(current),
+                'graceful_restart': current.get('graceful_restart', False) if current else False,
                 'name': name
             }
             # 添加服务器（会自动生成新的 id）
             self.config_manager.add_server(new_server)
             self.config_manager.save_config()
-            self.refresh_server_combo()
-            # 切换到新添加的服务器
-            for i in range(self.server_combo.count()):
-                if self.server_combo.itemText(i) == name:
-                    self.server_combo.setCurrentIndex(i)
-                    break
+            # 切换到新添加的服务器（被筛选掉时清空筛选）
+            self.server_model.insert_server(new_server)
+            if not self._select_server(new_server['id']):
+                self.server_filter_edit.clear()
             self.load_server_config()
             self.append_log(f"[系统] 已添加新服务器: {name}\n")
     
@@ -842,10 +983,17 @@ class MainWindow(QMainWindow):
             self.config_manager.update_server(server)
             self.config_manager.save_config()
             self.append_log(f"[系统] 服务器 \"{server['name']}\" 配置已保存\n")
+            # 运行中修改了进程参数时按新配置重启
+            running = self.process_thread.config if self.process_thread and self.process_thread.is_running else None
+            if running and running['id'] == server['id']:
+                if any(server.get(k) != running.get(k) for k in PROCESS_FIELDS):
+                    self.restart_process()
+                elif any(server.get(k) != running.get(k) for k in DNS_CACHE_FIELDS):
+                    self.restart_dns_forwarder(server)
     
     def delete_server(self):
         """删除服务器"""
-        if len(self.config_manager.servers) <= 1:
+        if self.config_manager.server_count() <= 1:
             QMessageBox.warning(self, "提示", "至少需要保留一个服务器配置")
             return
         
@@ -861,8 +1009,9 @@ class MainWindow(QMainWindow):
                 self.config_manager.delete_server(deleted_id)
                 self.config_manager.save_config()
                 
-                # 刷新下拉框（会自动选中新的当前服务器）
-                self.refresh_server_combo()
+                # 从下拉框移除并选中新的当前服务器
+                self.server_model.remove_server(deleted_id)
+                self._select_server(self.config_manager.current_server_id)
                 
                 # 加载新当前服务器的配置
                 self.load_server_config()
@@ -876,7 +1025,7 @@ class MainWindow(QMainWindow):
             new_name, ok = QInputDialog.getText(self, "重命名服务器", "请输入新的服务器名称:", text=server['name'])
             if ok and new_name.strip():
                 new_name = new_name.strip()
-                if any(s['name'] == new_name and s['id'] != server['id'] for s in self.config_manager.servers):
+                if self.config_manager.name_exists(new_name, exclude_id=server['id']):
                     QMessageBox.warning(self, "提示", "服务器名称已存在")
                     return
                 
@@ -884,9 +1033,243 @@ class MainWindow(QMainWindow):
                 server['name'] = new_name
                 self.config_manager.update_server(server)
                 self.config_manager.save_config()
-                self.refresh_server_combo()
+                self.server_model.rename_server(server['id'], new_name)
+                self._select_server(server['id'])
                 self.append_log(f"[系统] 服务器已重命名: {old_name} -> {new_name}\n")
     
+    def _get_subscription_manager(self):
+        if self.subscription_manager is None:
+            from echipa.subscription import SubscriptionManager
+            self.subscription_manager = SubscriptionManager(self.config_manager, log=self.log_message.emit)
+        return self.subscription_manager
+    
+    def add_subscription(self):
+        """添加订阅地址并立即同步"""
+        url, ok = QInputDialog.getText(self, "添加订阅", "请输入订阅地址:")
+        if ok and url.strip():
+            url = url.strip()
+            if not url.startswith(('http://', 'https://')):
+                QMessageBox.warning(self, "提示", "订阅地址必须以 http:// 或 https:// 开头")
+                return
+            self._get_subscription_manager().add(url)
+            self.append_log(f"[订阅] 已添加: {url}\n")
+            self.sync_subscriptions()
+    
+    def sync_subscriptions(self):
+        """在后台线程中同步所有订阅"""
+        if self.subscription_thread and self.subscription_thread.isRunning():
+            return
+        manager = self._get_subscription_manager()
+        if not manager.subscriptions:
+            QMessageBox.information(self, "提示", "尚未添加订阅")
+            return
+        if self.process_thread and self.process_thread.is_running:
+            QMessageBox.warning(self, "提示", "请先停止当前连接后再同步订阅")
+            return
+        self.sync_btn.setEnabled(False)
+        self.subscription_thread = SubscriptionThread(manager)
+        self.subscription_thread.sync_finished.connect(self.on_subscriptions_synced)
+        self.subscription_thread.start()
+    
+    def on_subscriptions_synced(self, results):
+        """同步完成后在主线程刷新下拉框"""
+        self.sync_btn.setEnabled(True)
+        if any(r['status'] == 'changed' for r in results):
+            self.refresh_server_combo()
+            self.load_server_config()
+    
+    def on_config_changed(self, diff):
+        """增量应用 config.json 的外部修改；正在运行的服务器参数变化时只重启它"""
+        running = self.process_thread.config if self.process_thread and self.process_thread.is_running else None
+        old_names = {s['id']: (self.config_manager.get_server(s['id']) or s)['name'] for s in diff['changed']}
+        self.config_manager.apply_diff(diff, switch_current=running is None)
+        
+        for server_id in diff['removed']:
+            self.server_model.remove_server(server_id)
+        for server in diff['added']:
+            self.server_model.insert_server(server)
+        for server in diff['changed']:
+            if old_names.get(server['id']) != server['name']:
+                self.server_model.rename_server(server['id'], server['name'])
+        self._select_server(self.config_manager.current_server_id)
+        self.append_log(f"[配置] 检测到外部修改：新增 {len(diff['added'])}，修改 {len(diff['changed'])}，"
+                        f"删除 {len(diff['removed'])}\n")
+        
+        if running is None:
+            if not self.config_manager.server_count():
+                self.refresh_server_combo()
+            self.load_server_config()
+            return
+        if running['id'] in diff['removed']:
+            self.append_log(f"[配置] 正在运行的服务器 \"{running['name']}\" 已被删除，停止代理\n")
+            self.stop_process()
+            self.refresh_server_combo()
+            self.load_server_config()
+            return
+        server = self.config_manager.get_server(running['id'])
+        if any(server.get(k) != running.get(k) for k in PROCESS_FIELDS):
+            self.append_log(f"[配置] 服务器 \"{server['name']}\" 参数已变化，重启代理\n")
+            self.restart_process()
+            return
+        self.load_server_config()
+        if any(server.get(k) != running.get(k) for k in DNS_CACHE_FIELDS):
+            self.restart_dns_forwarder(server)
+    
+    def restart_process(self):
+        """按当前服务器配置重启 ech-workers；开启平滑重启时已建立的连接不中断"""
+        old = self.process_thread.config
+        self.load_server_config()
+        server = self.get_control_values()
+        self.process_thread.restart(server)
+        if any(server.get(k) != old.get(k) for k in ('listen',) + DNS_CACHE_FIELDS):
+            self.stop_dns_forwarder()
+            if server.get('dns_cache'):
+                self.start_dns_forwarder(server)
+        if self.system_proxy_enabled and server['listen'] != old.get('listen'):
+            self._set_system_proxy(True)
+    
+    def start_control_server(self, listen):
+        """本地控制与监控接口（见 echipa.control）"""
+        from echipa.control import ControlServer
+        try:
+            self.control_server = ControlServer(self, listen).start()
+            self.append_log(f"[系统] 控制接口: {listen}\n")
+        except Exception as e:
+            self.append_log(f"[系统] 控制接口启动失败: {e}\n")
+    
+    # 以下五个方法由控制线程调用，只读取状态，修改操作经 control_command 信号转到界面线程
+    def status(self):
+        from echipa.control import process_status
+        thread = self.process_thread if self.process_thread and self.process_thread.is_running else None
+        status = process_status(thread.config if thread else self.config_manager.get_current_server(),
+                                thread.supervisor if thread else None,
+                                self.dns_forwarder, self.process_started_at,
+                                thread.monitor if thread else None)
+        status['log_backlog'] = len(self.log_backlog)
+        return status
+    
+    def logs(self, since=0):
+        first = self.log_seq - len(self.log_backlog)
+        return self.log_seq, list(self.log_backlog)[max(0, since - first):]
+    
+    def speed_tests(self):
+        from echipa.speedtest import SpeedTestStore
+        store = self.speed_store or SpeedTestStore(self.config_manager.config_dir)
+        return store.report(self.speed_testing)
+    
+    def explain(self, hosts):
+        """控制接口的 /explain（在控制线程的线程池中调用）：按已保存的分流模式判定
+        
+        只使用已加载的 IP 段与规则，不加载也不修改界面使用的对象；判定对象是控制接口自己的一份。
+        """
+        server = self.config_manager.get_current_server() or {}
+        with self._control_explain_lock:
+            explainer = self.control_explainer = self._get_explainer(server.get('routing_mode', 'bypass_cn'),
+                                                                     self.control_explainer)
+            results = [decision.to_dict() for decision in explainer.explain_many(hosts)]
+            return {'ok': True, 'mode': explainer.routing_mode, 'results': results, 'cache': explainer.stats()}
+    
+    def probe_addr(self):
+        if not (self.process_thread and self.process_thread.is_running):
+            return None
+        from echipa.runner import local_addr
+        return local_addr(self.process_thread.config['listen'])
+    
+    def command(self, name, arg=None):
+        if name == 'switch':
+            server = self.config_manager.get_server(arg or '') or \
+                next((s for s in self.config_manager.servers if s.get('name') == arg), None)
+            if server is None:
+                return {'ok': False, 'error': f'找不到服务器: {arg}'}
+            arg = server['id']
+        elif name == 'speedtest':
+            from echipa.speedtest import parse_size
+            if not (self.process_thread and self.process_thread.is_running):
+                return {'ok': False, 'error': '代理未运行'}
+            if self.speed_testing:
+                return {'ok': False, 'error': '正在测速'}
+            try:
+                arg = str(parse_size(arg))
+            except ValueError as e:
+                return {'ok': False, 'error': str(e)}
+        elif name not in ('start', 'stop'):
+            return {'ok': False, 'error': f'未知命令: {name}'}
+        self.control_command.emit(name, arg or '')
+        return {'ok': True, 'queued': name}
+    
+    def on_control_command(self, name, arg):
+        running = self.process_thread and self.process_thread.is_running
+        if name == 'start' and not running:
+            self.start_process()
+        elif name == 'stop' and running:
+            self.stop_process()
+        elif name == 'switch' and arg != self.config_manager.current_server_id:
+            self.config_manager.current_server_id = arg
+            self.config_manager.save_config()
+            self._select_server(arg)
+            self.load_server_config()
+            if running:
+                self.restart_process()
+            self.append_log(f"[系统] 控制接口切换服务器: {self.config_manager.get_current_server()['name']}\n")
+        elif name == 'speedtest' and running:
+            self.run_speed_test(float(arg))
+    
+    def select_doh_server(self):
+        """在线程池中测试候选 DoH 服务器，把最快的写入当前服务器配置"""
+        from echipa.dohselect import CANDIDATES, DoHSelector
+        if self.doh_selector is None:
+            self.doh_selector = DoHSelector(self.config_manager.config_dir, log=self.log_message.emit)
+        current = self.dns_edit.text().strip()
+        candidates = [current, *CANDIDATES] if current else list(CANDIDATES)
+        domain = self.ech_edit.text().strip() or 'cloudflare-ech.com'
+        server_id = self.config_manager.current_server_id
+        self.dns_select_btn.setEnabled(False)
+        
+        def done(report):
+            self.dns_select_btn.setEnabled(True)
+            best = report['best']
+            if not best or best == self.dns_edit.text().strip():
+                return
+            if self.config_manager.current_server_id != server_id:
+                self.append_log(f"[DoH] 测试期间已切换服务器，未修改配置（最佳: {best}）\n")
+                return
+            self.dns_edit.setText(best)
+            self.save_server()  # 运行中的服务器会按新配置重启
+        
+        def failed(error):
+            self.dns_select_btn.setEnabled(True)
+            self.append_log(f"[DoH] 测试失败: {error}\n")
+        
+        self.tasks.submit('doh_select', self.doh_selector.select, candidates, domain,
+                          on_result=done, on_error=failed, serial='doh_select')
+    
+    def run_speed_test(self, mb=None):
+        """在线程池中经本地代理端口测速当前运行的服务器（见 echipa.speedtest）"""
+        if not (self.process_thread and self.process_thread.is_running) or self.speed_testing:
+            return
+        from echipa.speedtest import DOWNLOAD_MB, SpeedTestStore, test_server
+        if self.speed_store is None:
+            self.speed_store = SpeedTestStore(self.config_manager.config_dir)
+        server = dict(self.process_thread.config)
+        self.speed_testing = server['id']
+        self.speed_btn.setEnabled(False)
+        self.tasks.submit('speed_test', test_server, server, self.speed_store, mb or DOWNLOAD_MB,
+                          on_result=lambda result: self.on_speed_test_done(),
+                          on_error=lambda error: self.on_speed_test_done(error),
+                          on_progress=self.append_log)
+    
+    def on_speed_test_done(self, error=None):
+        self.speed_testing = None
+        self.speed_btn.setEnabled(bool(self.process_thread and self.process_thread.is_running))
+        if error:
+            self.append_log(f"[测速] 失败: {error}\n")
+            return
+        ranking = self.speed_store.ranking()
+        if len(ranking) > 1:
+            text = '，'.join(f"{i}. {name or server_id[:8]} {rate:.1f} Mbps"
+                            for i, (server_id, name, rate) in enumerate(ranking[:5], 1))
+            self.append_log(f"[测速] 下载速度排名: {text}\n")
+    
     def start_process(self):
         """启动进程"""
         server = self.get_control_values()
@@ -902,51 +1285,118 @@ class MainWindow(QMainWindow):
         self.config_manager.update_server(server)
         self.config_manager.save_config()
         
-        self.process_thread = ProcessThread(server)
+        if self.ech_cache is None:
+            from echipa.ech import ECHConfigCache
+            self.ech_cache = ECHConfigCache(self.config_manager.config_dir, log=self.log_message.emit)
+        
+        if self.binary_resolver is None:
+            from echipa.locator import BinaryResolver, default_candidates
+            self.binary_resolver = BinaryResolver(
+                self.config_manager.config_dir,
+                default_candidates(Path(__file__).parent.absolute(), Path.cwd())
+            )
+        
+        self.process_thread = ProcessThread(server, self.ech_cache, self.binary_resolver)
         self.process_thread.log_output.connect(self.append_log)
         self.process_thread.process_finished.connect(self.on_process_finished)
+        self.process_thread.resource_sampled.connect(self.resource_label.setText)
         self.process_thread.start()
+        self.process_started_at = time.monotonic()
         
         self.start_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
         self.proxy_btn.setEnabled(True)  # 启动后可以设置系统代理
+        self.speed_btn.setEnabled(not self.speed_testing)
         self.server_edit.setEnabled(False)
         self.listen_edit.setEnabled(False)
         self.server_combo.setEnabled(False)
         self.append_log(f"[系统] 已启动服务器: {server['name']}\n")
+        
+        if server.get('dns_cache'):
+            self.start_dns_forwarder(server)
+    
+    def start_dns_forwarder(self, server):
+        """启动本地 DNS 缓存，上游 DoH 经本地代理转发"""
+        from echipa.dnsproxy import DNSForwarder, parse_addr
+        try:
+            host, port = parse_addr(server['listen'])
+            if host in ('0.0.0.0', '::'):
+                host = '127.0.0.1'
+            self.dns_forwarder = DNSForwarder(
+                listen=dns_cache_listen(server),
+                proxy=(host, port),
+                log=self.process_thread.log_output.emit
+            )
+            self.dns_forwarder.start()
+        except Exception as e:
+            self.dns_forwarder = None
+            self.append_log(f"[DNS] 启动本地 DNS 缓存失败: {e}\n")
+    
+    def restart_dns_forwarder(self, server):
+        """只有本地 DNS 缓存的设置变化时只重启转发器，ech-workers 不受影响"""
+        self.process_thread.config = dict(self.process_thread.config, **{k: server.get(k) for k in DNS_CACHE_FIELDS})
+        self.stop_dns_forwarder()
+        if server.get('dns_cache'):
+            self.start_dns_forwarder(server)
+    
+    def stop_dns_forwarder(self):
+        """停止本地 DNS 缓存并输出命中统计"""
+        if self.dns_forwarder:
+            stats = self.dns_forwarder.stats()
+            self.dns_forwarder.stop()
+            self.dns_forwarder = None
+            self.append_log(f"[DNS] 本地 DNS 缓存已停止，命中率 {stats['hit_rate']:.1%}，"
+                            f"合并 {stats['coalesced']} 次，上游 p50 {stats['upstream_p50_ms']:.1f}ms\n")
     
     def stop_process(self):
-        """停止进程"""
-        if self.process_thread:
-            self.process_thread.stop()
-            self.process_thread.wait()
-        self.on_process_finished()
+        """停止进程（在后台等待子进程退出，结束后由 process_finished 信号更新界面）"""
+        if not (self.process_thread and self.process_thread.isRunning()):
+            self.on_process_finished()
+            return
+        self.stop_btn.setEnabled(False)
+        self.append_log("[系统] 正在停止代理...\n")
+        self.tasks.submit('stop_process', self.process_thread.stop)
     
     def on_process_finished(self):
         """进程结束"""
+        self.stop_dns_forwarder()
+        
         # 停止时自动清理系统代理
         if self.system_proxy_enabled:
-            self._set_system_proxy(False)
             self.system_proxy_enabled = False
             self.proxy_btn.setText("设置系统代理")
-            self.append_log("[系统] 已自动清理系统代理\n")
+            self._set_system_proxy(False, lambda ok: ok and self.append_log("[系统] 已自动清理系统代理\n"))
         
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
         self.proxy_btn.setEnabled(False)  # 停止后禁用系统代理按钮
+        self.speed_btn.setEnabled(False)
         self.server_edit.setEnabled(True)
         self.listen_edit.setEnabled(True)
         self.server_combo.setEnabled(True)
+        self.resource_label.clear()
         self.append_log("[系统] 进程已停止。\n")
     
     def on_auto_start_changed(self):
-        """开机启动改变"""
+        """开机启动改变（注册表/启动项写入在后台进行）"""
         enabled = self.auto_start_check.isChecked()
-        if self._set_auto_start(enabled):
-            self.append_log(f"[系统] {'已设置' if enabled else '已取消'}开机启动\n")
-        else:
-            self.auto_start_check.setChecked(not enabled)
-            QMessageBox.warning(self, "错误", "设置开机启动失败")
+        self.auto_start_check.setEnabled(False)
+        
+        def done(ok):
+            self.auto_start_check.setEnabled(True)
+            if ok:
+                self.append_log(f"[系统] {'已设置' if enabled else '已取消'}开机启动\n")
+            else:
+                self._set_auto_start_checked(not enabled)
+                QMessageBox.warning(self, "错误", "设置开机启动失败")
+        
+        self.tasks.submit('auto_start', self._set_auto_start, enabled, on_result=done, serial='auto_start')
+    
+    def _set_auto_start_checked(self, checked):
+        """只更新复选框，不触发写入"""
+        self.auto_start_check.blockSignals(True)
+        self.auto_start_check.setChecked(checked)
+        self.auto_start_check.blockSignals(False)
     
     def _set_auto_start(self, enabled):
         """设置开机启动（跨平台）"""
@@ -1061,6 +1511,8 @@ class MainWindow(QMainWindow):
     
     def append_log(self, text):
         """追加日志"""
+        self.log_backlog.append(text)
+        self.log_seq += 1
         self.log_text.append(text)
         # 限制日志长度
         if self.log_text.document().blockCount() > 1000:
@@ -1071,8 +1523,9 @@ class MainWindow(QMainWindow):
             cursor.removeSelectedText()
     
     def update_auto_start_checkbox(self):
-        """更新开机启动复选框状态"""
-        self.auto_start_check.setChecked(self._is_auto_start_enabled())
+        """在后台读取开机启动状态并更新复选框"""
+        self.tasks.submit('auto_start_state', self._is_auto_start_enabled,
+                          on_result=self._set_auto_start_checked, serial='auto_start')
     
     def on_routing_changed(self):
         """分流模式改变"""
@@ -1081,15 +1534,19 @@ class MainWindow(QMainWindow):
             routing_mode = self.routing_combo.currentData()
             if routing_mode == 'none':
                 # 如果切换到"不改变代理"，自动关闭系统代理
-                if self._set_system_proxy(False):
-                    self.system_proxy_enabled = False
-                    self.proxy_btn.setText("设置系统代理")
-                    self.append_log("[系统] 分流模式已切换为\"不改变代理\"，已关闭系统代理\n")
+                def disabled(ok):
+                    if ok:
+                        self.system_proxy_enabled = False
+                        self.proxy_btn.setText("设置系统代理")
+                        self.append_log("[系统] 分流模式已切换为\"不改变代理\"，已关闭系统代理\n")
+                self._set_system_proxy(False, disabled)
             else:
                 # 重新设置系统代理以应用新的绕过规则
-                if self._set_system_proxy(True):
-                    mode_name = self.routing_combo.currentText()
-                    self.append_log(f"[系统] 分流模式已切换为\"{mode_name}\"，已更新系统代理设置\n")
+                mode_name = self.routing_combo.currentText()
+                self._set_system_proxy(True, lambda ok: ok and self.append_log(
+                    f"[系统] 分流模式已切换为\"{mode_name}\"，已更新系统代理设置\n"))
+        elif self._first_paint_done:
+            self.load_bypass_ranges_async()  # 预先加载，设置系统代理时不必等待
     
     def toggle_system_proxy(self):
         """切换系统代理"""
@@ -1098,241 +1555,55 @@ class MainWindow(QMainWindow):
             QMessageBox.information(self, "提示", "当前分流模式为\"不改变代理\"，无法设置系统代理")
             return
         
-        if self.system_proxy_enabled:
-            # 关闭系统代理
-            if self._set_system_proxy(False):
-                self.system_proxy_enabled = False
-                self.proxy_btn.setText("设置系统代理")
-                self.append_log("[系统] 已关闭系统代理\n")
-            else:
-                QMessageBox.warning(self, "错误", "关闭系统代理失败")
-        else:
-            # 开启系统代理
-            if self._set_system_proxy(True):
-                self.system_proxy_enabled = True
-                self.proxy_btn.setText("关闭系统代理")
-                self.append_log("[系统] 已设置系统代理\n")
-            else:
-                QMessageBox.warning(self, "错误", "设置系统代理失败")
-    
-    def _set_system_proxy(self, enabled):
-        """设置系统代理（跨平台）"""
-        try:
-            # 获取当前监听地址
-            listen = self.listen_edit.text()
-            if not listen and enabled:
-                return False
-            
-            # 获取分流模式
-            routing_mode = self.routing_combo.currentData()
-            if not routing_mode:
-                routing_mode = 'bypass_cn'  # 默认值
-            
-            # 如果是"不改变代理"模式，不设置系统代理
-            if routing_mode == 'none':
-                if enabled:
-                    self.append_log("[系统] 分流模式为\"不改变代理\"，跳过系统代理设置\n")
-                return True
-            
-            if sys.platform == 'win32':
-                return self._set_windows_proxy(enabled, listen, routing_mode)
-            elif sys.platform == 'darwin':
-                return self._set_macos_proxy(enabled, listen, routing_mode)
-            else:
-                self.append_log("[系统] Linux 暂不支持自动设置系统代理\n")
-                return False
-        except Exception as e:
-            self.append_log(f"[系统] 设置系统代理失败: {e}\n")
-            return False
-    
-    def _get_proxy_bypass_list(self, routing_mode):
-        """获取代理绕过列表"""
-        # 基础绕过列表（本地和内网）
-        base_bypass = "localhost;127.*;10.*;172.16.*;172.17.*;172.18.*;172.19.*;172.20.*;172.21.*;172.22.*;172.23.*;172.24.*;172.25.*;172.26.*;172.27.*;172.28.*;172.29.*;172.30.*;172.31.*;192.168.*;<local>"
-        
-        if routing_mode == 'global':
-            # 全局代理：只绕过本地和内网
-            return base_bypass
-        elif routing_mode == 'bypass_cn':
-            # 跳过中国大陆：添加中国IP段和常见中国域名
-            cn_domains = [
-                "*.cn", "*.com.cn", "*.net.cn", "*.org.cn", "*.gov.cn", "*.edu.cn",
-                "*.baidu.com", "*.qq.com", "*.taobao.com", "*.tmall.com", "*.alipay.com",
-                "*.weibo.com", "*.sina.com", "*.163.com", "*.126.com", "*.sohu.com",
-                "*.youku.com", "*.iqiyi.com", "*.bilibili.com", "*.douyin.com", "*.douban.com",
-                "*.zhihu.com", "*.jd.com", "*.alibaba.com", "*.1688.com",
-                "*.tencent.com", "*.weixin.qq.com", "*.qzone.com"
-            ]
-            
-            # 使用下载的中国IP列表
-            cn_ip_wildcards = []
-            if self.china_ip_ranges:
-                cn_ip_wildcards = self._convert_ip_ranges_to_wildcards(self.china_ip_ranges)
-            else:
-                # 如果还没加载完成，使用默认的主要IP段
-                cn_ip_wildcards = [
-                    "1.*", "14.*", "27.*", "36.*", "39.*", "42.*", "49.*", "58.*", "59.*", "60.*",
-                    "61.*", "101.*", "103.*", "106.*", "110.*", "111.*", "112.*", "113.*", "114.*", "115.*",
-                    "116.*", "117.*", "118.*", "119.*", "120.*", "121.*", "122.*", "123.*", "124.*", "125.*",
-                    "171.*", "175.*", "180.*", "182.*", "183.*", "202.*", "203.*", "210.*", "211.*", "218.*",
-                    "219.*", "220.*", "221.*", "222.*", "223.*"
-                ]
-            
-            # Windows ProxyOverride 使用分号分隔，支持通配符
-            # 注意：Windows ProxyOverride 有长度限制（约2048字符），需要优化
-            cn_bypass_parts = cn_domains + cn_ip_wildcards
-            cn_bypass = ";".join(cn_bypass_parts)
-            
-            # 如果超过长度限制，只使用域名和主要IP段
-            MAX_LENGTH = 2000
-            if len(cn_bypass) > MAX_LENGTH:
-                # 只使用域名和A段通配符（格式：A.*）
-                a_segment_wildcards = [w for w in cn_ip_wildcards if w.count('.') == 1 and w.endswith('.*')]
-                cn_bypass = ";".join(cn_domains + a_segment_wildcards)
-            
-            return f"{base_bypass};{cn_bypass}"
-        else:
-            return base_bypass
-    
-    def _set_windows_proxy(self, enabled, listen, routing_mode):
-        """设置 Windows 系统代理"""
-        try:
-            import winreg
-            
-            # Internet Settings 注册表路径
-            key_path = r"Software\Microsoft\Windows\CurrentVersion\Internet Settings"
-            
-            key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, key_path, 0, winreg.KEY_SET_VALUE)
-            
-            if enabled:
-                # Windows 11 需要直接使用 IP:端口 格式，不使用 socks= 前缀
-                # 解析监听地址，提取 IP 和端口
-                if ':' in listen:
-                    proxy_server = listen
-                else:
-                    proxy_server = f"127.0.0.1:{listen}"
-                winreg.SetValueEx(key, "ProxyServer", 0, winreg.REG_SZ, proxy_server)
-                winreg.SetValueEx(key, "ProxyEnable", 0, winreg.REG_DWORD, 1)
-                # 根据分流模式设置绕过列表
-                bypass_list = self._get_proxy_bypass_list(routing_mode)
-                winreg.SetValueEx(key, "ProxyOverride", 0, winreg.REG_SZ, bypass_list)
-            else:
-                # 关闭代理
-                winreg.SetValueEx(key, "ProxyEnable", 0, winreg.REG_DWORD, 0)
-            
-            winreg.CloseKey(key)
-            
-            # 通知系统代理设置已更改
-            try:
-                from ctypes import windll
-                INTERNET_OPTION_SETTINGS_CHANGED = 39
-                INTERNET_OPTION_REFRESH = 37
-                windll.wininet.InternetSetOptionW(0, INTERNET_OPTION_SETTINGS_CHANGED, 0, 0)
-                windll.wininet.InternetSetOptionW(0, INTERNET_OPTION_REFRESH, 0, 0)
-            except:
-                pass
-            
-            return True
-        except Exception as e:
-            self.append_log(f"[系统] Windows 代理设置失败: {e}\n")
-            return False
-    
-    def _get_macos_bypass_list(self, routing_mode):
-        """获取 macOS 代理绕过列表"""
-        # 基础绕过列表（本地和内网）
-        base_bypass = [
-            "localhost", "127.*", "10.*", "172.16.*", "172.17.*", "172.18.*",
-            "172.19.*", "172.20.*", "172.21.*", "172.22.*", "172.23.*", "172.24.*",
-            "172.25.*", "172.26.*", "172.27.*", "172.28.*", "172.29.*", "172.30.*",
-            "172.31.*", "192.168.*", "*.local", "169.254.*"
-        ]
-        
-        if routing_mode == 'global':
-            # 全局代理：只绕过本地和内网
-            return base_bypass
-        elif routing_mode == 'bypass_cn':
-            # 跳过中国大陆：添加中国域名和IP
-            cn_domains = [
-                "*.cn", "*.com.cn", "*.net.cn", "*.org.cn", "*.gov.cn", "*.edu.cn",
-                "*.baidu.com", "*.qq.com", "*.taobao.com", "*.tmall.com", "*.alipay.com",
-                "*.weibo.com", "*.sina.com", "*.163.com", "*.126.com", "*.sohu.com",
-                "*.youku.com", "*.iqiyi.com", "*.bilibili.com", "*.douyin.com", "*.douban.com",
-                "*.zhihu.com", "*.jd.com", "*.alibaba.com", "*.1688.com",
-                "*.tencent.com", "*.weixin.qq.com", "*.qzone.com"
-            ]
-            
-            # 使用下载的中国IP列表（macOS也支持IP通配符）
-            cn_ip_wildcards = []
-            if self.china_ip_ranges:
-                cn_ip_wildcards = self._convert_ip_ranges_to_wildcards(self.china_ip_ranges)
+        enabled = not self.system_proxy_enabled
+        self.proxy_btn.setEnabled(False)  # 设置完成前不能再次切换
+        
+        def done(ok):
+            self.proxy_btn.setEnabled(bool(self.process_thread and self.process_thread.is_running))
+            if ok:
+                self.system_proxy_enabled = enabled
+                self.proxy_btn.setText("关闭系统代理" if enabled else "设置系统代理")
+                self.append_log(f"[系统] {'已设置' if enabled else '已关闭'}系统代理\n")
             else:
-                # 如果还没加载完成，使用默认的主要IP段
-                cn_ip_wildcards = [
-                    "1.*", "14.*", "27.*", "36.*", "39.*", "42.*", "49.*", "58.*", "59.*", "60.*",
-                    "61.*", "101.*", "103.*", "106.*", "110.*", "111.*", "112.*", "113.*", "114.*", "115.*",
-                    "116.*", "117.*", "118.*", "119.*", "120.*", "121.*", "122.*", "123.*", "124.*", "125.*",
-                    "171.*", "175.*", "180.*", "182.*", "183.*", "202.*", "203.*", "210.*", "211.*", "218.*",
-                    "219.*", "220.*", "221.*", "222.*", "223.*"
-                ]
-            
-            return base_bypass + cn_domains + cn_ip_wildcards
-        else:
-            return base_bypass
+                QMessageBox.warning(self, "错误", f"{'设置' if enabled else '关闭'}系统代理失败")
+        
+        self._set_system_proxy(enabled, done)
     
-    def _set_macos_proxy(self, enabled, listen, routing_mode):
-        """设置 macOS 系统代理"""
-        try:
-            # 解析监听地址
-            if ':' in listen:
-                host, port = listen.rsplit(':', 1)
-            else:
-                host, port = '127.0.0.1', listen
-            
-            # 获取当前网络服务名称
-            result = subprocess.run(
-                ['networksetup', '-listallnetworkservices'],
-                capture_output=True, text=True
-            )
-            
-            # 解析网络服务列表（跳过第一行说明）
-            services = [line.strip() for line in result.stdout.strip().split('\n')[1:] 
-                       if line.strip() and not line.startswith('*')]
-            
-            # 获取绕过列表
-            bypass_list = self._get_macos_bypass_list(routing_mode)
-            bypass_string = " ".join(bypass_list)
-            
-            for service in services:
-                try:
-                    if enabled:
-                        # 设置 SOCKS 代理
-                        subprocess.run(
-                            ['networksetup', '-setsocksfirewallproxy', service, host, port],
-                            capture_output=True, check=True
-                        )
-                        # 设置绕过列表
-                        subprocess.run(
-                            ['networksetup', '-setsocksfirewallproxybypassdomains', service] + bypass_list,
-                            capture_output=True, check=True
-                        )
-                        subprocess.run(
-                            ['networksetup', '-setsocksfirewallproxystate', service, 'on'],
-                            capture_output=True, check=True
-                        )
-                    else:
-                        # 关闭 SOCKS 代理
-                        subprocess.run(
-                            ['networksetup', '-setsocksfirewallproxystate', service, 'off'],
-                            capture_output=True, check=True
-                        )
-                except subprocess.CalledProcessError:
-                    # 某些网络服务可能不支持代理设置，忽略错误
-                    pass
-            
-            return True
-        except Exception as e:
-            self.append_log(f"[系统] macOS 代理设置失败: {e}\n")
-            return False
+    def _set_system_proxy(self, enabled, on_done=None):
+        """在后台设置系统代理（跨平台，见 echipa.routing）；on_done(是否成功) 在界面线程调用
+        
+        当前分流模式的IP段还没有加载时在同一个后台任务中先加载。
+        """
+        from echipa.routing import load_bypass_ranges, set_system_proxy
+        routing_mode = self.routing_combo.currentData()
+        codes = self._bypass_countries()
+        ranges = self.bypass_ranges.get(codes)
+        config_dir = self.config_manager.config_dir
+        rules = self._get_rule_set() if enabled and routing_mode == 'rules' else None
+        
+        def apply(listen, log):
+            loaded = ranges
+            if enabled and codes and loaded is None:
+                loaded = load_bypass_ranges(config_dir, routing_mode, codes, log)
+            if rules is not None:
+                rules.refresh(log)  # 只重新编译修改过的规则文件
+            return set_system_proxy(enabled, listen, routing_mode, loaded, log, codes, rules), loaded
+        
+        def applied(result):
+            ok, loaded = result
+            if loaded is not None:
+                self.bypass_ranges[codes] = loaded
+            if on_done:
+                on_done(ok)
+        
+        def failed(error):
+            self.append_log(f"[系统] 设置系统代理失败: {error}\n")
+            if on_done:
+                on_done(False)
+        
+        return self.tasks.submit('system_proxy', apply, self.listen_edit.text(),
+                                 on_result=applied, on_error=failed, on_progress=self.append_log,
+                                 serial='system_proxy')
     
     def closeEvent(self, event):
         """窗口关闭事件"""
@@ -1358,6 +1629,8 @@ class MainWindow(QMainWindow):
                 self.process_thread.stop()
                 self.process_thread.wait()
             
+            self.config_manager.flush()
+            self.tasks.shutdown()
             event.accept()
     
     def auto_start(self):
@@ -1371,8 +1644,14 @@ class MainWindow(QMainWindow):
 
 def main():
     app = QApplication(sys.argv)
+    STARTUP.mark('qapplication')
     window = MainWindow()
-    window.show()
+    STARTUP.mark('main_window')
+    if window.is_autostart and QSystemTrayIcon.isSystemTrayAvailable():
+        # 开机自启动时直接驻留托盘，不显示窗口
+        QTimer.singleShot(0, window.deferred_init)
+    else:
+        window.show()
     sys.exit(app.exec_())
 
 
@@ -1,8 +1,14 @@
 """
 应用入口点
 """
-from echipa.app import main
+import sys
 
 if __name__ == '__main__':
+    if '-daemon' in sys.argv:
+        # 无界面守护进程，不导入 Toga
+        from echipa.daemon import main as daemon_main
+        sys.exit(daemon_main(sys.argv[1:]))
+
+    from echipa.app import main
     app = main()
     app.main_loop()
@@ -0,0 +1,607 @@
+"""
+服务器配置存储（不依赖 Qt/Toga，桌面端与 iOS 端共用）
+
+- JSONServerStore: 内存中按 id 索引，保存经防抖合并后在后台线程原子写入 config.json
+- SQLiteServerStore: 大量服务器时可选的 SQLite (WAL) 存储，支持按名称/标签分页查询
+两者接口一致；config.json 始终可作为导入/导出格式。
+使用 JSON 存储时可监视 config.json 的外部修改，按服务器计算差异后增量应用。
+"""
+
+import atexit
+import bisect
+import json
+import os
+import sys
+import threading
+import uuid
+from pathlib import Path
+
+SAVE_DELAY = 0.3  # 秒，期间的多次修改合并为一次写入
+
+SQLITE_NAME = 'servers.db'
+
+# 修改后需要重启 ech-workers 进程的字段（见 echipa.runner.build_command）
+PROCESS_FIELDS = ('server', 'listen', 'token', 'ip', 'dns', 'ech')
+
+# 修改后只需重启本地 DNS 缓存转发器的字段（转发器的上游是 listen，listen 变化时进程也会重启）
+DNS_CACHE_FIELDS = ('dns_cache', 'dns_cache_listen')
+
+# 本地 DNS 缓存（echipa.dnsproxy）的默认监听地址；5353 是 mDNS 端口，macOS/Linux 上通常已被系统占用
+DNS_CACHE_LISTEN = '127.0.0.1:5354'
+_LEGACY_DNS_CACHE_LISTEN = '127.0.0.1:5353'  # 旧版本的默认值，已保存在不少服务器配置中
+
+
+def dns_cache_listen(server):
+    """服务器配置中本地 DNS 缓存的监听地址；未设置或仍是旧默认值时使用 DNS_CACHE_LISTEN"""
+    listen = (server or {}).get('dns_cache_listen')
+    return DNS_CACHE_LISTEN if not listen or listen == _LEGACY_DNS_CACHE_LISTEN else listen
+
+
+def desktop_config_dir():
+    """桌面端（gui.py 与守护进程）的配置目录"""
+    if sys.platform == 'win32':
+        # Windows: %APPDATA%\ECHWorkersClient
+        return Path(os.getenv('APPDATA', Path.home())) / "ECHWorkersClient"
+    elif sys.platform == 'darwin':
+        # macOS: ~/Library/Application Support/ECHWorkersClient
+        return Path.home() / "Library" / "Application Support" / "ECHWorkersClient"
+    else:
+        # Linux: ~/.config/ECHWorkersClient
+        return Path.home() / ".config" / "ECHWorkersClient"
+
+
+def default_server():
+    """默认服务器配置"""
+    return {
+        'id': str(uuid.uuid4()),
+        'name': '默认服务器',
+        'server': 'example.com:443',
+        'listen': '127.0.0.1:30000',
+        'token': '',
+        'ip': 'saas.sin.fan',
+        'dns': 'dns.alidns.com/dns-query',
+        'ech': 'cloudflare-ech.com',
+        'routing_mode': 'bypass_cn',  # 默认跳过中国大陆
+    }
+
+
+def atomic_write(path, text):
+    """写临时文件后改名，写入中途崩溃不会留下半个配置文件"""
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_json_config(path):
+    """读取 config.json，返回 (servers, current_server_id)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get('servers', []), data.get('current_server_id')
+
+
+def file_signature(path):
+    """(mtime, size, inode)，文件不存在时为 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def diff_servers(old_servers, new_servers, old_current=None, new_current=None):
+    """按 id 比较两份服务器列表，没有差异时返回 None"""
+    old = {s['id']: s for s in old_servers}
+    new = {s['id']: s for s in new_servers if 'id' in s}
+    diff = {
+        'added': [s for sid, s in new.items() if sid not in old],
+        'removed': [sid for sid in old if sid not in new],
+        'changed': [s for sid, s in new.items() if sid in old and old[sid] != s],
+        'current_server_id': new_current if new_current != old_current else None,
+    }
+    if not any(diff.values()):
+        return None
+    return diff
+
+
+def dump_json_config(servers, current_server_id):
+    """紧凑编码（无缩进）"""
+    return json.dumps({'servers': servers, 'current_server_id': current_server_id},
+                      ensure_ascii=False, separators=(',', ':'))
+
+
+class JSONServerStore:
+    """以 config.json 持久化的内存存储"""
+
+    def __init__(self, path, delay=SAVE_DELAY):
+        self.path = path
+        self.delay = delay
+        self.current_server_id = None
+        self._servers = {}   # id -> server（保持插入顺序）
+        self._names = {}     # name -> id
+        self._name_of = {}   # id -> name（调用方可能原地修改 server['name']）
+        self._sorted = None  # [(name.lower(), name, id)]，按需重建
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()  # 定时器线程与调用方同时 flush 时串行写盘
+        self._timer = None
+        self._dirty = False
+        self.writes = 0
+        self.written = None  # 最近一次读写后 config.json 的 file_signature，用于忽略自己的写入
+
+    # ---------- 读取 ----------
+
+    def load(self):
+        servers, current = [], None
+        if self.path.exists():
+            servers, current = read_json_config(self.path)
+            self.written = file_signature(self.path)
+        with self._lock:
+            self._servers = {s['id']: s for s in servers if 'id' in s}
+            self._name_of = {sid: s.get('name', '') for sid, s in self._servers.items()}
+            self._names = {name: sid for sid, name in self._name_of.items()}
+            self._sorted = None
+            self.current_server_id = current
+
+    def get(self, server_id):
+        return self._servers.get(server_id)
+
+    def first(self):
+        return next(iter(self._servers.values()), None)
+
+    def count(self):
+        return len(self._servers)
+
+    def all(self):
+        with self._lock:
+            return list(self._servers.values())
+
+    def name_exists(self, name, exclude_id=None):
+        owner = self._names.get(name)
+        return owner is not None and owner != exclude_id
+
+    def _sorted_index(self):
+        with self._lock:
+            if self._sorted is None:
+                self._sorted = sorted((s.get('name', '').lower(), s.get('name', ''), sid)
+                                      for sid, s in self._servers.items())
+            return self._sorted
+
+    def page(self, offset=0, limit=100, query='', tag=None):
+        """按名称排序分页；query 为名称前缀（不区分大小写）"""
+        index = self._sorted_index()
+        if query:
+            prefix = query.lower()
+            lo = bisect.bisect_left(index, (prefix,))
+            hi = bisect.bisect_left(index, (prefix + '\uffff',))
+            index = index[lo:hi]
+        servers = (self._servers[sid] for _, _, sid in index)
+        if tag:
+            servers = (s for s in servers if tag in s.get('tags', ()))
+        result = []
+        for i, server in enumerate(servers):
+            if i >= offset + limit:
+                break
+            if i >= offset:
+                result.append(server)
+        return result
+
+    # ---------- 修改 ----------
+
+    def _index(self, server):
+        sid = server['id']
+        name = server.get('name', '')
+        old_name = self._name_of.get(sid)
+        if old_name is not None and old_name != name and self._names.get(old_name) == sid:
+            del self._names[old_name]
+        self._names[name] = sid
+        self._name_of[sid] = name
+        self._servers[sid] = server
+        self._sorted = None
+
+    def add(self, server):
+        with self._lock:
+            self._index(server)
+
+    def update(self, server):
+        with self._lock:
+            if server['id'] in self._servers:
+                self._index(server)
+
+    def delete(self, server_id):
+        with self._lock:
+            if self._servers.pop(server_id, None) is not None:
+                name = self._name_of.pop(server_id)
+                if self._names.get(name) == server_id:
+                    del self._names[name]
+                self._sorted = None
+
+    def bulk_import(self, servers, replace=False):
+        with self._lock:
+            if replace:
+                self._servers.clear()
+                self._names.clear()
+                self._name_of.clear()
+            for server in servers:
+                server.setdefault('id', str(uuid.uuid4()))
+                self._index(server)
+
+    # ---------- 持久化 ----------
+
+    def save(self):
+        """标记需要保存，延迟 delay 秒后在后台线程写入"""
+        with self._lock:
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """立即写入未保存的修改"""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                # 浅拷贝在持锁时完成，序列化和磁盘 IO 不阻塞调用方太久
+                snapshot = [dict(s) for s in self._servers.values()]
+                current = self.current_server_id
+            try:
+                atomic_write(self.path, dump_json_config(snapshot, current))
+                self.written = file_signature(self.path)
+                self.writes += 1
+            except Exception as e:
+                print(f"保存配置失败: {e}")
+
+    def export_json(self, path):
+        atomic_write(path, dump_json_config(self.all(), self.current_server_id))
+
+    def close(self):
+        self.flush()
+
+
+class SQLiteServerStore:
+    """SQLite (WAL) 存储，适合成百上千台服务器和订阅导入
+
+    服务器完整字段以 JSON 存在 data 列，id/name/tags 单独建索引；
+    语句均为固定 SQL，由 sqlite3 的语句缓存复用预编译结果。
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS servers (
+            id   TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_servers_name ON servers (name);
+        CREATE INDEX IF NOT EXISTS idx_servers_name_nocase ON servers (name COLLATE NOCASE);
+        CREATE TABLE IF NOT EXISTS server_tags (
+            server_id TEXT NOT NULL REFERENCES servers (id) ON DELETE CASCADE,
+            tag       TEXT NOT NULL,
+            PRIMARY KEY (server_id, tag)
+        );
+        CREATE INDEX IF NOT EXISTS idx_server_tags_tag ON server_tags (tag);
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT
+        );
+    '''
+
+    SQL_GET = 'SELECT data FROM servers WHERE id = ?'
+    SQL_FIRST = 'SELECT data FROM servers ORDER BY rowid LIMIT 1'
+    SQL_COUNT = 'SELECT COUNT(*) FROM servers'
+    SQL_ALL = 'SELECT data FROM servers ORDER BY rowid'
+    SQL_NAME = 'SELECT id FROM servers WHERE name = ?'
+    SQL_UPSERT = ('INSERT INTO servers (id, name, data) VALUES (?, ?, ?) '
+                  'ON CONFLICT (id) DO UPDATE SET name = excluded.name, data = excluded.data')
+    SQL_DELETE = 'DELETE FROM servers WHERE id = ?'
+    SQL_CLEAR_TAGS = 'DELETE FROM server_tags WHERE server_id = ?'
+    SQL_ADD_TAG = 'INSERT OR IGNORE INTO server_tags (server_id, tag) VALUES (?, ?)'
+    # 与 JSONServerStore 的 (name.lower(), name, id) 排序一致，界面按页追加时不会错位
+    SQL_PAGE = 'SELECT data FROM servers ORDER BY name COLLATE NOCASE, name, id LIMIT ? OFFSET ?'
+    SQL_PAGE_PREFIX = ('SELECT data FROM servers WHERE name LIKE ? ESCAPE \'\\\' '
+                       'ORDER BY name COLLATE NOCASE, name, id LIMIT ? OFFSET ?')
+    SQL_PAGE_TAG = ('SELECT s.data FROM servers s JOIN server_tags t ON t.server_id = s.id '
+                    'WHERE t.tag = ? ORDER BY s.name COLLATE NOCASE, s.name, s.id LIMIT ? OFFSET ?')
+    SQL_GET_META = 'SELECT value FROM meta WHERE key = ?'
+    SQL_SET_META = 'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)'
+
+    def __init__(self, path):
+        import sqlite3  # 只有启用 SQLite 存储时才导入
+        self.path = path
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, cached_statements=64)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        self._conn.executescript(self.SCHEMA)
+        self._lock = threading.RLock()
+        self._current = None
+
+    def _query_one(self, sql, params=()):
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return row[0] if row else None
+
+    def _rows(self, sql, params=()):
+        with self._lock:
+            return [json.loads(row[0]) for row in self._conn.execute(sql, params)]
+
+    def load(self):
+        self._current = self._query_one(self.SQL_GET_META, ('current_server_id',))
+
+    @property
+    def current_server_id(self):
+        return self._current
+
+    @current_server_id.setter
+    def current_server_id(self, value):
+        self._current = value
+        with self._lock, self._conn:
+            self._conn.execute(self.SQL_SET_META, ('current_server_id', value))
+
+    def get(self, server_id):
+        data = self._query_one(self.SQL_GET, (server_id,))
+        return json.loads(data) if data else None
+
+    def first(self):
+        data = self._query_one(self.SQL_FIRST)
+        return json.loads(data) if data else None
+
+    def count(self):
+        return self._query_one(self.SQL_COUNT)
+
+    def all(self):
+        return self._rows(self.SQL_ALL)
+
+    def name_exists(self, name, exclude_id=None):
+        owner = self._query_one(self.SQL_NAME, (name,))
+        return owner is not None and owner != exclude_id
+
+    def page(self, offset=0, limit=100, query='', tag=None):
+        """按名称排序分页；query 为名称前缀，走 name 索引"""
+        if tag:
+            return self._rows(self.SQL_PAGE_TAG, (tag, limit, offset))
+        if query:
+            escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            return self._rows(self.SQL_PAGE_PREFIX, (escaped + '%', limit, offset))
+        return self._rows(self.SQL_PAGE, (limit, offset))
+
+    def _write(self, servers):
+        rows = [(s['id'], s.get('name', ''), json.dumps(s, ensure_ascii=False, separators=(',', ':')))
+                for s in servers]
+        self._conn.executemany(self.SQL_UPSERT, rows)
+        self._conn.executemany(self.SQL_CLEAR_TAGS, [(s['id'],) for s in servers])
+        self._conn.executemany(self.SQL_ADD_TAG,
+                               [(s['id'], tag) for s in servers for tag in s.get('tags', ())])
+
+    def add(self, server):
+        with self._lock, self._conn:
+            self._write([server])
+
+    def update(self, server):
+        self.add(server)
+
+    def delete(self, server_id):
+        with self._lock, self._conn:
+            self._conn.execute(self.SQL_DELETE, (server_id,))
+
+    def bulk_import(self, servers, replace=False):
+        """单个事务批量写入"""
+        for server in servers:
+            server.setdefault('id', str(uuid.uuid4()))
+        with self._lock, self._conn:
+            if replace:
+                self._conn.execute('DELETE FROM servers')
+            self._write(servers)
+
+    def save(self):
+        """每次修改已在事务中提交，无需额外保存"""
+
+    def flush(self):
+        pass
+
+    def export_json(self, path):
+        atomic_write(path, dump_json_config(self.all(), self.current_server_id))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BaseConfigManager:
+    """配置管理器公共部分，子类只需确定 config_dir"""
+
+    def __init__(self, config_dir):
+        self.config_dir = config_dir
+        self.config_file = self.config_dir / 'config.json'
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        # 配置目录下存在 servers.db 时使用 SQLite 存储（由 use_sqlite 或 python -m echipa.config -sqlite 迁移生成）
+        if (self.config_dir / SQLITE_NAME).exists():
+            self.store = SQLiteServerStore(self.config_dir / SQLITE_NAME)
+        else:
+            self.store = JSONServerStore(self.config_file)
+        self.watcher = None
+        atexit.register(self.flush)
+
+    @property
+    def servers(self):
+        """全部服务器（列表副本，仅用于遍历/导出）"""
+        return self.store.all()
+
+    @property
+    def current_server_id(self):
+        return self.store.current_server_id
+
+    @current_server_id.setter
+    def current_server_id(self, value):
+        self.store.current_server_id = value
+
+    def load_config(self):
+        """加载配置"""
+        try:
+            self.store.load()
+        except Exception as e:
+            print(f"加载配置失败: {e}")
+            self.store.bulk_import([], replace=True)
+            self.store.current_server_id = None
+
+        if not self.store.count():
+            self.add_default_server()
+
+    def save_config(self):
+        """保存配置（防抖，后台原子写入）"""
+        self.store.save()
+
+    def flush(self):
+        """立即写入尚未保存的修改（退出前调用）"""
+        self.store.flush()
+
+    def add_default_server(self):
+        """添加默认服务器"""
+        server = default_server()
+        self.store.add(server)
+        self.current_server_id = server['id']
+        self.save_config()
+
+    def get_server(self, server_id):
+        """按 id 获取服务器配置的副本（两种存储一致），修改后需调用 update_server"""
+        server = self.store.get(server_id)
+        return dict(server) if server else None
+
+    def get_current_server(self):
+        """获取当前服务器配置的副本（两种存储一致），修改后需调用 update_server"""
+        server = self.store.get(self.current_server_id) if self.current_server_id else None
+        if server is None:
+            server = self.store.first()
+        return dict(server) if server else None
+
+    def update_server(self, server_data):
+        """更新服务器配置"""
+        self.store.update(server_data)
+
+    def add_server(self, server_data):
+        """添加服务器"""
+        if 'id' not in server_data:
+            server_data['id'] = str(uuid.uuid4())
+        self.store.add(server_data)
+        self.current_server_id = server_data['id']
+
+    def delete_server(self, server_id):
+        """删除服务器"""
+        self.store.delete(server_id)
+        if self.current_server_id == server_id:
+            first = self.store.first()
+            self.current_server_id = first['id'] if first else None
+
+    def name_exists(self, name, exclude_id=None):
+        """服务器名称是否已被占用"""
+        return self.store.name_exists(name, exclude_id)
+
+    def server_count(self):
+        return self.store.count()
+
+    def page_servers(self, offset=0, limit=100, query='', tag=None):
+        """按名称排序分页查询，供服务器列表使用"""
+        return self.store.page(offset, limit, query, tag)
+
+    def watch(self, callback, interval=1.0):
+        """监视 config.json 的外部修改；在后台线程解析并比较，有差异时调用 callback(diff)
+
+        callback 在监视线程中执行，应转交给界面线程后再调用 apply_diff。
+        SQLite 存储不监视 config.json（它只是导出副本）。
+        """
+        if not isinstance(self.store, JSONServerStore) or self.watcher:
+            return self.watcher
+        from echipa.watch import FileWatcher
+
+        def on_change():
+            if file_signature(self.config_file) == self.store.written:
+                return  # 自己刚写入的
+            try:
+                servers, current = read_json_config(self.config_file)
+            except (OSError, ValueError) as e:
+                print(f"读取外部修改的配置失败: {e}")
+                return
+            diff = diff_servers(self.store.all(), servers, self.current_server_id, current)
+            if diff:
+                callback(diff)
+
+        self.watcher = FileWatcher(self.config_file, on_change, interval).start()
+        return self.watcher
+
+    def stop_watching(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+
+    def apply_diff(self, diff, switch_current=True):
+        """应用 diff_servers 的结果（不会写回 config.json）"""
+        self.store.bulk_import(diff['added'])
+        for server in diff['changed']:
+            self.store.update(server)
+        for server_id in diff['removed']:
+            self.delete_server(server_id)
+        if switch_current and diff['current_server_id'] and self.store.get(diff['current_server_id']):
+            self.current_server_id = diff['current_server_id']
+
+    def use_sqlite(self):
+        """把当前配置迁移到 SQLite 存储（config.json 保留为导出副本），之后启动时自动使用 SQLite"""
+        if isinstance(self.store, SQLiteServerStore):
+            return False
+        self.stop_watching()
+        self.store.flush()
+        self.store.export_json(self.config_file)
+        store = SQLiteServerStore(self.config_dir / SQLITE_NAME)
+        store.bulk_import(self.store.all(), replace=True)
+        store.current_server_id = self.store.current_server_id
+        self.store = store
+        return True
+
+    def import_json(self, path, replace=False):
+        """从 config.json 格式导入服务器"""
+        servers, current = read_json_config(path)
+        self.store.bulk_import(servers, replace=replace)
+        if replace or not self.current_server_id:
+            self.current_server_id = current or (servers[0]['id'] if servers else None)
+        self.save_config()
+        return len(servers)
+
+    def export_json(self, path):
+        """导出为 config.json 格式"""
+        self.store.flush()
+        self.store.export_json(path)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m echipa.config', description='服务器配置存储')
+    parser.add_argument('-config-dir', type=Path, default=None, help='配置目录（默认与 gui.py 相同）')
+    parser.add_argument('-sqlite', action='store_true',
+                        help='迁移到 SQLite 存储并启用（config.json 保留为导出副本）')
+    parser.add_argument('-export', type=Path, default=None, metavar='FILE', help='导出为 config.json 格式')
+    args = parser.parse_args(argv)
+
+    manager = BaseConfigManager(args.config_dir or desktop_config_dir())
+    manager.load_config()
+    if args.sqlite:
+        if manager.use_sqlite():
+            print(f"已迁移 {manager.server_count()} 个服务器到 {manager.config_dir / SQLITE_NAME}")
+        else:
+            print(f"已在使用 SQLite 存储: {manager.config_dir / SQLITE_NAME}")
+    if args.export:
+        manager.export_json(args.export)
+        print(f"已导出 {manager.server_count()} 个服务器到 {args.export}")
+    if not (args.sqlite or args.export):
+        kind = 'SQLite' if isinstance(manager.store, SQLiteServerStore) else 'JSON'
+        print(f"{kind} 存储，{manager.server_count()} 个服务器，配置目录: {manager.config_dir}")
+    manager.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""
+本地控制与监控接口
+asyncio 实现的极简 HTTP/1.1 服务，可监听 localhost TCP 端口或 Unix 套接字
+
+    GET  /status              JSON 状态
+    GET  /metrics             Prometheus 文本格式（?format=json 或 Accept: application/json 时返回 JSON）
+    GET  /logs?since=N        最近的日志行
+    POST /start  /stop        启动/停止代理
+    POST /switch?server=名称  切换服务器（名称或 id）
+    POST /speedtest?mb=N      经本地代理端口测速（下载 N MB，见 echipa.speedtest），在后台运行
+    GET  /speedtest           正在测速的服务器、各服务器最近一次结果与下载速度排序
+    GET  /explain?host=a,b    这些主机走直连还是代理，以及决定的规则或绕过条目（见 echipa.explain）
+
+控制对象需提供 status() -> dict、command(name, arg) -> dict、logs(since) -> (下一序号, [行])、
+speed_tests() -> dict、explain(hosts) -> dict，以及 probe_addr() -> (host, port) 或 None，供定期探测本地代理端口的连接延迟。
+explain 需要解析域名，在线程池中调用，不阻塞 /metrics 等其他请求；其余方法在控制线程中直接调用，不应阻塞。
+
+浏览器中的网页也能向 localhost 发请求：带 Origin 头的请求，以及 Host 不是 IP、localhost 或监听地址的请求
+（DNS 重绑定）一律返回 403。curl、Prometheus 等不会发送 Origin。
+"""
+
+import asyncio
+import ipaddress
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+PROBE_INTERVAL = 5  # 秒
+MAX_HEADER_BYTES = 16 * 1024
+
+# (状态字段, 类型, 说明)；值为 None 的字段不输出
+METRICS = (
+    ('up', 'gauge', '代理进程是否在运行'),
+    ('uptime_seconds', 'gauge', '当前代理进程已运行的秒数'),
+    ('restarts_total', 'counter', '代理进程重启次数（含意外退出后的自动重启）'),
+    ('connections_total', 'counter', '经前置监听转发的连接数（仅平滑重启模式）'),
+    ('connections_active', 'gauge', '当前经前置监听转发的活动连接数（仅平滑重启模式）'),
+    ('connections_failed_total', 'counter', '前置监听连接后端失败次数（仅平滑重启模式）'),
+    ('ready_ms', 'gauge', '最近一次启动到就绪的耗时（毫秒）'),
+    ('probe_latency_ms', 'gauge', '最近一次探测本地代理端口的 TCP 连接耗时（毫秒）'),
+    ('probe_failures_total', 'counter', '探测本地代理端口失败次数'),
+    ('cpu_percent', 'gauge', '代理进程最近一个采样间隔的 CPU 占用（%）'),
+    ('rss_bytes', 'gauge', '代理进程常驻内存（字节）'),
+    ('open_fds', 'gauge', '代理进程打开的文件描述符数（Windows 为句柄数）'),
+    ('fd_limit', 'gauge', '代理进程打开文件数上限'),
+    ('threads', 'gauge', '代理进程线程数'),
+    ('log_backlog', 'gauge', '缓存中的日志行数'),
+    ('dns_cache_hit_rate', 'gauge', '本地 DNS 缓存命中率'),
+    ('scrapes_total', 'counter', '/metrics 请求次数'),
+)
+
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(status):
+    """把 status() 的结果转换为 Prometheus 文本格式"""
+    lines = [
+        '# HELP echipa_info 当前服务器信息',
+        '# TYPE echipa_info gauge',
+        f'echipa_info{{server="{_label(status.get("server") or "")}",'
+        f'listen="{_label(status.get("listen") or "")}"}} 1',
+    ]
+    for key, kind, text in METRICS:
+        value = status.get(key)
+        if value is None:
+            continue
+        name = f'echipa_{key}'
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {float(value):g}')
+    return '\n'.join(lines) + '\n'
+
+
+def process_status(server, supervisor, dns_forwarder=None, started_at=None, monitor=None):
+    """由 ProxySupervisor、ResourceMonitor 等对象汇总 status() 的公共字段（只读，可在控制线程中调用）"""
+    child = supervisor.child if supervisor else None
+    front = supervisor.front if supervisor else None
+    cache = dns_forwarder.cache if dns_forwarder else None
+    lookups = cache.hits + cache.misses if cache else 0
+    status = {
+        'server': server['name'] if server else None,
+        'server_id': server['id'] if server else None,
+        'listen': server['listen'] if server else None,
+        'up': 1 if child is not None and child.alive else 0,
+        'uptime_seconds': time.monotonic() - started_at if child is not None and started_at else None,
+        'restarts_total': supervisor.restarts if supervisor else 0,
+        'connections_total': front.accepted if front else None,
+        'connections_active': front.active() if front else None,
+        'connections_failed_total': front.failed if front else None,
+        'ready_ms': child.ready_ms if child is not None else None,
+        'dns_cache_hit_rate': cache.hits / lookups if lookups else None,
+    }
+    if monitor is not None and child is not None:
+        status.update(monitor.snapshot())
+    return status
+
+
+class ControlServer:
+    """在独立线程的事件循环中运行，不阻塞调用方"""
+
+    def __init__(self, controller, listen='127.0.0.1:30080', probe_interval=PROBE_INTERVAL):
+        self.controller = controller
+        self.listen = listen  # host:port 或 unix:/path/to.sock
+        self.probe_interval = probe_interval
+        self.probe_latency_ms = None
+        self.probe_failures = 0
+        self.scrapes = 0
+        self.last_scrape_us = 0.0  # 最近一次 /metrics 的服务端处理耗时
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._main = None
+        self._writers = set()
+        self._ready = threading.Event()
+        self._error = None
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='control', daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        if self._error:
+            raise self._error
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+        finally:
+            self._loop.close()
+
+    async def _serve(self):
+        if self.listen.startswith('unix:'):
+            path = self.listen[5:]
+            if os.path.exists(path):
+                os.unlink(path)
+            self._server = await asyncio.start_unix_server(self._handle, path)
+            os.chmod(path, 0o600)
+        else:
+            from echipa.dnsproxy import parse_addr
+            host, port = parse_addr(self.listen)
+            self._server = await asyncio.start_server(self._handle, host, port)
+        self._main = asyncio.current_task()
+        probe = asyncio.ensure_future(self._probe_loop())
+        self._ready.set()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            probe.cancel()
+
+    @property
+    def address(self):
+        if self._server is None:
+            return None
+        return self._server.sockets[0].getsockname()
+
+    def stop(self):
+        if self._loop and self._server:
+            self._loop.call_soon_threadsafe(self._shutdown)
+            self._thread.join(timeout=2)
+            if self.listen.startswith('unix:') and os.path.exists(self.listen[5:]):
+                os.unlink(self.listen[5:])
+
+    def _shutdown(self):
+        """关闭监听与现有连接（连接处理协程读到 EOF 后自行退出）"""
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        self._main.cancel()
+
+    # ---------- 探测 ----------
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            addr = self.controller.probe_addr()
+            if addr:
+                start = time.perf_counter()
+                try:
+                    _, writer = await asyncio.wait_for(asyncio.open_connection(*addr), timeout=2)
+                    self.probe_latency_ms = (time.perf_counter() - start) * 1000
+                    writer.close()
+                except (OSError, asyncio.TimeoutError):
+                    self.probe_latency_ms = None
+                    self.probe_failures += 1
+
+    # ---------- HTTP ----------
+
+    def status(self):
+        status = self.controller.status()
+        status['probe_latency_ms'] = self.probe_latency_ms
+        status['probe_failures_total'] = self.probe_failures
+        status['scrapes_total'] = self.scrapes
+        return status
+
+    def allowed(self, headers):
+        """拒绝浏览器网页发来的请求（跨站请求与 DNS 重绑定）"""
+        if 'origin' in headers:
+            return False
+        host = headers.get('host')
+        if not host or self.listen.startswith('unix:'):
+            return True  # 浏览器连不上 Unix 套接字
+        host = urlsplit('//' + host).hostname or ''
+        if host == 'localhost' or host == urlsplit('//' + self.listen).hostname:
+            return True
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return True
+
+    def dispatch(self, method, target, headers):
+        """返回 (状态码, Content-Type, 响应体字节)"""
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        path = url.path.rstrip('/') or '/'
+        if path == '/metrics' and method == 'GET':
+            start = time.perf_counter()
+            self.scrapes += 1
+            status = self.status()
+            if query.get('format') == 'json' or 'application/json' in headers.get('accept', ''):
+                body = json.dumps(status, ensure_ascii=False).encode('utf-8')
+                kind = 'application/json'
+            else:
+                body = render_prometheus(status).encode('utf-8')
+                kind = 'text/plain; version=0.0.4; charset=utf-8'
+            self.last_scrape_us = (time.perf_counter() - start) * 1e6
+            return 200, kind, body
+        if path == '/status' and method == 'GET':
+            return 200, 'application/json', json.dumps(self.status(), ensure_ascii=False).encode('utf-8')
+        if path == '/logs' and method == 'GET':
+            since, lines = self.controller.logs(int(query.get('since', 0)))
+            return 200, 'application/json', json.dumps({'next': since, 'lines': lines},
+                                                       ensure_ascii=False).encode('utf-8')
+        if path == '/speedtest' and method == 'GET':
+            return 200, 'application/json', json.dumps(self.controller.speed_tests(),
+                                                       ensure_ascii=False).encode('utf-8')
+        if path in ('/start', '/stop', '/switch', '/speedtest'):
+            if method != 'POST':
+                return 405, 'application/json', b'{"error":"use POST"}'
+            result = self.controller.command(path[1:], query.get('mb' if path == '/speedtest' else 'server'))
+            code = 200 if result.get('ok') else 400
+            return code, 'application/json', json.dumps(result, ensure_ascii=False).encode('utf-8')
+        return 404, 'application/json', b'{"error":"not found"}'
+
+    async def _explain(self, target):
+        """/explain：判定可能要解析域名，放到线程池中执行"""
+        query = {k: v[-1] for k, v in parse_qs(urlsplit(target).query).items()}
+        hosts = [host for host in query.get('host', '').split(',') if host.strip()]
+        if not hosts:
+            return 400, 'application/json', b'{"error":"missing host"}'
+        result = await asyncio.get_running_loop().run_in_executor(None, self.controller.explain, hosts)
+        return 200, 'application/json', json.dumps(result, ensure_ascii=False).encode('utf-8')
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                if len(head) > MAX_HEADER_BYTES:
+                    return
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # 无法确定请求体的边界，回复 400 后关闭连接
+                    headers['connection'] = 'close'
+                    code, kind, body = 400, 'application/json', b'{"error":"bad content-length"}'
+                elif not self.allowed(headers):
+                    headers['connection'] = 'close'
+                    code, kind, body = 403, 'application/json', b'{"error":"forbidden"}'
+                else:
+                    if length:
+                        await reader.readexactly(length)
+                    try:
+                        if urlsplit(target).path.rstrip('/') == '/explain' and method == 'GET':
+                            code, kind, body = await self._explain(target)
+                        else:
+                            code, kind, body = self.dispatch(method, target, headers)
+                    except Exception as e:
+                        code, kind, body = 500, 'application/json', json.dumps({'error': str(e)}).encode('utf-8')
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f'HTTP/1.1 {code} {REASONS[code]}\r\nContent-Type: {kind}\r\n'
+                    f'Content-Length: {len(body)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        finally:
+            self._writers.discard(writer)
+            writer.close()
@@ -0,0 +1,423 @@
+"""
+无界面守护进程（服务器、路由器等没有显示环境的 Linux 设备）
+与 gui.py 共用配置目录、服务器管理、子进程管理和分流设置，不导入 Qt/Toga
+
+用法:
+    python -m echipa -daemon [选项]
+    python gui.py -daemon [选项]
+
+信号: SIGHUP 重新加载配置（只在进程参数变化时重启），SIGTERM/SIGINT 停止
+-control 开启本地控制与监控接口（见 echipa.control）
+"""
+
+import argparse
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from echipa.config import DNS_CACHE_FIELDS, PROCESS_FIELDS, BaseConfigManager, desktop_config_dir
+
+# 子进程意外退出后的重启间隔（秒），稳定运行 STABLE_SECONDS 后重置
+BACKOFF_MIN = 1
+BACKOFF_MAX = 60
+STABLE_SECONDS = 60
+LOG_BACKLOG = 1000  # 控制接口 /logs 可取回的最近日志行数
+
+
+class Daemon:
+    """启动并守护当前服务器的 ech-workers 进程"""
+
+    def __init__(self, config_manager, server=None, system_proxy=False, watch=False, control=None):
+        self.config_manager = config_manager
+        self.server_ref = server  # 指定的服务器名称或 id，为空时使用当前服务器
+        self.system_proxy = system_proxy
+        self.watch = watch
+        self.control = control  # 控制接口监听地址（host:port 或 unix:/path）
+        self.server = None
+        self.supervisor = None
+        self.dns_forwarder = None
+        self.monitor = None  # 子进程资源监控（echipa.monitor）
+        self.bypass_ranges = {}  # 绕过的国家/地区代码 -> IP 段（routing.BypassRanges）
+        self.rule_set = None  # 规则分流（echipa.rules，首次使用时创建）
+        self.explainer = None  # 分流判定查询（echipa.explain，首次查询时创建，只在控制接口中使用）
+        self._explain_lock = threading.Lock()
+        self._rule_watchers = []
+        self._ech_cache = None
+        self._resolver = None  # ech-workers 路径解析（echipa.locator），-echfile 按其版本决定是否传递
+        self._speed_store = None  # 测速结果（echipa.speedtest，首次使用时创建）
+        self.speed_testing = None  # 正在测速的服务器 id
+        self.active = False  # 代理是否应当运行（控制接口 stop 后为 False，不自动重启）
+        self.started_at = None
+        self._log = deque(maxlen=LOG_BACKLOG)
+        self._log_seq = 0
+        self._commands = deque()
+        self._wake = threading.Event()
+        self._stop = False
+        self._reload = False
+
+    def log(self, text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        self._log.append(text)
+        self._log_seq += 1
+
+    def _find_server(self, ref):
+        """按 id 或名称查找服务器"""
+        cm = self.config_manager
+        server = cm.get_server(ref)
+        if server is None:
+            server = next((s for s in cm.servers if s.get('name') == ref), None)
+        return server
+
+    def _select_server(self):
+        if self.server_ref:
+            server = self._find_server(self.server_ref)
+            if server is None:
+                raise SystemExit(f"找不到服务器: {self.server_ref}")
+            return dict(server)
+        return dict(self.config_manager.get_current_server())
+
+    def _ech_file(self, server):
+        """预取 ECH 配置；旧版本 ech-workers 不支持 -echfile 时由其自行查询"""
+        if not (self._resolver and self._resolver.supports_ech_file):
+            return None
+        if self._ech_cache is None:
+            from echipa.ech import ECHConfigCache
+            self._ech_cache = ECHConfigCache(self.config_manager.config_dir, log=self.log)
+        return self._ech_cache.ensure(server.get('ech') or 'cloudflare-ech.com',
+                                      server.get('dns') or 'dns.alidns.com/dns-query')
+
+    def _find_executable(self):
+        from echipa.locator import BinaryResolver, default_candidates
+        root = Path(__file__).resolve().parent
+        resolver = self._resolver = BinaryResolver(
+            self.config_manager.config_dir, default_candidates(root.parent.parent, root / 'resources', Path.cwd()))
+        exe = resolver.resolve()
+        if exe:
+            self.log(f"[系统] 可执行文件: {exe} ({resolver.version or '未知版本'}，{resolver.last_lookup_ms:.1f}ms)\n")
+        return exe
+
+    def request_reload(self):
+        self._reload = True
+        self._wake.set()
+
+    def request_stop(self, *args):
+        self._stop = True
+        self._wake.set()
+
+    def start(self):
+        from echipa.runner import DRAIN_SECONDS, ProxySupervisor
+        exe = self._find_executable()
+        if not exe:
+            self.log("错误: 找不到 ech-workers 可执行文件!\n")
+            return False
+        self.server = self._select_server()
+        self.supervisor = ProxySupervisor(exe, self.log,
+                                          graceful=self.server.get('graceful_restart', False),
+                                          drain=self.server.get('drain_seconds', DRAIN_SECONDS))
+        self._launch()
+        from echipa.monitor import ResourceMonitor
+        self.monitor = ResourceMonitor(lambda: self.supervisor.pid, log=self.log).start()
+        return True
+
+    def _launch(self):
+        self.supervisor.start(self.server, self._ech_file(self.server))
+        self.active = True
+        self.started_at = time.monotonic()
+        self.log(f"[系统] 已启动服务器: {self.server['name']}\n")
+        self._start_dns_forwarder()
+        if self.system_proxy:
+            self._set_system_proxy(True)
+
+    def _halt(self):
+        if self.system_proxy:
+            self._set_system_proxy(False)
+        self._stop_dns_forwarder()
+        self.supervisor.stop()
+        self.active = False
+        self.log("[系统] 代理已停止（等待控制接口 start）\n")
+
+    def _start_dns_forwarder(self):
+        if not self.server.get('dns_cache'):
+            return
+        from echipa.config import dns_cache_listen
+        from echipa.dnsproxy import DNSForwarder
+        from echipa.runner import local_addr
+        try:
+            self.dns_forwarder = DNSForwarder(listen=dns_cache_listen(self.server),
+                                              proxy=local_addr(self.server['listen']), log=self.log)
+            self.dns_forwarder.start()
+        except Exception as e:
+            self.dns_forwarder = None
+            self.log(f"[DNS] 启动本地 DNS 缓存失败: {e}\n")
+
+    def _stop_dns_forwarder(self):
+        if self.dns_forwarder:
+            self.dns_forwarder.stop()
+            self.dns_forwarder = None
+
+    def _set_system_proxy(self, enabled):
+        from echipa.routing import bypass_countries, load_bypass_ranges, set_system_proxy
+        routing_mode = self.server.get('routing_mode', 'bypass_cn')
+        countries = self.server.get('bypass_countries')
+        key = bypass_countries(routing_mode, countries)
+        if enabled and key and self.bypass_ranges.get(key) is None:
+            self.bypass_ranges[key] = load_bypass_ranges(self.config_manager.config_dir, routing_mode,
+                                                         countries, self.log)
+        rules = self._get_rule_set() if enabled and routing_mode == 'rules' else None
+        set_system_proxy(enabled, self.server['listen'], routing_mode, self.bypass_ranges.get(key), self.log,
+                         countries, rules)
+
+    def _get_rule_set(self):
+        """当前服务器 rule_files 对应的规则集（只重新编译修改过的文件）；-watch 时规则文件修改后重新应用系统代理"""
+        from echipa.rules import RuleSet, rule_files
+        paths = rule_files(self.config_manager.config_dir, self.server.get('rule_files'))
+        if self.rule_set is None or self.rule_set.paths != paths:
+            self._stop_rule_watchers()
+            self.rule_set = RuleSet(paths, self.config_manager.config_dir, log=self.log)
+            if self.watch:
+                from echipa.watch import FileWatcher
+                self._rule_watchers = [FileWatcher(path, self._rules_changed).start() for path in paths]
+        self.rule_set.refresh()
+        return self.rule_set
+
+    def _rules_changed(self):
+        self._commands.append(('rules', None))
+        self._wake.set()
+
+    def _stop_rule_watchers(self):
+        for watcher in self._rule_watchers:
+            watcher.stop()
+        self._rule_watchers = []
+
+    def reload(self):
+        """重新读取配置；服务器的进程参数变化时才重启"""
+        self.config_manager.load_config()
+        try:
+            server = self._select_server()
+        except SystemExit as e:
+            self.log(f"[配置] {e}，保持当前配置\n")
+            return
+        old = self.server
+        if server['id'] == old['id'] and all(server.get(k) == old.get(k) for k in PROCESS_FIELDS):
+            self.server = server
+            if self.active and any(server.get(k) != old.get(k) for k in DNS_CACHE_FIELDS):
+                self.log("[配置] 已重新加载，只重启本地 DNS 缓存\n")
+                self._stop_dns_forwarder()
+                self._start_dns_forwarder()
+            else:
+                self.log("[配置] 已重新加载，进程参数未变化\n")
+            return
+        self.server = server
+        if not self.active:
+            self.log(f"[配置] 已重新加载，当前服务器: {server['name']}\n")
+            return
+        self.log(f"[配置] 已重新加载，重启服务器: {server['name']}\n")
+        self.supervisor.restart(server, self._ech_file(server))
+        self.started_at = time.monotonic()
+        if any(server.get(k) != old.get(k) for k in ('listen',) + DNS_CACHE_FIELDS):
+            self._stop_dns_forwarder()
+            self._start_dns_forwarder()
+        if self.system_proxy and (server['listen'] != old['listen'] or
+                                  any(server.get(k) != old.get(k)
+                                      for k in ('routing_mode', 'bypass_countries', 'rule_files'))):
+            self._set_system_proxy(True)
+
+    # ---------- 控制接口（在控制线程中调用，只读取状态或排队命令） ----------
+
+    def status(self):
+        from echipa.control import process_status
+        status = process_status(self.server, self.supervisor, self.dns_forwarder, self.started_at, self.monitor)
+        status['log_backlog'] = len(self._log)
+        return status
+
+    def logs(self, since=0):
+        """返回 (下一序号, since 之后仍在缓存中的日志行)"""
+        first = self._log_seq - len(self._log)
+        lines = list(self._log)[max(0, since - first):]
+        return self._log_seq, lines
+
+    def _get_speed_store(self):
+        if self._speed_store is None:
+            from echipa.speedtest import SpeedTestStore
+            self._speed_store = SpeedTestStore(self.config_manager.config_dir)
+        return self._speed_store
+
+    def speed_tests(self):
+        return self._get_speed_store().report(self.speed_testing)
+
+    def explain(self, hosts):
+        """当前服务器分流设置下各主机的判定（见 echipa.explain；在控制线程的线程池中调用）
+
+        只使用设置系统代理时已加载的 IP 段与规则集，不下载、不创建规则集；没有加载时按默认列表判定。
+        """
+        from echipa.explain import RouteExplainer
+        from echipa.routing import bypass_countries
+        server = self.server or {}
+        routing_mode = server.get('routing_mode', 'bypass_cn')
+        countries = server.get('bypass_countries')
+        ranges = self.bypass_ranges.get(bypass_countries(routing_mode, countries))
+        rules = self.rule_set if routing_mode == 'rules' else None
+        with self._explain_lock:
+            if self.explainer is None:
+                self.explainer = RouteExplainer(routing_mode, ranges, countries, rules)
+            else:
+                self.explainer.update(routing_mode, ranges, countries, rules)
+            results = [decision.to_dict() for decision in self.explainer.explain_many(hosts)]
+            return {'ok': True, 'mode': routing_mode, 'results': results, 'cache': self.explainer.stats()}
+
+    def probe_addr(self):
+        if not (self.active and self.server):
+            return None
+        from echipa.runner import local_addr
+        return local_addr(self.server['listen'])
+
+    def command(self, name, arg=None):
+        if name == 'switch':
+            server = self._find_server(arg) if arg else None
+            if server is None:
+                return {'ok': False, 'error': f'找不到服务器: {arg}'}
+            arg = server['id']
+        elif name == 'speedtest':
+            from echipa.speedtest import parse_size
+            if not self.active:
+                return {'ok': False, 'error': '代理未运行'}
+            if self.speed_testing:
+                return {'ok': False, 'error': '正在测速'}
+            try:
+                arg = parse_size(arg)
+            except ValueError as e:
+                return {'ok': False, 'error': str(e)}
+        elif name not in ('start', 'stop'):
+            return {'ok': False, 'error': f'未知命令: {name}'}
+        self._commands.append((name, arg))
+        self._wake.set()
+        return {'ok': True, 'queued': name}
+
+    def _run_command(self, name, arg):
+        if name == 'start' and not self.active:
+            self._launch()
+        elif name == 'stop' and self.active:
+            self._halt()
+        elif name == 'switch':
+            self.server_ref = arg
+            self.config_manager.current_server_id = arg
+            self.config_manager.save_config()
+            self.config_manager.flush()  # reload 会重新读取 config.json
+            self.reload()
+        elif name == 'rules' and self.active and self.system_proxy and self.server.get('routing_mode') == 'rules':
+            self._set_system_proxy(True)  # 规则文件已修改
+        elif name == 'speedtest' and self.active and not self.speed_testing:
+            self.speed_testing = self.server['id']
+            threading.Thread(target=self._speed_test, args=(dict(self.server), arg),
+                             name='speedtest', daemon=True).start()
+
+    def _speed_test(self, server, mb):
+        """在后台线程测速，不阻塞主循环的重启与信号处理"""
+        from echipa.speedtest import test_server
+        try:
+            test_server(server, self._get_speed_store(), mb, log=self.log)
+        except Exception as e:
+            self.log(f"[测速] 失败: {e}\n")
+        finally:
+            self.speed_testing = None
+
+    def stop(self):
+        if self.system_proxy and self.active:
+            self._set_system_proxy(False)
+        self._stop_dns_forwarder()
+        if self.monitor:
+            self.monitor.stop()
+        if self.supervisor:
+            self.supervisor.stop()
+        self.config_manager.stop_watching()
+        self._stop_rule_watchers()
+        self.config_manager.flush()
+        self.log("[系统] 进程已停止。\n")
+
+    def run(self):
+        """主循环：处理信号请求，子进程意外退出时按退避间隔重启"""
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda *args: self.request_reload())
+        if not self.start():
+            return 1
+        if self.watch:
+            self.config_manager.watch(lambda diff: self.request_reload())
+        if self.control:
+            from echipa.control import ControlServer
+            control = ControlServer(self, self.control).start()
+            self.log(f"[系统] 控制接口: {self.control}\n")
+
+        backoff = BACKOFF_MIN
+        started = self.started_at
+        restart_at = None
+        while not self._stop:
+            timeout = 1.0 if restart_at is None else max(0.0, min(1.0, restart_at - time.monotonic()))
+            self._wake.wait(timeout)
+            self._wake.clear()
+            if self._stop:
+                break
+            while self._commands:
+                self._run_command(*self._commands.popleft())
+            if self._reload:
+                self._reload = False
+                self.reload()
+            if not (self.active and self.supervisor.child is None):
+                restart_at = None
+                continue
+            now = time.monotonic()
+            if restart_at is None:
+                if now - started > STABLE_SECONDS:
+                    backoff = BACKOFF_MIN
+                self.log(f"[系统] ech-workers 已退出，{backoff}s 后重启\n")
+                restart_at = now + backoff
+            elif now >= restart_at:
+                self.supervisor.restart(self.server, self._ech_file(self.server))
+                started = self.started_at = time.monotonic()
+                restart_at = None
+                backoff = min(backoff * 2, BACKOFF_MAX)
+        if self.control:
+            control.stop()
+        self.stop()
+        return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='echipa -daemon', description='ECH Workers 无界面守护进程')
+    parser.add_argument('-daemon', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('-config-dir', type=Path, default=None,
+                        help='配置目录（默认与桌面客户端相同）')
+    parser.add_argument('-server', default=None, help='服务器名称或 id（默认使用当前服务器）')
+    parser.add_argument('-list', action='store_true', help='列出服务器后退出')
+    parser.add_argument('-system-proxy', action='store_true', help='启动时设置系统代理，退出时清理（Windows/macOS）')
+    parser.add_argument('-watch', action='store_true', help='监视 config.json，修改后自动重新加载')
+    parser.add_argument('-sqlite', action='store_true',
+                        help='把配置迁移到 SQLite 存储并启用（适合大量服务器；之后不再监视 config.json）')
+    parser.add_argument('-control', default=None, metavar='ADDR',
+                        help='本地控制与监控接口，如 127.0.0.1:30080 或 unix:/run/echipa.sock')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config_manager = BaseConfigManager(args.config_dir or desktop_config_dir())
+    config_manager.load_config()
+    if args.sqlite and config_manager.use_sqlite():
+        print(f"[配置] 已迁移到 SQLite 存储，共 {config_manager.server_count()} 个服务器")
+    if args.list:
+        current = config_manager.current_server_id
+        for server in config_manager.page_servers(0, config_manager.server_count()):
+            mark = '*' if server['id'] == current else ' '
+            print(f"{mark} {server['name']}\t{server.get('server', '')}\t{server.get('listen', '')}\t{server['id']}")
+        return 0
+    return Daemon(config_manager, server=args.server, system_proxy=args.system_proxy, watch=args.watch,
+                  control=args.control).run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
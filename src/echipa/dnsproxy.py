@@ -0,0 +1,217 @@
+"""
+本地 DNS 转发器
+带 TTL 的 LRU 缓存 + 相同查询合并，未命中时经持久 DoH 连接转发
+"""
+
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from echipa import doh
+from echipa.config import DNS_CACHE_LISTEN
+
+# 经代理转发时使用的上游（与 ech-workers 的 UDP-DNS 路径一致）
+PROXY_UPSTREAM = 'https://cloudflare-dns.com/dns-query'
+DEFAULT_LISTEN = DNS_CACHE_LISTEN
+
+
+def parse_addr(addr, default_host='127.0.0.1'):
+    """解析 host:port 地址"""
+    if ':' not in addr:
+        return default_host, int(addr)
+    host, port = addr.rsplit(':', 1)
+    return host.strip('[]') or default_host, int(port)
+
+
+class DNSCache:
+    """LRU + TTL 缓存，键为 (qname, qtype, qclass)"""
+
+    def __init__(self, capacity=4096, min_ttl=5, max_ttl=3600, negative_ttl=30):
+        self.capacity = capacity
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, qid):
+        """命中时返回改写了 ID 和剩余 TTL 的响应，否则返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            response, expires, stored = entry
+        return doh.rewrite_response(response, qid, now - stored)
+
+    def put(self, key, response):
+        """按响应中最小 TTL 缓存；SERVFAIL 等错误不缓存"""
+        code = doh.rcode(response)
+        if code == doh.RCODE_NXDOMAIN:
+            ttl = self.negative_ttl
+        elif code != 0:
+            return
+        else:
+            ttl = doh.min_ttl(response, self.negative_ttl)
+        ttl = max(self.min_ttl, min(ttl, self.max_ttl))
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (response, now + ttl, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DNSForwarder:
+    """UDP DNS 转发器：缓存命中在接收线程直接应答，未命中交给线程池"""
+
+    def __init__(self, listen=DEFAULT_LISTEN, upstream=PROXY_UPSTREAM, proxy=None,
+                 cache_size=4096, workers=8, client=None, log=None):
+        self.listen = listen
+        self.cache = DNSCache(cache_size)
+        self.client = client or doh.DoHClient(upstream, pool_size=2, proxy=proxy)
+        self.log = log or (lambda text: None)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dns')
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._sock = None
+        self._thread = None
+        self._running = False
+        self.coalesced = 0
+        self.errors = 0
+        self._latencies = []
+        self._stats_lock = threading.Lock()  # errors 与 _latencies 由线程池中的多个线程更新
+
+    def start(self):
+        """绑定端口并启动接收线程"""
+        host, port = parse_addr(self.listen)
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        self._sock = socket.socket(family, socket.SOCK_DGRAM)
+        self._sock.bind((host, port))
+        self._sock.settimeout(1.0)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self.log(f"[DNS] 本地 DNS 缓存已启动: {self.listen} -> {self.client.url}\n")
+
+    @property
+    def address(self):
+        """实际监听地址（端口为 0 时由系统分配）"""
+        return self._sock.getsockname()[:2] if self._sock else None
+
+    def stop(self):
+        """停止服务并关闭上游连接"""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        self._executor.shutdown(wait=False)
+        self.client.close()
+
+    def _serve(self):
+        while self._running:
+            try:
+                data, addr = self._sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                self._handle(data, addr)
+            except (ValueError, IndexError, struct.error):
+                # 格式错误的报文直接丢弃，接收线程继续服务
+                continue
+            except Exception as e:
+                self.log(f"[DNS] 处理查询失败: {e}\n")
+
+    def _handle(self, data, addr):
+        key = doh.parse_question(data)
+        qid = doh.message_id(data)
+        cached = self.cache.get(key, qid)
+        if cached is not None:
+            self._send(cached, addr)
+            return
+        self._lookup(key, data).add_done_callback(lambda fut: self._reply(fut, qid, addr))
+
+    def _send(self, response, addr):
+        sock = self._sock  # stop() 之后完成的查询不再应答
+        if sock is None:
+            return
+        try:
+            sock.sendto(response, addr)
+        except OSError:
+            pass
+
+    def _reply(self, future, qid, addr):
+        if future.exception() is None:
+            self._send(doh.rewrite_response(future.result(), qid), addr)
+
+    def _lookup(self, key, query):
+        """相同的 (qname, qtype) 在途时复用同一个 Future"""
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = Future()
+            self._inflight[key] = future
+        self._executor.submit(self._forward, key, query, future)
+        return future
+
+    def _forward(self, key, query, future):
+        start = time.perf_counter()
+        try:
+            response = self.client.query(query)
+            self.cache.put(key, response)
+            future.set_result(response)
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+            self.log(f"[DNS] 上游查询失败 {key[0]}: {e}\n")
+            future.set_exception(e)
+        finally:
+            with self._stats_lock:
+                self._latencies.append((time.perf_counter() - start) * 1000)
+                if len(self._latencies) > 1024:
+                    del self._latencies[:512]
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        """命中率、合并次数与上游延迟统计"""
+        lookups = self.cache.hits + self.cache.misses
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            errors = self.errors
+        return {
+            'entries': len(self.cache),
+            'hits': self.cache.hits,
+            'misses': self.cache.misses,
+            'hit_rate': self.cache.hits / lookups if lookups else 0.0,
+            'coalesced': self.coalesced,
+            'errors': errors,
+            'upstream_requests': self.client.requests,
+            'upstream_connects': self.client.connects,
+            'upstream_p50_ms': latencies[len(latencies) // 2] if latencies else 0.0,
+            'upstream_p95_ms': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        }
@@ -0,0 +1,282 @@
+"""
+DoH 客户端与 DNS 报文工具
+持久连接池复用 HTTPS 连接，可选经本地 SOCKS5 代理转发
+"""
+
+import http.client
+import queue
+import socket
+import ssl
+import struct
+import threading
+from urllib.parse import urlsplit
+
+TYPE_A = 1
+TYPE_AAAA = 28
+TYPE_OPT = 41
+TYPE_HTTPS = 65
+
+RCODE_NXDOMAIN = 3
+
+DEFAULT_DOH = 'dns.alidns.com/dns-query'
+
+
+def normalize_doh_url(server):
+    """补全 DoH 地址（与 ech-workers 的 -dns 参数格式一致）"""
+    if not server.startswith('https://') and not server.startswith('http://'):
+        server = 'https://' + server
+    return server
+
+
+def build_query(name, qtype, qid=0):
+    """构建 DNS 查询报文（RD=1）"""
+    msg = bytearray(struct.pack('!HHHHHH', qid, 0x0100, 1, 0, 0, 0))
+    for label in name.rstrip('.').split('.'):
+        if label:
+            raw = label.encode('idna')
+            msg.append(len(raw))
+            msg += raw
+    msg += b'\x00' + struct.pack('!HH', qtype, 1)
+    return bytes(msg)
+
+
+def _read_name(msg, offset):
+    """读取（可能压缩的）域名，返回 (name, 结束偏移)"""
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        length = msg[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | msg[offset + 1]
+            jumps += 1
+            if jumps > 32:
+                raise ValueError('DNS 名称压缩指针循环')
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(msg[offset:offset + length].decode('ascii', 'replace'))
+        offset += length
+    return '.'.join(labels), (end if end is not None else offset)
+
+
+def _skip_name(msg, offset):
+    """跳过域名，返回结束偏移"""
+    while True:
+        length = msg[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1
+        if length == 0:
+            return offset
+        offset += length
+
+
+def parse_question(msg):
+    """解析查询问题，返回 (qname, qtype, qclass)，名称统一小写；报文不完整时抛出 ValueError"""
+    if len(msg) < 12:
+        raise ValueError('DNS 报文过短')
+    qdcount = struct.unpack_from('!H', msg, 4)[0]
+    if qdcount < 1:
+        raise ValueError('DNS 报文没有问题段')
+    try:
+        name, offset = _read_name(msg, 12)
+        qtype, qclass = struct.unpack_from('!HH', msg, offset)
+    except (IndexError, struct.error):
+        raise ValueError('DNS 报文被截断') from None
+    return name.lower(), qtype, qclass
+
+
+def message_id(msg):
+    """读取报文 ID"""
+    return struct.unpack_from('!H', msg, 0)[0]
+
+
+def rcode(msg):
+    """读取响应码"""
+    return msg[3] & 0x0F
+
+
+def iter_records(msg):
+    """遍历应答/授权/附加段，产出 (ttl 偏移, 类型, ttl, rdata 偏移, rdata 长度)"""
+    qdcount, ancount, nscount, arcount = struct.unpack_from('!HHHH', msg, 4)
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_name(msg, offset) + 4
+    for _ in range(ancount + nscount + arcount):
+        offset = _skip_name(msg, offset)
+        rtype, _, ttl, rdlen = struct.unpack_from('!HHIH', msg, offset)
+        yield offset + 4, rtype, ttl, offset + 10, rdlen
+        offset += 10 + rdlen
+
+
+def min_ttl(msg, default=None):
+    """响应中最小的 TTL（忽略 OPT 伪记录）"""
+    ttls = [ttl for _, rtype, ttl, _, _ in iter_records(msg) if rtype != TYPE_OPT]
+    return min(ttls) if ttls else default
+
+
+def rewrite_response(msg, qid, elapsed=0):
+    """替换报文 ID，并将所有 TTL 减去已缓存的秒数"""
+    out = bytearray(msg)
+    struct.pack_into('!H', out, 0, qid)
+    if elapsed > 0:
+        for ttl_offset, rtype, ttl, _, _ in iter_records(msg):
+            if rtype != TYPE_OPT:
+                struct.pack_into('!I', out, ttl_offset, max(ttl - int(elapsed), 0))
+    return bytes(out)
+
+
+def extract_ech_config(msg):
+    """从 HTTPS 记录中提取 ECHConfigList（SvcParam key=5），返回 (raw, ttl)"""
+    for _, rtype, ttl, rdata, rdlen in iter_records(msg):
+        if rtype != TYPE_HTTPS:
+            continue
+        end = rdata + rdlen
+        offset = _skip_name(msg, rdata + 2)
+        while offset + 4 <= end:
+            key, length = struct.unpack_from('!HH', msg, offset)
+            offset += 4
+            if key == 5:
+                return bytes(msg[offset:offset + length]), ttl
+            offset += length
+    return None, None
+
+
+def socks5_connect(proxy, host, port, timeout):
+    """经 SOCKS5 代理建立到 host:port 的 TCP 连接"""
+    sock = socket.create_connection(proxy, timeout=timeout)
+    try:
+        sock.sendall(b'\x05\x01\x00')
+        if sock.recv(2) != b'\x05\x00':
+            raise ConnectionError('SOCKS5 握手失败')
+        raw = host.encode('idna')
+        sock.sendall(b'\x05\x01\x00\x03' + bytes([len(raw)]) + raw + struct.pack('!H', port))
+        reply = b''
+        while len(reply) < 10:
+            chunk = sock.recv(10 - len(reply))
+            if not chunk:
+                raise ConnectionError('SOCKS5 连接被关闭')
+            reply += chunk
+        if reply[1] != 0x00:
+            raise ConnectionError(f'SOCKS5 连接失败: 0x{reply[1]:02x}')
+        return sock
+    except Exception:
+        sock.close()
+        raise
+
+
+class _ProxiedHTTPSConnection(http.client.HTTPSConnection):
+    """经 SOCKS5 代理的 HTTPS 连接"""
+
+    def __init__(self, host, port, proxy, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self._proxy = proxy
+
+    def connect(self):
+        sock = socks5_connect(self._proxy, self.host, self.port, self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """连接到指定 IP，但 SNI/证书校验仍使用原域名"""
+
+    def __init__(self, host, port, ip, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self._ip = ip
+
+    def connect(self):
+        sock = socket.create_connection((self._ip, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class DoHClient:
+    """DoH 客户端（RFC 8484 POST），连接保持并在线程间复用"""
+
+    def __init__(self, url=DEFAULT_DOH, timeout=10, pool_size=2, proxy=None, ip=None):
+        parts = urlsplit(normalize_doh_url(url))
+        self.url = parts.geturl()
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.path = parts.path or '/dns-query'
+        if parts.query:
+            self.path += '?' + parts.query
+        self.timeout = timeout
+        self.proxy = proxy
+        self.ip = ip
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._context = ssl.create_default_context() if self.scheme == 'https' else None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connects = 0
+
+    def _new_connection(self):
+        self.connects += 1
+        if self.scheme != 'https':
+            return http.client.HTTPConnection(self.ip or self.host, self.port, timeout=self.timeout)
+        if self.proxy:
+            return _ProxiedHTTPSConnection(self.host, self.port, self.proxy,
+                                           timeout=self.timeout, context=self._context)
+        if self.ip:
+            return _PinnedHTTPSConnection(self.host, self.port, self.ip,
+                                          timeout=self.timeout, context=self._context)
+        return http.client.HTTPSConnection(self.host, self.port,
+                                           timeout=self.timeout, context=self._context)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def query(self, wire):
+        """发送 DNS 报文，返回响应报文；复用的连接失效时重连一次"""
+        headers = {
+            'Content-Type': 'application/dns-message',
+            'Accept': 'application/dns-message',
+        }
+        for attempt in range(2):
+            conn = self._acquire()
+            reused = conn.sock is not None
+            try:
+                conn.request('POST', self.path, body=wire, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            with self._lock:
+                self.requests += 1
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            if resp.status != 200:
+                raise ConnectionError(f'DoH 服务器返回错误: {resp.status}')
+            return body
+        raise ConnectionError('DoH 请求失败')
+
+    def resolve(self, name, qtype):
+        """查询域名，返回响应报文"""
+        return self.query(build_query(name, qtype))
+
+    def close(self):
+        """关闭连接池中的所有连接"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
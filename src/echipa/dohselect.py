@@ -0,0 +1,193 @@
+"""
+DoH 服务器测速与自动选择（服务器配置的 dns 字段，ech-workers 用它查询 ECH 的 HTTPS 记录）
+
+并发测试候选列表中的每个 DoH 服务器：每个服务器一个复用的连接，连续查询 ROUNDS 次 HTTPS 记录，
+统计首次查询（含建连与 TLS 握手）耗时、复用连接后的延迟分位数、成功率，
+以及返回的 ECHConfigList 与多数服务器是否一致（过期缓存或被篡改的应答会不一致）。
+
+结果连同本机网络指纹缓存在配置目录的 doh_benchmark.json；网络未变化且未超过 CACHE_SECONDS 时直接使用缓存。
+
+    python -m echipa.dohselect [-apply] [-force] [候选 DoH 地址 ...]
+"""
+
+import argparse
+import json
+import socket
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from echipa import doh
+from echipa.config import BaseConfigManager, atomic_write, desktop_config_dir
+from echipa.ech import DEFAULT_ECH_DOMAIN
+
+CANDIDATES = (
+    'dns.alidns.com/dns-query',
+    'doh.pub/dns-query',
+    'cloudflare-dns.com/dns-query',
+    'dns.google/dns-query',
+    'dns.quad9.net/dns-query',
+    'doh.opendns.com/dns-query',
+)
+ROUNDS = 5
+TIMEOUT = 5
+MIN_SUCCESS = 0.8  # 成功率低于该值的服务器不参与选择
+CACHE_NAME = 'doh_benchmark.json'
+CACHE_SECONDS = 24 * 3600  # 网络未变化时缓存的最长时间
+
+# 只用于路由查询，不会发送数据（RFC 5737 / RFC 3849 文档地址）
+_PROBE_ADDRS = ((socket.AF_INET, '198.51.100.1'), (socket.AF_INET6, '2001:db8::1'))
+
+
+def network_fingerprint():
+    """本机访问公网时使用的源地址（IPv4 与 IPv6）；切换 Wi-Fi、有线或 VPN 后通常会变化"""
+    parts = []
+    for family, addr in _PROBE_ADDRS:
+        try:
+            with socket.socket(family, socket.SOCK_DGRAM) as sock:
+                sock.connect((addr, 53))
+                parts.append(sock.getsockname()[0])
+        except OSError:
+            parts.append('')
+    return '|'.join(parts)
+
+
+def benchmark_endpoint(url, domain=DEFAULT_ECH_DOMAIN, rounds=ROUNDS, timeout=TIMEOUT):
+    """对单个 DoH 服务器连续查询 rounds 次，返回统计与每次得到的 ECHConfigList"""
+    client = doh.DoHClient(url, timeout=timeout, pool_size=1)
+    latencies = []
+    answers = []
+    error = None
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            try:
+                msg = client.resolve(domain, doh.TYPE_HTTPS)
+                config, _ = doh.extract_ech_config(msg)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            answers.append(config)
+    finally:
+        client.close()
+    warm = sorted(latencies[1:] or latencies)  # 第一次查询包含建连与 TLS 握手
+    return {
+        'url': url,
+        'queries': rounds,
+        'success_rate': len(latencies) / rounds,
+        'first_ms': round(latencies[0], 1) if latencies else None,
+        'p50_ms': round(statistics.median(warm), 1) if warm else None,
+        'p90_ms': round(warm[min(len(warm) - 1, int(len(warm) * 0.9))], 1) if warm else None,
+        'connects': client.connects,
+        'error': error,
+        'answers': answers,
+    }
+
+
+def score_results(results):
+    """按多数答案计算一致性并排序：一致且成功率达标的在前，其次按复用连接后的中位延迟"""
+    votes = Counter(answer for r in results for answer in r['answers'] if answer)
+    majority = votes.most_common(1)[0][0] if votes else None
+    for r in results:
+        answers = r.pop('answers')
+        r['has_ech'] = any(answers)
+        r['consistency'] = round(sum(a == majority for a in answers) / len(answers), 2) if answers else 0.0
+
+    def key(r):
+        usable = r['success_rate'] >= MIN_SUCCESS and r['consistency'] == 1.0 and r['has_ech']
+        return (not usable, r['p50_ms'] if r['p50_ms'] is not None else float('inf'), -r['success_rate'])
+    results.sort(key=key)
+    return results
+
+
+def benchmark(candidates=CANDIDATES, domain=DEFAULT_ECH_DOMAIN, rounds=ROUNDS, timeout=TIMEOUT, log=None):
+    """并发测试所有候选服务器，返回报告 {'time', 'fingerprint', 'domain', 'best', 'results'}"""
+    log = log or (lambda text: None)
+    candidates = list(dict.fromkeys(candidates))  # 去重并保持顺序
+    log(f"[DoH] 测试 {len(candidates)} 个服务器（每个 {rounds} 次 HTTPS 记录查询）...\n")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(candidates) or 1) as pool:
+        results = list(pool.map(lambda url: benchmark_endpoint(url, domain, rounds, timeout), candidates))
+    results = score_results(results)
+    best = results[0] if results else None
+    usable = best and best['success_rate'] >= MIN_SUCCESS and best['consistency'] == 1.0 and best['has_ech']
+    report = {
+        'time': time.time(),
+        'fingerprint': network_fingerprint(),
+        'domain': domain,
+        'best': best['url'] if usable else None,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000),
+        'results': results,
+    }
+    for r in results:
+        if r['p50_ms'] is None:
+            log(f"[DoH] {r['url']}: 失败（{r['error']}）\n")
+        else:
+            log(f"[DoH] {r['url']}: {r['p50_ms']:.0f}ms（首次 {r['first_ms']:.0f}ms），成功率 "
+                f"{r['success_rate']:.0%}，一致性 {r['consistency']:.0%}\n")
+    log(f"[DoH] 最佳: {report['best'] or '无可用服务器'}（{report['elapsed_ms']}ms）\n")
+    return report
+
+
+class DoHSelector:
+    """带缓存的 DoH 服务器选择；网络指纹或 ECH 域名变化时重新测试"""
+
+    def __init__(self, config_dir, log=None):
+        self.path = config_dir / CACHE_NAME
+        self.log = log or (lambda text: None)
+        self._lock = threading.Lock()
+
+    def cached(self, domain=DEFAULT_ECH_DOMAIN):
+        """当前网络下仍有效的报告；没有时返回 None"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (report.get('domain') != domain or time.time() - report.get('time', 0) > CACHE_SECONDS
+                or report.get('fingerprint') != network_fingerprint()):
+            return None
+        return report
+
+    def select(self, candidates=CANDIDATES, domain=DEFAULT_ECH_DOMAIN, force=False):
+        """返回报告（优先使用缓存）；候选列表与缓存中的不同时也重新测试"""
+        with self._lock:
+            report = None if force else self.cached(domain)
+            if report and {r['url'] for r in report['results']} >= set(candidates):
+                self.log(f"[DoH] 使用缓存的测试结果，最佳: {report['best'] or '无可用服务器'}\n")
+                return report
+            report = benchmark(candidates, domain, log=self.log)
+            atomic_write(self.path, json.dumps(report, ensure_ascii=False, indent=1))
+            return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m echipa.dohselect', description='DoH 服务器测速与自动选择')
+    parser.add_argument('candidates', nargs='*', help='候选 DoH 地址（默认使用内置列表与当前服务器的 dns）')
+    parser.add_argument('-config-dir', type=Path, default=None, help='配置目录（默认与 gui.py 相同）')
+    parser.add_argument('-apply', action='store_true', help='把最佳服务器写入当前服务器配置')
+    parser.add_argument('-force', action='store_true', help='忽略缓存重新测试')
+    args = parser.parse_args(argv)
+
+    manager = BaseConfigManager(args.config_dir or desktop_config_dir())
+    manager.load_config()
+    server = manager.get_current_server()
+    candidates = args.candidates or [server.get('dns') or doh.DEFAULT_DOH, *CANDIDATES]
+    selector = DoHSelector(manager.config_dir, log=sys.stderr.write)
+    report = selector.select(candidates, server.get('ech') or DEFAULT_ECH_DOMAIN, force=args.force)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.apply and report['best'] and report['best'] != server.get('dns'):
+        manager.update_server(dict(server, dns=report['best']))
+        manager.save_config()
+        manager.flush()
+        print(f"已将服务器 \"{server['name']}\" 的 DoH 设置为 {report['best']}", file=sys.stderr)
+    return 0 if report['best'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
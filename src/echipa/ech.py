@@ -0,0 +1,137 @@
+"""
+ECH 配置预取与磁盘缓存
+启动器先解析 ECHConfigList 并写入文件，ech-workers 通过 -echfile 读取，
+冷启动无需再等待 DoH 查询；后台线程在 TTL 到期前刷新。
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+from echipa import doh
+
+DEFAULT_ECH_DOMAIN = 'cloudflare-ech.com'
+
+MIN_TTL = 300
+MAX_TTL = 86400
+REFRESH_RATIO = 0.8  # TTL 用掉 80% 后后台刷新
+
+
+class ECHConfigCache:
+    """按 (ECH 域名, DoH 服务器) 缓存 ECHConfigList"""
+
+    def __init__(self, config_dir, log=None):
+        self.cache_dir = config_dir / 'ech_cache'
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.log = log or (lambda text: None)
+        self._clients = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._refresher = None
+
+    def _key(self, domain, dns):
+        return hashlib.sha1(f'{domain}|{dns}'.encode('utf-8')).hexdigest()[:16]
+
+    def _paths(self, key):
+        return self.cache_dir / f'{key}.json', self.cache_dir / f'{key}.b64'
+
+    def _client(self, dns):
+        client = self._clients.get(dns)
+        if client is None:
+            client = self._clients[dns] = doh.DoHClient(dns, timeout=10, pool_size=1)
+        return client
+
+    def _load(self, key):
+        meta_path, _ = self._paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key, domain, dns, raw, ttl):
+        meta_path, b64_path = self._paths(key)
+        entry = {
+            'domain': domain,
+            'dns': dns,
+            'ttl': max(MIN_TTL, min(ttl or MIN_TTL, MAX_TTL)),
+            'fetched_at': time.time(),
+        }
+        # 先写临时文件再改名，避免子进程读到半个文件
+        for path, text in ((b64_path, base64.b64encode(raw).decode('ascii')),
+                           (meta_path, json.dumps(entry))):
+            tmp = path.with_suffix(path.suffix + '.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, path)
+        return entry
+
+    def fetch(self, domain, dns):
+        """通过 DoH 查询 HTTPS 记录并写入缓存"""
+        start = time.perf_counter()
+        response = self._client(dns).resolve(domain, doh.TYPE_HTTPS)
+        raw, ttl = doh.extract_ech_config(response)
+        if not raw:
+            raise ValueError('未找到 ECH 参数')
+        key = self._key(domain, dns)
+        entry = self._store(key, domain, dns, raw, ttl)
+        with self._lock:
+            self._entries[key] = entry
+        self.log(f"[ECH] 已预取配置 {domain}，{len(raw)} 字节，TTL {entry['ttl']}s，"
+                 f"耗时 {(time.perf_counter() - start) * 1000:.0f}ms\n")
+        return entry
+
+    def ensure(self, domain=DEFAULT_ECH_DOMAIN, dns=doh.DEFAULT_DOH):
+        """返回可交给 -echfile 的缓存文件路径
+
+        缓存有效直接返回；已过期仍先返回旧配置（ech-workers 连接失败时会自行刷新），
+        并在后台更新；没有缓存时同步查询一次。失败返回 None，由子进程自行查询。
+        """
+        key = self._key(domain, dns)
+        _, b64_path = self._paths(key)
+        with self._lock:
+            entry = self._entries.get(key) or self._load(key)
+            if entry:
+                self._entries[key] = entry
+        if entry and b64_path.exists():
+            if time.time() >= entry['fetched_at'] + entry['ttl']:
+                self._wakeup.set()
+            self.start_refresher()
+            return b64_path
+        try:
+            self.fetch(domain, dns)
+        except Exception as e:
+            self.log(f"[ECH] 预取配置失败，由 ech-workers 自行查询: {e}\n")
+            return None
+        self.start_refresher()
+        return b64_path
+
+    def start_refresher(self):
+        """启动后台刷新线程（只启动一次）"""
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            now = time.time()
+            with self._lock:
+                entries = list(self._entries.values())
+            due = [e for e in entries if now >= e['fetched_at'] + e['ttl'] * REFRESH_RATIO]
+            for entry in due:
+                try:
+                    self.fetch(entry['domain'], entry['dns'])
+                except Exception as e:
+                    # 失败后一分钟再试，旧配置继续可用
+                    entry['fetched_at'] = now - entry['ttl'] * REFRESH_RATIO + 60
+                    self.log(f"[ECH] 后台刷新失败: {e}\n")
+            with self._lock:
+                entries = list(self._entries.values())
+            next_due = min((e['fetched_at'] + e['ttl'] * REFRESH_RATIO for e in entries),
+                           default=now + 3600)
+            self._wakeup.wait(max(next_due - time.time(), 1))
+            self._wakeup.clear()
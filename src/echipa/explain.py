@@ -0,0 +1,381 @@
+"""
+分流判定查询：某个站点走直连还是代理，以及是哪一条规则或绕过条目决定的
+
+RouteExplainer 按分流模式给出与 PAC 脚本相同的判定：
+主机名 → 本地地址 → 绕过域名或规则 → 需要时解析 IP → 结论。
+系统代理实际生效的是绕过列表（echipa.routing 写入的条目，只按主机名文本匹配，不解析域名；
+部分规则与 IPv6 段在其中略去或取整），它的结论另记为 applied，与 PAC 判定不同时一并给出。
+结果放在有界 LRU 缓存中，条目有 TTL（解析结果会变化），并记录生成时的 RuleSet.version，
+规则重新编译后旧结果自动失效；分流模式或绕过 IP 段改变时（update）清空缓存。
+
+    python -m echipa.explain [-config-dir 目录] [-mode 分流模式] [-file 主机列表] [-no-resolve] [-json]
+                             [-platform win32|darwin] [主机 ...]
+"""
+
+import argparse
+import bisect
+import fnmatch
+import ipaddress
+import json
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from echipa.ipindex import NO_MATCH, ip_number
+
+MAX_ENTRIES = 4096
+TTL = 300  # 秒
+
+MODE_NAMES = {
+    'global': '全局代理',
+    'bypass_cn': '跳过中国大陆',
+    'bypass_cn_hk': '跳过中国大陆和香港',
+    'bypass_countries': '跳过本国/地区',
+    'rules': '规则分流',
+    'none': '不改变代理',
+}
+
+
+class RouteDecision:
+    """一个主机的判定；verdict 为 DIRECT、PROXY、REJECT，不设置系统代理时为 None
+
+    applied 为系统代理绕过列表下的结论（DIRECT 或 PROXY，本平台不设置系统代理时为 None），
+    applied_rule 为命中的绕过条目。
+    """
+    __slots__ = ('host', 'verdict', 'reason', 'rule', 'address', 'applied', 'applied_rule', 'elapsed_us')
+
+    def __init__(self, host, verdict, reason, rule=None, address=None):
+        self.host = host
+        self.verdict = verdict
+        self.reason = reason
+        self.rule = rule  # 规则分流时命中的 echipa.rules.Rule
+        self.address = address  # 判定用到的解析结果
+        self.applied = None
+        self.applied_rule = None
+        self.elapsed_us = 0.0  # 首次判定的耗时（缓存命中时不变）
+
+    def to_dict(self):
+        rule = self.rule
+        return {
+            'host': self.host,
+            'verdict': self.verdict,
+            'reason': self.reason,
+            'rule': str(rule) if rule else None,
+            'source': f"{rule.source}:{rule.line}" if rule else None,
+            'address': self.address,
+            'applied': self.applied,
+            'applied_rule': self.applied_rule,
+            'elapsed_us': round(self.elapsed_us, 1),
+        }
+
+    @property
+    def differs(self):
+        """系统代理实际的结论与 PAC 判定不同"""
+        return self.applied is not None and self.applied != self.verdict
+
+    def __str__(self):
+        address = f"（{self.address}）" if self.address else ''
+        text = f"{self.host} → {self.verdict or '-'}：{self.reason}{address}"
+        if self.differs:
+            entry = f"命中 {self.applied_rule}" if self.applied_rule else '不在绕过列表中'
+            text += f"；系统代理实际为 {self.applied}（{entry}）"
+        return text
+
+
+class BypassList:
+    """系统代理绕过列表的匹配（与 Windows ProxyOverride / macOS 例外列表一样只匹配主机名文本）"""
+
+    def __init__(self, patterns):
+        self.exact = {}     # 主机名 -> 条目
+        self.suffixes = {}  # *.cn -> {cn: '*.cn'}
+        self.prefixes = {}  # 10.* / 2408:8* -> {'10.': '10.*', '2408:8': '2408:8*'}
+        self.others = []    # 其他通配符（如规则的 *关键字*）
+        self.local = None   # <local>：不含点的主机名
+        for pattern in patterns:
+            pattern = pattern.strip().lower()
+            if not pattern:
+                continue
+            if pattern == '<local>':
+                self.local = pattern
+            elif '*' not in pattern:
+                self.exact.setdefault(pattern, pattern)
+            elif pattern.startswith('*.') and '*' not in pattern[2:]:
+                self.suffixes.setdefault(pattern[2:], pattern)
+            elif pattern.endswith('*') and '*' not in pattern[:-1]:
+                self.prefixes.setdefault(pattern[:-1], pattern)
+            else:
+                self.others.append(pattern)
+        self._lengths = sorted({len(prefix) for prefix in self.prefixes})
+
+    def match(self, host):
+        """命中的条目，不在列表中时返回 None"""
+        if host in self.exact:
+            return self.exact[host]
+        name = host
+        while True:
+            dot = name.find('.')
+            if dot < 0:
+                break
+            name = name[dot + 1:]
+            if name in self.suffixes:
+                return self.suffixes[name]
+        for length in self._lengths:
+            if length > len(host):
+                break
+            pattern = self.prefixes.get(host[:length])
+            if pattern:
+                return pattern
+        if self.local and '.' not in host and ':' not in host:
+            return self.local
+        return next((pattern for pattern in self.others if fnmatch.fnmatchcase(host, pattern)), None)
+
+
+def normalize_host(text):
+    """主机名、URL 或 [IPv6] 统一为小写主机名"""
+    text = text.strip()
+    if '://' in text:
+        text = urlsplit(text).hostname or ''
+    elif text.startswith('['):
+        text = text[1:text.find(']')]
+    return text.lower().rstrip('.')
+
+
+def resolve_all(host):
+    """系统解析得到的全部地址（IPv4 在前），失败时为空列表"""
+    try:
+        infos = socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+    except (OSError, UnicodeError):
+        return []
+    addresses = dict.fromkeys(info[4][0] for info in infos if info[0] in (socket.AF_INET, socket.AF_INET6))
+    return sorted(addresses, key=lambda address: ':' in address)
+
+
+class RouteExplainer:
+    """分流判定 + 有界 LRU 缓存；resolver(host) 返回地址列表，为 False 时不解析域名"""
+
+    def __init__(self, routing_mode='global', bypass_ranges=None, countries=None, rules=None, resolver=None,
+                 max_entries=MAX_ENTRIES, ttl=TTL, platform=None):
+        self.resolver = resolve_all if resolver is None else resolver
+        self.platform = platform or sys.platform  # 按哪个平台的系统代理绕过列表给出 applied
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._cache = OrderedDict()  # 主机 -> (判定, 规则版本, 过期时间)
+        self._lock = threading.Lock()
+        self._key = None
+        self.update(routing_mode, bypass_ranges, countries, rules)
+
+    def update(self, routing_mode, bypass_ranges=None, countries=None, rules=None):
+        """切换分流模式或绕过的 IP 段；与当前相同时保留缓存"""
+        from echipa.routing import bypass_countries, bypass_domains
+        codes = bypass_countries(routing_mode, countries)
+        key = (routing_mode, codes, id(bypass_ranges), id(rules))
+        if key == self._key:
+            return
+        self.routing_mode, self.codes, self.bypass_ranges, self.rules = routing_mode, codes, bypass_ranges, rules
+        self.countries = countries
+        # 绕过域名 *.cn → 后缀表 {cn: '*.cn'}，与规则的 DOMAIN-SUFFIX 一样按标签查找
+        self._suffixes = {}
+        for pattern in bypass_domains(codes):
+            self._suffixes.setdefault(pattern[2:], pattern)
+        self._starts = [start for start, _ in bypass_ranges or ()]
+        self._bypass = None  # (规则版本, BypassList)，首次判定时生成
+        with self._lock:
+            self._key = key
+            self._cache.clear()
+
+    def bypass_list(self):
+        """当前设置下 echipa.routing 写入系统代理的绕过列表；本平台不设置系统代理时为 None"""
+        from echipa.routing import macos_bypass_list, windows_bypass_list
+        if self.routing_mode == 'none' or self.platform not in ('win32', 'darwin'):
+            return None
+        version = self.rules.version if self.rules is not None else 0
+        if self._bypass is None or self._bypass[0] != version:
+            args = (self.routing_mode, self.bypass_ranges, self.countries, self.rules)
+            patterns = windows_bypass_list(*args).split(';') if self.platform == 'win32' else macos_bypass_list(*args)
+            self._bypass = (version, BypassList(patterns))
+        return self._bypass[1]
+
+    def explain(self, host):
+        host = normalize_host(host)
+        version = self.rules.version if self.rules is not None else 0
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(host)
+            if entry and entry[1] == version and entry[2] > now:
+                self._cache.move_to_end(host)
+                self.hits += 1
+                return entry[0]
+        start = time.perf_counter()
+        decision = self._decide(host)
+        bypass = self.bypass_list()
+        if bypass is not None:
+            decision.applied_rule = bypass.match(host)
+            decision.applied = 'DIRECT' if decision.applied_rule else 'PROXY'
+        decision.elapsed_us = (time.perf_counter() - start) * 1e6
+        with self._lock:
+            self.misses += 1
+            self._cache[host] = (decision, version, now + self.ttl)
+            self._cache.move_to_end(host)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return decision
+
+    def explain_many(self, hosts):
+        return [self.explain(host) for host in hosts if host.strip() and not host.lstrip().startswith('#')]
+
+    def stats(self):
+        return {'entries': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+    # ---------- 判定 ----------
+
+    def _decide(self, host):
+        mode = self.routing_mode
+        if mode == 'none' or mode not in MODE_NAMES:
+            return RouteDecision(host, None, '不设置系统代理，按系统原有设置')
+        version, number = ip_number(host)
+        if self._is_local(host, version, number):
+            return RouteDecision(host, 'DIRECT', '本地与内网地址始终直连')
+        if mode == 'global':
+            return RouteDecision(host, 'PROXY', '全局代理')
+        if mode == 'rules':
+            return self._decide_rules(host)
+        pattern = self._bypass_domain(host) if version is None else None
+        if pattern:
+            return RouteDecision(host, 'DIRECT', f"绕过域名 {pattern}")
+        if version is not None:
+            addresses = [host]
+        elif self.resolver is False:
+            return RouteDecision(host, 'PROXY', '不在绕过域名中（未解析 IP）')
+        else:
+            addresses = self.resolver(host)
+        for address in addresses:
+            matched = self._bypass_range(address)
+            if matched:
+                return RouteDecision(host, 'DIRECT', matched, address=address if address != host else None)
+        reason = '不在绕过域名与 IP 段中' if addresses else '不在绕过域名中（解析失败）'
+        return RouteDecision(host, 'PROXY', reason, address=', '.join(addresses) if version is None else None)
+
+    def _decide_rules(self, host):
+        from echipa.rules import DIRECT, PROXY, REJECT
+        rules = self.rules
+        if rules is None:
+            return RouteDecision(host, 'PROXY', '规则尚未加载')
+
+        def resolve_one(name):
+            # 与 PAC 中的 dnsResolve 相同，只取一个地址（优先 IPv4）
+            return next(iter(self.resolver(name)), None)
+        index, address = rules.match_detail(host, False if self.resolver is False else resolve_one)
+        if index == NO_MATCH:
+            return RouteDecision(host, 'PROXY', '没有匹配的规则（默认代理）', address=address)
+        rule = rules.rules[index]
+        verdict = {DIRECT: 'DIRECT', PROXY: 'PROXY', REJECT: 'REJECT'}[rule.policy]
+        return RouteDecision(host, verdict, f"{rule}（{rule.source}:{rule.line}）", rule, address)
+
+    def _is_local(self, host, version, number):
+        from echipa.routing import PRIVATE_RANGES, PRIVATE_RANGES6
+        if version is None:
+            return '.' not in host or host == 'localhost' or host.endswith('.local')
+        ranges = PRIVATE_RANGES if version == 4 else PRIVATE_RANGES6
+        return any(start <= number <= end for start, end in ranges)
+
+    def _bypass_domain(self, host):
+        suffixes = self._suffixes
+        name = host
+        while True:
+            if name in suffixes:
+                return suffixes[name]
+            dot = name.find('.')
+            if dot < 0:
+                return None
+            name = name[dot + 1:]
+
+    def _bypass_range(self, address):
+        """地址所在的绕过 IP 段说明，不在其中时返回 None"""
+        version, number = ip_number(address)
+        countries = '+'.join(self.codes)
+        if version == 4:
+            ranges = self.bypass_ranges
+            if not ranges:
+                # IP 段还没有加载：与系统代理绕过列表一样使用主要 IP 段
+                from echipa.routing import CN_IP_WILDCARDS
+                wildcard = f"{number >> 24}.*"
+                if 'CN' in self.codes and wildcard in CN_IP_WILDCARDS:
+                    return f"中国大陆主要 IP 段 {wildcard}（IP 段尚未加载）"
+                return None
+            i = bisect.bisect_right(self._starts, number) - 1
+            if i >= 0 and number <= ranges[i][1]:
+                start, end = ranges[i]
+                return f"{countries} IP 段 {ipaddress.IPv4Address(start)}-{ipaddress.IPv4Address(end)}"
+        elif version == 6:
+            segment = getattr(self.bypass_ranges, 'ipv6', None) and self.bypass_ranges.ipv6.segment(number)
+            if segment:
+                start, end, _ = segment
+                return f"{countries} IPv6 段 {ipaddress.IPv6Address(start)}-{ipaddress.IPv6Address(end)}"
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m echipa.explain', description='查询站点走直连还是代理')
+    parser.add_argument('hosts', nargs='*', help='主机名、IP 或 URL')
+    parser.add_argument('-config-dir', type=Path, default=None, help='配置目录（默认与 gui.py 相同）')
+    parser.add_argument('-mode', choices=sorted(MODE_NAMES), default=None, help='分流模式（默认使用当前服务器的设置）')
+    parser.add_argument('-file', type=Path, default=None, help='批量查询：每行一个主机，# 开头为注释（- 为标准输入）')
+    parser.add_argument('-no-resolve', action='store_true', help='不解析域名，只按域名判定')
+    parser.add_argument('-json', action='store_true', help='输出 JSON（每行一个）')
+    parser.add_argument('-platform', choices=('win32', 'darwin'), default=None,
+                        help='按该平台的系统代理绕过列表给出实际结论（默认本机）')
+    args = parser.parse_args(argv)
+
+    from echipa.config import BaseConfigManager, desktop_config_dir
+    from echipa.routing import load_bypass_ranges
+    manager = BaseConfigManager(args.config_dir or desktop_config_dir())
+    manager.load_config()
+    server = manager.get_current_server() or {}
+    mode = args.mode or server.get('routing_mode') or 'global'
+    hosts = list(args.hosts)
+    if args.file:
+        text = sys.stdin.read() if str(args.file) == '-' else args.file.read_text(encoding='utf-8')
+        hosts += text.splitlines()
+    if not hosts:
+        parser.error('需要主机名或 -file')
+
+    rules = ranges = None
+    if mode == 'rules':
+        from echipa.rules import RuleSet, rule_files
+        rules = RuleSet(rule_files(manager.config_dir, server.get('rule_files')), manager.config_dir,
+                        log=sys.stderr.write)
+        rules.refresh()
+    else:
+        ranges = load_bypass_ranges(manager.config_dir, mode, server.get('bypass_countries'), log=sys.stderr.write)
+    explainer = RouteExplainer(mode, ranges, server.get('bypass_countries'), rules,
+                               resolver=False if args.no_resolve else None, platform=args.platform)
+
+    start = time.perf_counter()
+    decisions = explainer.explain_many(hosts)
+    elapsed = time.perf_counter() - start
+    for decision in decisions:
+        if args.json:
+            print(json.dumps(decision.to_dict(), ensure_ascii=False))
+        else:
+            applied = f"系统代理: {decision.applied}（{decision.applied_rule or '不在绕过列表中'}）" \
+                if decision.differs else ''
+            print(f"{decision.host}\t{decision.verdict or '-'}\t{decision.reason}\t{decision.address or ''}\t"
+                  f"{decision.elapsed_us:.1f}µs\t{applied}")
+    counts = {}
+    for decision in decisions:
+        counts[decision.verdict or '-'] = counts.get(decision.verdict or '-', 0) + 1
+    differs = sum(decision.differs for decision in decisions)
+    if differs:
+        counts['与系统代理不同'] = differs
+    print(f"{MODE_NAMES[mode]}：{len(decisions)} 个主机，" + '，'.join(f"{k} {v}" for k, v in counts.items()) +
+          f"，平均 {elapsed * 1e6 / max(1, len(decisions)):.1f}µs（缓存命中 {explainer.hits}）", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
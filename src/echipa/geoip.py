@@ -0,0 +1,300 @@
+"""
+MaxMind DB（.mmdb）国家数据库读取，用于按国家/地区分流
+
+支持 GeoLite2-Country 以及格式兼容的 Country.mmdb（如 Loyalsoldier/geoip），放在配置目录即可。
+文件以 mmap 只读映射，查询直接在映射内存上按位遍历二叉搜索树，不读入或切片复制文件内容；
+数据区只解码国家代码，同一数据记录的结果按偏移缓存，之后的查询除返回值外不再分配对象。
+
+    python -m echipa.geoip [-db 文件] [-ranges CN,HK] [-pac 监听地址] [IP ...]
+"""
+
+import argparse
+import mmap
+import socket
+import struct
+import sys
+from pathlib import Path
+
+METADATA_MARKER = b'\xab\xcd\xefMaxMind.com'
+METADATA_MAX_SIZE = 128 * 1024  # 元数据在文件末尾，规范规定不超过 128KB
+DATA_SEPARATOR = 16  # 搜索树与数据区之间的 16 个零字节
+DB_NAMES = ('Country.mmdb', 'GeoLite2-Country.mmdb', 'geoip.mmdb')
+
+_UINT32 = struct.Struct('>I')
+_DOUBLE = struct.Struct('>d')
+_FLOAT = struct.Struct('>f')
+# 指针大小 0-3 对应的附加偏移（MaxMind DB 规范）
+_POINTER_BIAS = (0, 2048, 526336, 0)
+
+
+class MMDBReader:
+    """只读的 .mmdb 读取器；country(ip) 查询国家代码，country_ranges(codes[, 6]) 列出国家的 IPv4（IPv6）段"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = self._buf
+        start = buf.rfind(METADATA_MARKER, max(0, len(buf) - METADATA_MAX_SIZE))
+        if start < 0:
+            self.close()
+            raise ValueError(f'不是 MaxMind DB 文件: {self.path.name}')
+        self.metadata, _ = self._decode(start + len(METADATA_MARKER), start + len(METADATA_MARKER))
+        self.node_count = self.metadata['node_count']
+        self.record_size = self.metadata['record_size']
+        self.ip_version = self.metadata['ip_version']
+        if self.record_size not in (24, 28, 32):
+            self.close()
+            raise ValueError(f'不支持的记录大小: {self.record_size}')
+        self.tree_size = self.record_size * 2 // 8 * self.node_count
+        self.data_start = self.tree_size + DATA_SEPARATOR
+        self._countries = {}  # 数据记录偏移 -> 国家代码
+        self._ranges = {}  # (国家代码集合, IP 版本) -> 段
+        # IPv6 数据库中 IPv4 地址位于 ::/96 子树（沿左子树走 96 步）
+        node = 0
+        if self.ip_version == 6:
+            for _ in range(96):
+                if node >= self.node_count:
+                    break
+                node = self._record(node, 0)
+        self._ipv4_start = node
+
+    def close(self):
+        if self._buf is not None:
+            self._buf.close()
+            self._buf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def database_type(self):
+        return self.metadata.get('database_type', '')
+
+    @property
+    def build_epoch(self):
+        return self.metadata.get('build_epoch', 0)
+
+    # ---------- 搜索树 ----------
+
+    def _record(self, node, bit):
+        """节点的左（bit=0）或右（bit=1）记录，逐字节读取映射内存"""
+        buf = self._buf
+        if self.record_size == 24:
+            o = node * 6 + bit * 3
+            return buf[o] << 16 | buf[o + 1] << 8 | buf[o + 2]
+        if self.record_size == 28:
+            o = node * 7
+            if bit:
+                return (buf[o + 3] & 0x0f) << 24 | buf[o + 4] << 16 | buf[o + 5] << 8 | buf[o + 6]
+            return (buf[o + 3] & 0xf0) << 20 | buf[o] << 16 | buf[o + 1] << 8 | buf[o + 2]
+        return _UINT32.unpack_from(buf, node * 8 + bit * 4)[0]
+
+    def lookup(self, number, bits=32):
+        """按地址的整数值遍历搜索树，返回数据记录偏移（相对数据区），没有记录时返回 None"""
+        node = self._ipv4_start if bits == 32 else 0
+        count = self.node_count
+        record = self._record
+        bit = bits - 1
+        while node < count and bit >= 0:
+            node = record(node, number >> bit & 1)
+            bit -= 1
+        if node <= count:  # 等于 node_count 表示没有数据
+            return None
+        return node - count - DATA_SEPARATOR
+
+    def country(self, ip):
+        """IP（字符串或 IPv4 整数）所属国家/地区的 ISO 代码，未知时返回 None"""
+        if isinstance(ip, int):
+            offset = self.lookup(ip)
+        elif ':' in ip:
+            if self.ip_version != 6:
+                return None
+            offset = self.lookup(int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big'), 128)
+        else:
+            offset = self.lookup(int.from_bytes(socket.inet_aton(ip), 'big'))
+        return None if offset is None else self._country_at(offset)
+
+    def _country_at(self, offset):
+        try:
+            return self._countries[offset]
+        except KeyError:
+            pass
+        record, _ = self._decode(self.data_start + offset, self.data_start)
+        code = None
+        if isinstance(record, dict):
+            # 卫星与匿名代理等网络没有 country，退回注册国家
+            for key in ('country', 'registered_country'):
+                entry = record.get(key)
+                if isinstance(entry, dict) and entry.get('iso_code'):
+                    code = entry['iso_code']
+                    break
+        self._countries[offset] = code
+        return code
+
+    def country_ranges(self, codes, version=4):
+        """国家/地区代码集合的全部 IP 段 [(起, 止)]（version 为 4 或 6；按地址排序，相邻段已合并），结果缓存
+
+        IPv6 段不含 IPv4 子树（::/96 及指向同一子树的 ::ffff:0:0/96、2002::/16 等别名），IPv4 数据库没有 IPv6 段。
+        """
+        codes = frozenset(code.upper() for code in codes)
+        key = (codes, version)
+        if key in self._ranges:
+            return self._ranges[key]
+        ranges = []
+        count = self.node_count
+        record = self._record
+        ipv4_start = self._ipv4_start
+        if version == 4:
+            bits, root = 32, ipv4_start
+        else:
+            bits, root = 128, 0 if self.ip_version == 6 else count
+        stack = [(root, 0, 0)] if root < count else []
+        while stack:
+            node, value, depth = stack.pop()
+            depth += 1
+            for bit in (0, 1):
+                child = record(node, bit)
+                start = value | bit << (bits - depth)
+                if child < count:
+                    if bits == 32 or child != ipv4_start:
+                        stack.append((child, start, depth))
+                elif child > count and self._country_at(child - count - DATA_SEPARATOR) in codes:
+                    end = start | (1 << (bits - depth)) - 1
+                    ranges.append((start, end))
+        ranges.sort()  # 叶子在处理父节点时加入，顺序与地址顺序不一致
+        merged = []
+        for start, end in ranges:
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        self._ranges[key] = merged
+        return merged
+
+    # ---------- 数据区 ----------
+
+    def _decode(self, offset, base):
+        """解码 offset 处的一个值，返回 (值, 下一个值的偏移)；指针相对 base"""
+        buf = self._buf
+        ctrl = buf[offset]
+        offset += 1
+        kind = ctrl >> 5
+        if kind == 1:  # 指针
+            size = ctrl >> 3 & 0x3
+            pointer = ctrl & 0x7 if size < 3 else 0
+            for i in range(size + 1):
+                pointer = pointer << 8 | buf[offset + i]
+            value, _ = self._decode(base + pointer + _POINTER_BIAS[size], base)
+            return value, offset + size + 1
+        if kind == 0:  # 扩展类型
+            kind = 7 + buf[offset]
+            offset += 1
+        size = ctrl & 0x1f
+        if size >= 29:
+            n = size - 28
+            extra = int.from_bytes(buf[offset:offset + n], 'big')
+            size = (29, 285, 65821)[n - 1] + extra
+            offset += n
+        if kind == 7:  # map
+            result = {}
+            for _ in range(size):
+                key, offset = self._decode(offset, base)
+                result[key], offset = self._decode(offset, base)
+            return result, offset
+        if kind == 11:  # array
+            result = []
+            for _ in range(size):
+                value, offset = self._decode(offset, base)
+                result.append(value)
+            return result, offset
+        if kind == 14:  # boolean，值在 size 中
+            return bool(size), offset
+        end = offset + size
+        if kind == 2:
+            return buf[offset:end].decode('utf-8'), end
+        if kind in (5, 6, 9, 10):  # uint16/32/64/128
+            return int.from_bytes(buf[offset:end], 'big'), end
+        if kind == 8:  # int32
+            return int.from_bytes(buf[offset:end], 'big', signed=size == 4), end
+        if kind == 3:
+            return _DOUBLE.unpack_from(buf, offset)[0], end
+        if kind == 15:
+            return _FLOAT.unpack_from(buf, offset)[0], end
+        if kind == 4:
+            return bytes(buf[offset:end]), end
+        raise ValueError(f'无法解码的数据类型 {kind}（偏移 {offset - 1}）')
+
+
+_readers = {}  # 路径 -> ((mtime, size), MMDBReader)
+
+
+def find_database(config_dir):
+    """配置目录中的国家数据库（DB_NAMES 依次查找），没有时返回 None"""
+    for name in DB_NAMES:
+        path = Path(config_dir) / name
+        if path.is_file():
+            return path
+    return None
+
+
+def open_database(config_dir):
+    """打开配置目录中的国家数据库并缓存读取器（文件更新后重新打开）；没有或无法读取时返回 None"""
+    path = find_database(config_dir)
+    if path is None:
+        return None
+    try:
+        st = path.stat()
+        signature = (st.st_mtime, st.st_size)
+        cached = _readers.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        reader = MMDBReader(path)
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        print(f"读取国家数据库失败: {e}")
+        return None
+    if cached:
+        cached[1].close()
+    _readers[path] = (signature, reader)
+    return reader
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m echipa.geoip', description='查询 .mmdb 国家数据库')
+    parser.add_argument('ips', nargs='*', help='要查询的 IP')
+    parser.add_argument('-db', type=Path, default=None, help='数据库文件（默认在配置目录中查找）')
+    parser.add_argument('-ranges', default='', help='输出这些国家/地区（逗号分隔）的 IPv4 与 IPv6 段')
+    parser.add_argument('-pac', default='', help='输出绕过 -ranges 国家/地区（默认本机所在）的 PAC 脚本，代理为该监听地址')
+    args = parser.parse_args(argv)
+
+    if args.db:
+        reader = MMDBReader(args.db)
+    else:
+        from echipa.config import desktop_config_dir
+        reader = open_database(desktop_config_dir())
+        if reader is None:
+            print(f"配置目录中没有国家数据库（{', '.join(DB_NAMES)}）", file=sys.stderr)
+            return 1
+    print(f"{reader.path.name}: {reader.database_type}，{reader.node_count} 个节点，"
+          f"IPv{reader.ip_version}，记录 {reader.record_size} 位", file=sys.stderr)
+    for ip in args.ips:
+        print(f"{ip}\t{reader.country(ip) or '-'}")
+    if args.pac:
+        from echipa.ipindex import IPv6Index
+        from echipa.routing import BypassRanges, bypass_countries, pac_script
+        codes = bypass_countries('bypass_countries', args.ranges)
+        ranges = BypassRanges(reader.country_ranges(codes), IPv6Index.from_ranges(reader.country_ranges(codes, 6)))
+        print(pac_script(args.pac, 'bypass_countries', ranges, codes))
+    elif args.ranges:
+        import ipaddress
+        for version, address in ((4, ipaddress.IPv4Address), (6, ipaddress.IPv6Address)):
+            for start, end in reader.country_ranges(args.ranges.split(','), version):
+                print(f"{address(start)}\t{address(end)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+IP 区间索引（分流与规则共用）
+
+- IntervalIndex: IPv4，起止地址各一列 uint32
+- IPv6Index: IPv6，128 位地址拆成高、低两个 uint64 列（起止共四列），按 (高, 低) 二分查找；
+  可以原样写入二进制缓存，加载时直接读入数组，不再逐行解析文本
+
+两者都由 (起, 止, 标签) 构建：重叠部分保留标签最小者（规则序号越小越靠前），相邻且标签相同的段合并。
+"""
+
+import heapq
+import ipaddress
+import socket
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_right
+
+NO_MATCH = sys.maxsize
+MASK64 = (1 << 64) - 1
+
+CACHE_MAGIC = b'ECHIP6\x01\x00'
+_CACHE_HEADER = struct.Struct('<8sdI')  # 标识、生成时间、段数
+
+
+def label_segments(intervals):
+    """(起, 止, 标签) 列表 → 互不重叠、按地址排序的 (起, 止, 标签)；重叠部分取最小标签"""
+    events = sorted(intervals)
+    bounds = sorted({start for start, _, _ in events} | {end + 1 for _, end, _ in events})
+    segments = []
+    active = []
+    i = 0
+    for lo, hi in zip(bounds, bounds[1:]):
+        while i < len(events) and events[i][0] <= lo:
+            heapq.heappush(active, (events[i][2], events[i][1]))
+            i += 1
+        while active and active[0][1] < lo:
+            heapq.heappop(active)
+        if not active:
+            continue
+        label = active[0][0]
+        if segments and segments[-1][2] == label and segments[-1][1] + 1 == lo:
+            segments[-1] = (segments[-1][0], hi - 1, label)
+        else:
+            segments.append((lo, hi - 1, label))
+    return segments
+
+
+class IntervalIndex:
+    """互不重叠的 IPv4 区间 -> 标签，起止地址存为 uint32 数组"""
+
+    def __init__(self, intervals=()):
+        self.starts, self.ends, self.labels = array('I'), array('I'), array('l')
+        for start, end, label in label_segments(intervals):
+            self.starts.append(start)
+            self.ends.append(end)
+            self.labels.append(label)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, number):
+        i = bisect_right(self.starts, number) - 1
+        if i >= 0 and number <= self.ends[i]:
+            return self.labels[i]
+        return NO_MATCH
+
+    def segments(self):
+        return zip(self.starts, self.ends, self.labels)
+
+
+class IPv6Index:
+    """互不重叠的 IPv6 区间 -> 标签；起止地址各拆成高、低两个 uint64 列"""
+
+    def __init__(self, intervals=()):
+        self.start_hi, self.start_lo = array('Q'), array('Q')
+        self.end_hi, self.end_lo = array('Q'), array('Q')
+        self.labels = array('l')
+        for start, end, label in label_segments(intervals):
+            self._append(start, end, label)
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """不带标签的 (起, 止) 列表（标签均为 0，重叠与相邻的段会合并）"""
+        return cls((start, end, 0) for start, end in ranges)
+
+    def _append(self, start, end, label):
+        self.start_hi.append(start >> 64)
+        self.start_lo.append(start & MASK64)
+        self.end_hi.append(end >> 64)
+        self.end_lo.append(end & MASK64)
+        self.labels.append(label)
+
+    def __len__(self):
+        return len(self.start_hi)
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in
+                   (self.start_hi, self.start_lo, self.end_hi, self.end_lo, self.labels))
+
+    def find(self, number):
+        hi = number >> 64
+        start_hi = self.start_hi
+        i = bisect_right(start_hi, hi) - 1
+        if i >= 0 and start_hi[i] == hi:
+            # 高 64 位相同的段再按低 64 位二分（中国列表等 /64 以上的段几乎不会走到这里）
+            j = bisect_right(start_hi, hi - 1, 0, i)
+            i = bisect_right(self.start_lo, number & MASK64, j, i + 1) - 1
+        if i < 0:
+            return NO_MATCH
+        end_hi = self.end_hi[i]
+        if hi < end_hi or (hi == end_hi and number & MASK64 <= self.end_lo[i]):
+            return self.labels[i]
+        return NO_MATCH
+
+    def segment(self, number):
+        """number 所在的 (起, 止, 标签)，不在任何段中时返回 None"""
+        label = self.find(number)
+        if label == NO_MATCH:
+            return None
+        hi = number >> 64
+        i = bisect_right(self.start_hi, hi) - 1
+        if self.start_hi[i] == hi:
+            i = bisect_right(self.start_lo, number & MASK64, bisect_right(self.start_hi, hi - 1, 0, i), i + 1) - 1
+        return self.start_hi[i] << 64 | self.start_lo[i], self.end_hi[i] << 64 | self.end_lo[i], label
+
+    def __contains__(self, number):
+        return self.find(number) != NO_MATCH
+
+    def segments(self):
+        for start_hi, start_lo, end_hi, end_lo, label in zip(self.start_hi, self.start_lo, self.end_hi,
+                                                              self.end_lo, self.labels):
+            yield start_hi << 64 | start_lo, end_hi << 64 | end_lo, label
+
+    def ranges(self):
+        return [(start, end) for start, end, _ in self.segments()]
+
+    # ---------- 二进制缓存（小端 uint64 列，不含标签） ----------
+
+    def save(self, path, timestamp=None):
+        columns = [array('Q', column) for column in (self.start_hi, self.start_lo, self.end_hi, self.end_lo)]
+        if sys.byteorder != 'little':
+            for column in columns:
+                column.byteswap()
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(_CACHE_HEADER.pack(CACHE_MAGIC, time.time() if timestamp is None else timestamp, len(self)))
+            for column in columns:
+                column.tofile(f)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        """读取二进制缓存，返回 (索引, 生成时间)；文件损坏时抛出 ValueError"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < _CACHE_HEADER.size:
+            raise ValueError('IPv6 段缓存格式不正确')
+        magic, timestamp, count = _CACHE_HEADER.unpack_from(data)
+        if magic != CACHE_MAGIC or len(data) != _CACHE_HEADER.size + count * 32:
+            raise ValueError('IPv6 段缓存格式不正确')
+        index = cls()
+        offset = _CACHE_HEADER.size
+        for column in (index.start_hi, index.start_lo, index.end_hi, index.end_lo):
+            column.frombytes(data[offset:offset + count * 8])
+            if sys.byteorder != 'little':
+                column.byteswap()
+            offset += count * 8
+        index.labels = array('l', bytes(index.labels.itemsize * count))
+        return index, timestamp
+
+
+def ip_number(host):
+    """IP 字面量的 (版本, 整数值)；IPv6 可以带方括号与 %区域，不是 IP 时返回 (None, None)"""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, host), 'big')
+    except (OSError, ValueError):
+        pass
+    if ':' in host:
+        try:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, host.strip('[]').split('%', 1)[0]), 'big')
+        except (OSError, ValueError):
+            pass
+    return None, None
+
+
+def parse_ranges(text, version):
+    """解析 IP 段列表：每行 `起 止` 或 CIDR，# 开头为注释；返回 [(起, 止)]，忽略其他版本与无法解析的行"""
+    address = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+    ranges = []
+    for line in text.splitlines():
+        parts = line.split('#', 1)[0].split()
+        try:
+            if len(parts) >= 2:
+                start, end = address(parts[0]), address(parts[1])
+            elif len(parts) == 1:
+                network = ipaddress.ip_network(parts[0], strict=False)
+                if network.version != version:
+                    continue
+                start, end = network.network_address, network.broadcast_address
+            else:
+                continue
+        except ValueError:
+            continue
+        ranges.append((int(start), int(end)))
+    return ranges
+
+
+def hex128(number):
+    """IPv6 整数值的 32 位十六进制文本，字典序与数值顺序一致（PAC 中比较用）"""
+    return f'{number:032x}'
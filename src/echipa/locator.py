@@ -0,0 +1,150 @@
+"""
+ech-workers 可执行文件查找
+解析结果连同 (mtime, size, inode) 缓存在配置目录，下次启动只需一次 stat 校验
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BINARY_NAME = 'ech-workers'
+CACHE_NAME = 'binary_cache.json'
+
+_MAGIC = (b'\x7fELF', b'\xfe\xed\xfa', b'\xcf\xfa\xed\xfe', b'\xca\xfe\xba\xbe', b'#!')
+
+
+def _fingerprint(st):
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+
+def _usable(path):
+    """检查候选文件是否可运行，必要时补上执行权限"""
+    if sys.platform == 'win32':
+        if path.suffix.lower() == '.exe':
+            return True
+        try:
+            with open(path, 'rb') as f:
+                return f.read(2) == b'MZ'
+        except OSError:
+            return False
+    if os.access(path, os.X_OK):
+        return True
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(4)
+    except OSError:
+        return False
+    if header.startswith(_MAGIC):
+        try:
+            os.chmod(path, 0o755)
+        except OSError:
+            pass
+        return True
+    return False
+
+
+def default_candidates(*dirs):
+    """按优先级列出候选路径"""
+    exe_ext = '.exe' if sys.platform == 'win32' else ''
+    return [Path(d) / f'{BINARY_NAME}{exe_ext}' for d in dirs]
+
+
+class BinaryResolver:
+    """带校验缓存的可执行文件查找器"""
+
+    def __init__(self, config_dir, candidates, use_path=True):
+        self.cache_file = Path(config_dir) / CACHE_NAME
+        self.candidates = [Path(p) for p in candidates]
+        self.use_path = use_path
+        self.last_lookup_ms = 0.0
+        self.last_source = None  # 'cache' 或 'probe'
+        self.version = None
+        self._cached = None
+
+    @property
+    def supports_ech_file(self):
+        """找到的 ech-workers 是否支持 -echfile
+
+        该参数与 -version 同时加入：能读出版本的才支持；旧版本（'unknown'）或未校验（None）时
+        不传，否则会以 "flag provided but not defined" 退出。
+        """
+        return self.version not in (None, 'unknown')
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, path, st, version):
+        data = {'path': str(path), 'stat': _fingerprint(st), 'version': version,
+                'candidates': [str(p) for p in self.candidates]}
+        try:
+            tmp = self.cache_file.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.cache_file)
+        except OSError:
+            pass
+        self._cached = data
+
+    def _probe(self):
+        """按优先级产出可用的候选文件，最后是 PATH 中的"""
+        for path in self.candidates:
+            if path.is_file() and _usable(path):
+                yield path
+        if self.use_path:
+            found = shutil.which(BINARY_NAME)
+            if found:
+                yield Path(found)
+
+    @staticmethod
+    def read_version(path):
+        """运行 -version 读取版本；无法执行返回 None，旧版本不支持该参数时返回 'unknown'"""
+        kwargs = {}
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = 0x08000000  # CREATE_NO_WINDOW
+        try:
+            result = subprocess.run([str(path), '-version'], capture_output=True, timeout=5, **kwargs)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        output = result.stdout.decode('utf-8', errors='replace').strip()
+        if result.returncode != 0 or not output:
+            return 'unknown'
+        return output.splitlines()[0]
+
+    def resolve(self, verify=True):
+        """返回可执行文件路径，找不到返回 None
+
+        缓存的路径 stat 指纹不变时直接返回；文件变化或缓存失效才重新探测，
+        并在 verify=True 时运行一次确认二进制可执行。
+        """
+        start = time.perf_counter()
+        try:
+            cached = self._cached or self._read_cache()
+            if cached and cached.get('candidates') == [str(p) for p in self.candidates]:
+                try:
+                    st = os.stat(cached['path'])
+                    if _fingerprint(st) == cached.get('stat'):
+                        self.last_source = 'cache'
+                        self.version = cached.get('version')
+                        return cached['path']
+                except OSError:
+                    pass
+
+            self.last_source = 'probe'
+            for path in self._probe():
+                version = self.read_version(path) if verify else None
+                if verify and version is None:
+                    continue  # 无法执行（架构不符等），尝试下一个候选
+                self.version = version
+                self._write_cache(path, os.stat(path), version)
+                return str(path)
+            return None
+        finally:
+            self.last_lookup_ms = (time.perf_counter() - start) * 1000
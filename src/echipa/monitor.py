@@ -0,0 +1,307 @@
+"""
+ech-workers 子进程资源监控
+Linux 上直接读取 /proc/<pid>，其他平台装有 psutil 时使用 psutil，都不可用时不采样
+
+采样（CPU、内存、打开的文件描述符、线程数）写入固定长度的环形缓冲，
+按最近窗口的线性趋势在描述符或内存耗尽之前告警。
+"""
+
+import os
+import sys
+import threading
+import time
+from array import array
+
+SAMPLE_INTERVAL = 2.0  # 秒
+CAPACITY = 300  # 每个序列保留的采样数（默认约 10 分钟）
+TREND_WINDOW = 150  # 计算趋势使用的最近采样数
+TREND_MIN_SAMPLES = 30  # 采样不足时不判断趋势
+FD_WARN_RATIO = 0.8  # 打开的描述符超过上限的该比例时告警
+FD_HORIZON = 1800  # 按当前趋势在该秒数内耗尽描述符时告警
+FD_MIN_GROWTH = 16  # 窗口内描述符增长少于该数量视为正常波动
+RSS_WARN_PER_HOUR = 64 * 1024 * 1024  # 内存按当前趋势每小时增长超过该字节数时告警
+RSS_MIN_GROWTH = 0.1  # 窗口内内存增长少于该比例视为正常波动
+ALERT_INTERVAL = 600  # 同类告警的最短间隔（秒）
+
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+FIELDS = ('cpu_percent', 'rss_bytes', 'open_fds', 'threads')
+
+if sys.platform.startswith('linux'):
+    _CLK_TCK = os.sysconf('SC_CLK_TCK')
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class Series:
+    """定长环形缓冲，写满后覆盖最早的值"""
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self._data = array('d', bytes(8 * capacity))
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def values(self, last=None):
+        """按时间顺序返回最近 last 个值（默认全部）"""
+        n = self._count if last is None else min(last, self._count)
+        start = (self._next - n) % self.capacity
+        if start + n <= self.capacity:
+            return self._data[start:start + n].tolist()
+        return self._data[start:].tolist() + self._data[:self._next].tolist()
+
+    @property
+    def last(self):
+        return self._data[self._next - 1] if self._count else None
+
+    def clear(self):
+        self._next = self._count = 0
+
+
+def slope(xs, ys):
+    """最小二乘斜率；点数不足或 x 没有变化时返回 0"""
+    n = len(xs)
+    if n < 2:
+        return 0.0
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    var = sum((x - mean_x) ** 2 for x in xs)
+    if not var:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var
+
+
+def sparkline(values, width=None):
+    """用方块字符画出序列的走势；width 不为空时只画最近 width 个值"""
+    if width is not None:
+        values = values[-width:]
+    if not values:
+        return ''
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARK_CHARS[0] * len(values)
+    scale = (len(SPARK_CHARS) - 1) / (high - low)
+    return ''.join(SPARK_CHARS[int((v - low) * scale + 0.5)] for v in values)
+
+
+def format_bytes(value):
+    for unit in ('B', 'KB', 'MB'):
+        if value < 1024:
+            return f'{value:.0f}{unit}' if unit == 'B' else f'{value:.1f}{unit}'
+        value /= 1024
+    return f'{value:.2f}GB'
+
+
+# ---------- 采样 ----------
+
+def read_proc(pid):
+    """从 /proc 读取 {'cpu_seconds', 'rss_bytes', 'open_fds', 'threads'}；进程不存在时返回 None"""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+        fds = len(os.listdir(f'/proc/{pid}/fd'))
+    except OSError:
+        return None
+    # 进程名可能含空格和括号，从最后一个 ')' 之后开始按字段拆分（字段 3 起）
+    fields = stat[stat.rindex(b')') + 2:].split()
+    return {
+        'cpu_seconds': (int(fields[11]) + int(fields[12])) / _CLK_TCK,  # utime + stime
+        'rss_bytes': int(fields[21]) * _PAGE_SIZE,
+        'open_fds': fds,
+        'threads': int(fields[17]),
+    }
+
+
+def read_fd_limit(pid):
+    """子进程的打开文件数软限制；无法获取时返回 None"""
+    try:
+        with open(f'/proc/{pid}/limits') as f:
+            for line in f:
+                if line.startswith('Max open files'):
+                    soft = line.split()[3]
+                    return None if soft == 'unlimited' else int(soft)
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        import resource
+        soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]  # 子进程继承自本进程
+        return None if soft == resource.RLIM_INFINITY else soft
+    except (ImportError, OSError, ValueError):
+        return None
+
+
+def _read_psutil(process):
+    import psutil
+    try:
+        with process.oneshot():
+            cpu = process.cpu_times()
+            return {
+                'cpu_seconds': cpu.user + cpu.system,
+                'rss_bytes': process.memory_info().rss,
+                # Windows 没有文件描述符，用句柄数代替
+                'open_fds': process.num_handles() if sys.platform == 'win32' else process.num_fds(),
+                'threads': process.num_threads(),
+            }
+    except psutil.Error:
+        return None
+
+
+def make_reader(pid):
+    """返回 (采样函数, 描述符上限)；当前平台无法采样时返回 (None, None)"""
+    if sys.platform.startswith('linux'):
+        return (lambda: read_proc(pid)), read_fd_limit(pid)
+    try:
+        import psutil
+        process = psutil.Process(pid)
+    except Exception:  # 未安装 psutil 或进程已退出
+        return None, None
+    limit = read_fd_limit(pid) if sys.platform != 'win32' else None
+    return (lambda: _read_psutil(process)), limit
+
+
+# ---------- 监控线程 ----------
+
+class ResourceMonitor:
+    """定期采样 pid_source() 对应的进程；pid 变化（重启）时清空历史重新开始
+
+    log 接收告警文本，on_sample 在每次采样后调用（均在监控线程中）。
+    """
+
+    def __init__(self, pid_source, log=print, on_sample=None, interval=SAMPLE_INTERVAL, capacity=CAPACITY):
+        self.pid_source = pid_source
+        self.log = log
+        self.on_sample = on_sample
+        self.interval = interval
+        self.times = Series(capacity)
+        self.series = {name: Series(capacity) for name in FIELDS}
+        self.pid = None
+        self.fd_limit = None
+        self.available = True  # 当前平台能否采样
+        self.sample_us = 0.0  # 最近一次采样的耗时
+        self._reader = None
+        self._last_cpu = None
+        self._alerted = {}  # 告警类型 -> 上次告警时间
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='resource-monitor', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                self.log(f"[监控] 采样失败: {e}\n")
+                return
+            if not self.available:
+                return
+
+    def _attach(self, pid):
+        self.pid = pid
+        self._reader, self.fd_limit = make_reader(pid)
+        self._last_cpu = None
+        self._alerted.clear()
+        self.times.clear()
+        for series in self.series.values():
+            series.clear()
+        if self._reader is None:
+            self.available = False
+            self.log("[监控] 当前平台无法读取进程资源（可安装 psutil）\n")
+
+    def sample(self):
+        """采样一次；进程不存在时返回 None"""
+        pid = self.pid_source()
+        if pid is None:
+            return None
+        if pid != self.pid:
+            self._attach(pid)
+        if self._reader is None:
+            return None
+        start = time.perf_counter()
+        values = self._reader()
+        if values is None:
+            return None
+        now = time.monotonic()
+        cpu = values.pop('cpu_seconds')
+        if self._last_cpu is not None:
+            elapsed = now - self._last_cpu[0]
+            values['cpu_percent'] = (cpu - self._last_cpu[1]) / elapsed * 100 if elapsed > 0 else 0.0
+        else:
+            values['cpu_percent'] = 0.0
+        self._last_cpu = (now, cpu)
+        self.times.append(now)
+        for name in FIELDS:
+            self.series[name].append(values[name])
+        self.sample_us = (time.perf_counter() - start) * 1e6
+        self._check_trends(now)
+        if self.on_sample:
+            self.on_sample()
+        return values
+
+    # ---------- 趋势告警 ----------
+
+    def _alert(self, kind, now, text):
+        if now - self._alerted.get(kind, -ALERT_INTERVAL) < ALERT_INTERVAL:
+            return
+        self._alerted[kind] = now
+        self.log(f"[监控] {text}\n")
+
+    def _check_trends(self, now):
+        fds = self.series['open_fds'].last
+        if self.fd_limit and fds >= self.fd_limit * FD_WARN_RATIO:
+            self._alert('fd', now, f"打开的文件描述符 {fds:.0f} 已接近上限 {self.fd_limit}")
+        if len(self.times) < TREND_MIN_SAMPLES:
+            return
+        xs = self.times.values(TREND_WINDOW)
+
+        ys = self.series['open_fds'].values(TREND_WINDOW)
+        rate = slope(xs, ys)
+        if rate > 0 and ys[-1] - ys[0] >= FD_MIN_GROWTH and self.fd_limit:
+            remaining = (self.fd_limit - ys[-1]) / rate
+            if remaining < FD_HORIZON:
+                self._alert('fd_trend', now, f"文件描述符持续增长（{rate * 60:.0f}/分钟，当前 {ys[-1]:.0f}），"
+                                             f"约 {remaining / 60:.0f} 分钟后达到上限 {self.fd_limit}")
+
+        ys = self.series['rss_bytes'].values(TREND_WINDOW)
+        rate = slope(xs, ys)
+        if rate * 3600 >= RSS_WARN_PER_HOUR and ys[-1] >= ys[0] * (1 + RSS_MIN_GROWTH):
+            self._alert('rss_trend', now, f"内存持续增长（{format_bytes(rate * 3600)}/小时，"
+                                          f"当前 {format_bytes(ys[-1])}）")
+
+    # ---------- 读取 ----------
+
+    def snapshot(self):
+        """最近一次采样（供控制接口与状态显示）；尚无采样时各字段为 None"""
+        if not len(self.times):
+            return dict.fromkeys(FIELDS + ('fd_limit',))
+        result = {name: self.series[name].last for name in FIELDS}
+        result['fd_limit'] = self.fd_limit
+        return result
+
+    def summary(self, width=30):
+        """单行文本：当前值与最近 width 次采样的走势"""
+        if not len(self.times):
+            return ''
+        snap = self.snapshot()
+        fd_text = f"{snap['open_fds']:.0f}" + (f"/{self.fd_limit}" if self.fd_limit else '')
+        return '  '.join((
+            f"CPU {snap['cpu_percent']:.1f}% {sparkline(self.series['cpu_percent'].values(width))}",
+            f"内存 {format_bytes(snap['rss_bytes'])} {sparkline(self.series['rss_bytes'].values(width))}",
+            f"FD {fd_text} {sparkline(self.series['open_fds'].values(width))}",
+            f"线程 {snap['threads']:.0f} {sparkline(self.series['threads'].values(width))}",
+        ))
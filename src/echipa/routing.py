@@ -0,0 +1,716 @@
+"""
+分流与系统代理（不依赖 Qt/Toga，桌面端与守护进程共用）
+中国大陆 IP 列表（IPv4 与 IPv6）的下载与缓存、按国家/地区生成的绕过 IP 段（见 echipa.geoip）、
+各平台的代理绕过列表、PAC 脚本以及系统代理设置；规则分流（rules 模式）见 echipa.rules
+"""
+
+import bisect
+import ipaddress
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+# 中国IP列表URL
+CHINA_IP_LIST_URL = "https://raw.githubusercontent.com/mayaxcn/china-ip-list/master/chn_ip.txt"
+CHINA_IPV6_LIST_URL = "https://raw.githubusercontent.com/mayaxcn/china-ip-list/master/chn_ip_v6.txt"
+# IPv6 列表的缓存为二进制列文件（echipa.ipindex.IPv6Index.save），加载时不再逐行解析
+CHINA_IPV6_CACHE = "china_ip_list_v6.bin"
+
+# 分流模式 -> 绕过的国家/地区；bypass_countries 使用服务器配置的 bypass_countries（为空时为本机所在国家/地区）
+ROUTING_COUNTRIES = {
+    'bypass_cn': ('CN',),
+    'bypass_cn_hk': ('CN', 'HK'),
+}
+
+CN_DOMAINS = [
+    "*.cn", "*.com.cn", "*.net.cn", "*.org.cn", "*.gov.cn", "*.edu.cn",
+    "*.baidu.com", "*.qq.com", "*.taobao.com", "*.tmall.com", "*.alipay.com",
+    "*.weibo.com", "*.sina.com", "*.163.com", "*.126.com", "*.sohu.com",
+    "*.youku.com", "*.iqiyi.com", "*.bilibili.com", "*.douyin.com", "*.douban.com",
+    "*.zhihu.com", "*.jd.com", "*.alibaba.com", "*.1688.com",
+    "*.tencent.com", "*.weixin.qq.com", "*.qzone.com"
+]
+
+# 中国IP列表还没加载完成时使用的主要IP段
+CN_IP_WILDCARDS = [
+    "1.*", "14.*", "27.*", "36.*", "39.*", "42.*", "49.*", "58.*", "59.*", "60.*",
+    "61.*", "101.*", "103.*", "106.*", "110.*", "111.*", "112.*", "113.*", "114.*", "115.*",
+    "116.*", "117.*", "118.*", "119.*", "120.*", "121.*", "122.*", "123.*", "124.*", "125.*",
+    "171.*", "175.*", "180.*", "182.*", "183.*", "202.*", "203.*", "210.*", "211.*", "218.*",
+    "219.*", "220.*", "221.*", "222.*", "223.*"
+]
+
+
+def load_china_ip_list(cache_dir):
+    """下载并解析中国IP列表"""
+    try:
+        # 尝试从缓存读取
+        cache_file = Path(cache_dir) / "china_ip_list.json"
+        if cache_file.exists():
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cached_data = json.load(f)
+                    # 检查缓存是否过期（24小时）
+                    if time.time() - cached_data.get('timestamp', 0) < 86400:
+                        return cached_data.get('ranges', [])
+            except:
+                pass
+
+        # 下载IP列表
+        with urllib.request.urlopen(CHINA_IP_LIST_URL, timeout=10) as response:
+            content = response.read().decode('utf-8')
+
+        # 解析IP范围
+        ranges = []
+        for line in content.strip().split('\n'):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            parts = line.split()
+            if len(parts) >= 2:
+                start_ip = parts[0]
+                end_ip = parts[1]
+                try:
+                    start = ipaddress.IPv4Address(start_ip)
+                    end = ipaddress.IPv4Address(end_ip)
+                    ranges.append((int(start), int(end)))
+                except:
+                    continue
+
+        # 保存到缓存
+        try:
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'timestamp': time.time(),
+                    'ranges': ranges
+                }, f)
+        except:
+            pass
+
+        return ranges
+    except Exception as e:
+        print(f"加载中国IP列表失败: {e}")
+        return None
+
+
+def load_china_ipv6_list(cache_dir):
+    """下载并解析中国 IPv6 列表，返回 IPv6Index；下载失败时使用过期的缓存，都没有时返回 None"""
+    from echipa.ipindex import IPv6Index, parse_ranges
+    cache_file = Path(cache_dir) / CHINA_IPV6_CACHE
+    index = None
+    try:
+        index, timestamp = IPv6Index.load(cache_file)
+        # 检查缓存是否过期（24小时）
+        if time.time() - timestamp < 86400:
+            return index
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with urllib.request.urlopen(CHINA_IPV6_LIST_URL, timeout=10) as response:
+            content = response.read().decode('utf-8')
+    except Exception as e:
+        print(f"加载中国 IPv6 列表失败: {e}")
+        return index
+    index = IPv6Index.from_ranges(parse_ranges(content, 6))
+    try:
+        index.save(cache_file)
+    except OSError:
+        pass
+    return index
+
+
+class BypassRanges(list):
+    """绕过的 IPv4 段 [(起, 止)]，ipv6 为对应的 IPv6 段（IPv6Index，没有时为 None）"""
+
+    def __init__(self, ranges=(), ipv6=None):
+        super().__init__(ranges)
+        self.ipv6 = ipv6
+
+
+def home_country(default='CN'):
+    """本机区域设置中的国家/地区代码（zh_CN、zh-HK → CN、HK），无法识别时返回 default"""
+    import locale
+    names = [os.environ.get(name, '') for name in ('LC_ALL', 'LC_CTYPE', 'LANG')]
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            buf = ctypes.create_unicode_buffer(85)
+            if ctypes.windll.kernel32.GetUserDefaultLocaleName(buf, len(buf)):
+                names.insert(0, buf.value)
+        except Exception:
+            pass
+    try:
+        names.append(locale.getlocale()[0] or '')
+    except ValueError:
+        pass
+    for name in names:
+        match = re.match(r'[a-z]{2,3}(?:[_-][A-Za-z]{4})?[_-]([A-Z]{2})\b', name)
+        if match:
+            return match.group(1)
+    return default
+
+
+def bypass_countries(routing_mode, countries=None):
+    """分流模式要绕过的国家/地区代码元组；countries 为 bypass_countries 模式的设置（逗号分隔或列表）"""
+    if routing_mode == 'bypass_countries':
+        if isinstance(countries, str):
+            countries = countries.replace('，', ',').split(',')
+        codes = tuple(dict.fromkeys(code.strip().upper() for code in countries or () if code.strip()))
+        return codes or (home_country(),)
+    return ROUTING_COUNTRIES.get(routing_mode, ())
+
+
+def load_bypass_ranges(config_dir, routing_mode, countries=None, log=print):
+    """分流模式要绕过的 IP 段：BypassRanges（IPv4 段列表，ipv6 属性为 IPv6 段）
+
+    配置目录中有 .mmdb 国家数据库时直接从中生成（任意国家/地区组合）；
+    没有时只能使用中国大陆 IP 列表，其他国家/地区只按域名绕过。
+    """
+    codes = bypass_countries(routing_mode, countries)
+    if not codes:
+        return None
+    from echipa import geoip
+    from echipa.ipindex import IPv6Index
+    reader = geoip.open_database(config_dir)
+    if reader:
+        start = time.perf_counter()
+        ranges = BypassRanges(reader.country_ranges(codes), IPv6Index.from_ranges(reader.country_ranges(codes, 6)))
+        log(f"[系统] 已从 {reader.path.name} 生成 {'+'.join(codes)} 的 IP 段 {len(ranges)} 个、"
+            f"IPv6 段 {len(ranges.ipv6)} 个，耗时 {(time.perf_counter() - start) * 1000:.0f}ms\n")
+        return ranges
+    if codes != ('CN',):
+        log(f"[系统] 配置目录中没有国家数据库（{geoip.DB_NAMES[0]}），"
+            f"{'只按中国大陆 IP 列表和' if 'CN' in codes else '只按'}域名绕过\n")
+    if 'CN' not in codes:
+        return None
+    ipv4, ipv6 = load_china_ip_list(config_dir), load_china_ipv6_list(config_dir)
+    if ipv4 is None and ipv6 is None:
+        return None
+    return BypassRanges(ipv4 or (), ipv6)
+
+
+def bypass_domains(codes):
+    """国家/地区的绕过域名：中国大陆使用常见网站列表，其他使用国家顶级域名"""
+    domains = []
+    for code in codes:
+        domains += CN_DOMAINS if code == 'CN' else [f"*.{code.lower()}"]
+    return domains
+
+
+def ranges_to_wildcards(ranges):
+    """将IP范围转换为Windows ProxyOverride通配符格式"""
+    if not ranges:
+        return []
+
+    wildcards = set()
+
+    for start, end in ranges:
+        start_ip = ipaddress.IPv4Address(start)
+        end_ip = ipaddress.IPv4Address(end)
+
+        start_parts = [int(x) for x in str(start_ip).split('.')]
+        end_parts = [int(x) for x in str(end_ip).split('.')]
+
+        # 如果整个A段相同
+        if start_parts[0] == end_parts[0]:
+            # 检查是否是整个A段 (0.0.0.0 - 255.255.255.255)
+            if start_parts[1] == 0 and end_parts[1] == 255 and \
+               start_parts[2] == 0 and end_parts[2] == 255 and \
+               start_parts[3] == 0 and end_parts[3] == 255:
+                wildcards.add(f"{start_parts[0]}.*")
+            # 检查是否是整个B段 (0.0.0.0 - 0.255.255.255)
+            elif start_parts[2] == 0 and end_parts[2] == 255 and \
+                 start_parts[3] == 0 and end_parts[3] == 255:
+                wildcards.add(f"{start_parts[0]}.{start_parts[1]}.*")
+            # 检查是否是整个C段 (0.0.0.0 - 0.0.255.255)
+            elif start_parts[3] == 0 and end_parts[3] == 255:
+                wildcards.add(f"{start_parts[0]}.{start_parts[1]}.{start_parts[2]}.*")
+            else:
+                # 部分C段，添加所有涉及的IP
+                # 为了减少数量，只添加C段通配符
+                for c in range(start_parts[2], end_parts[2] + 1):
+                    wildcards.add(f"{start_parts[0]}.{start_parts[1]}.{c}.*")
+
+    # 优化：合并可以合并的通配符
+    # 例如：1.0.*, 1.1.*, ..., 1.255.* 可以合并为 1.*
+    optimized = set()
+    a_segments = {}  # {A: set(B segments)}
+
+    for wc in wildcards:
+        parts = wc.split('.')
+        if len(parts) == 2 and parts[1] == '*':
+            # A.* 格式，直接添加
+            optimized.add(wc)
+        elif len(parts) == 3 and parts[2] == '*':
+            # A.B.* 格式
+            a = parts[0]
+            if a not in a_segments:
+                a_segments[a] = set()
+            a_segments[a].add(parts[1])
+        else:
+            # 其他格式，直接添加
+            optimized.add(wc)
+
+    # 检查每个A段是否覆盖了所有B段（0-255），如果是则合并为A.*
+    for a, b_set in a_segments.items():
+        if len(b_set) >= 250:  # 如果覆盖了大部分B段，使用A.*
+            optimized.add(f"{a}.*")
+        else:
+            for b in b_set:
+                optimized.add(f"{a}.{b}.*")
+
+    return sorted(list(optimized))
+
+
+IPV6_WHOLE_BLOCK = 250 * 256  # 首段中至少这么多个 /32 才合并为 `X:*`（与 IPv4 的 A.* 合并比例相同）
+IPV6_MAX_PER_BLOCK = 256  # 首段中最多写这么多条，超过时向上取整到更短的前缀（类似 IPv4 按 A.B.* 取整）
+
+
+def _span_counter(merged):
+    """返回 count(lo, hi)：合并后的 /32 区间中落在 [lo, hi] 内的个数（二分查找）"""
+    starts = [start for start, _ in merged]
+    totals = [0]
+    for start, end in merged:
+        totals.append(totals[-1] + end - start + 1)
+
+    def upto(x):
+        i = bisect.bisect_right(starts, x)
+        return totals[i - 1] + min(merged[i - 1][1], x) - starts[i - 1] + 1 if i else 0
+
+    return lambda lo, hi: upto(hi) - upto(lo - 1)
+
+
+def _prefix_wildcards(first, count, prefix, digits, round_at, out, limit):
+    """把第二段的十六进制写法以 prefix（digits 位）开头的 /32 写入 out，超过 limit 条时返回 False
+
+    四位写法的 /32（几乎）全部覆盖，或前缀已有 round_at 位时写成 `X:前缀*`，
+    否则逐位细分，最后按 /32 写成 `X:Y:*`。
+    """
+    size = 1 << 4 * (4 - digits)
+    if not any(count(prefix << 4 * j, (prefix + 1 << 4 * j) - 1) for j in range(5 - digits)):
+        return True  # 写法以 prefix 开头的 /32（prefix、prefix0～prefixf…）都不在范围内
+    if digits < 4 and (digits >= round_at or count(prefix * size, prefix * size + size - 1) * 256 >= size * 250):
+        out.append(f"{first:x}:{prefix:x}*")
+        return len(out) <= limit
+    if count(prefix, prefix):
+        out.append(f"{first:x}:{prefix:x}:*")
+    if digits < 4:
+        for digit in range(16):
+            if not _prefix_wildcards(first, count, prefix * 16 + digit, digits + 1, round_at, out, limit):
+                return False
+    return len(out) <= limit
+
+
+def ipv6_wildcards(ranges):
+    """将 IPv6 范围转换为绕过列表通配符：几乎覆盖整个首段（/16）时写成 `X:*`，否则按第二段合并
+
+    第二段的十六进制前缀下四位写法的 /32（几乎）全部覆盖时写成 `X:前缀*`（如 `2408:8000::/20` 写成
+    `2408:8*`），其余按 /32 写成 `X:Y:*`；Y 为 0 时地址通常压缩成 `X::…`，另加 `X::*`。
+    不足 /32 的段向上取整到 /32；首段中的条目超过 IPV6_MAX_PER_BLOCK 个时改用 3 位、2 位或 1 位前缀，
+    以能写下的最长前缀为准。前缀通配符同时匹配第二段写法更短的 /32（`2408:8*` 也匹配 `2408:8::`、
+    `2408:80::`…），取整和这部分地址按直连处理；需要精确判定时使用 PAC 脚本。
+    """
+    blocks = {}  # 首段 -> [(起始 /32, 结束 /32)]
+    for start, end in ranges:
+        for first in range(start >> 112, (end >> 112) + 1):
+            lo = max(start, first << 112) >> 96 & 0xffff
+            hi = min(end, (first + 1 << 112) - 1) >> 96 & 0xffff
+            blocks.setdefault(first, []).append((lo, hi))
+    wildcards = []
+    for first, spans in blocks.items():
+        merged = []
+        for lo, hi in sorted(spans):
+            if merged and lo <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], hi)
+            else:
+                merged.append([lo, hi])
+        count = _span_counter(merged)
+        if count(0, 0xffff) >= IPV6_WHOLE_BLOCK:
+            wildcards.append(f"{first:x}:*")
+            continue
+        if count(0, 0):
+            wildcards += [f"{first:x}:0:*", f"{first:x}::*"]
+        # 从 1 位前缀开始逐级细分，直到条目数超出限制（1 位前缀最多 15 条）
+        best = []
+        for round_at in (1, 2, 3, 4):
+            out = []
+            if not all(_prefix_wildcards(first, count, digit, 1, round_at, out, IPV6_MAX_PER_BLOCK)
+                       for digit in range(1, 16)):
+                break
+            best = out
+        wildcards += best
+    return sorted(wildcards)
+
+
+def _bypass_parts(routing_mode, bypass_ranges=None, countries=None, rules=None):
+    """分流模式要绕过的 (域名列表, IP 通配符列表)；全局代理时为 None"""
+    if routing_mode == 'rules':
+        # 规则分流：规则中的直连域名与 IP 段（echipa.rules）
+        if rules is None:
+            return None
+        domains, ranges, ranges6 = rules.bypass_patterns()
+        return domains, ranges_to_wildcards(ranges) + ipv6_wildcards(ranges6)
+    codes = bypass_countries(routing_mode, countries)
+    if not codes:
+        return None
+    # 跳过指定国家/地区：添加其域名和IP段
+    if bypass_ranges:
+        ip_wildcards = ranges_to_wildcards(bypass_ranges)
+    else:
+        ip_wildcards = CN_IP_WILDCARDS if 'CN' in codes else []
+    ipv6 = getattr(bypass_ranges, 'ipv6', None)
+    if ipv6:
+        ip_wildcards = ip_wildcards + ipv6_wildcards(ipv6.ranges())
+    return bypass_domains(codes), ip_wildcards
+
+
+def windows_bypass_list(routing_mode, bypass_ranges=None, countries=None, rules=None):
+    """获取代理绕过列表；bypass_ranges 为要绕过的 IP 段（见 load_bypass_ranges），rules 为规则分流的 RuleSet"""
+    # 基础绕过列表（本地和内网）
+    base_bypass = "localhost;127.*;10.*;172.16.*;172.17.*;172.18.*;172.19.*;172.20.*;172.21.*;172.22.*;172.23.*;172.24.*;172.25.*;172.26.*;172.27.*;172.28.*;172.29.*;172.30.*;172.31.*;192.168.*;<local>"
+
+    parts = _bypass_parts(routing_mode, bypass_ranges, countries, rules)
+    if parts is None:
+        # 全局代理：只绕过本地和内网
+        return base_bypass
+    domains, ip_wildcards = parts
+
+    # Windows ProxyOverride 使用分号分隔，支持通配符
+    # 注意：Windows ProxyOverride 有长度限制（约2048字符），需要优化
+    bypass = ";".join(domains + ip_wildcards)
+
+    # 如果超过长度限制，只使用域名和主要IP段
+    MAX_LENGTH = 2000
+    if len(bypass) > MAX_LENGTH:
+        # 只使用域名和A段通配符（格式：A.*，IPv6 为首段 X:* 与前缀 X:a*）
+        a_segment_wildcards = [w for w in ip_wildcards if w.count('.') == 1 and w.endswith('.*')
+                               or w.count(':') == 1 and w.endswith('*')]
+        bypass = ";".join(domains + a_segment_wildcards)
+    if len(bypass) > MAX_LENGTH:
+        # 规则分流的直连域名很多时仍然过长：截断到最后一个完整条目（完整规则请使用 PAC）
+        bypass = bypass[:bypass.rfind(';', 0, MAX_LENGTH)]
+
+    return f"{base_bypass};{bypass}"
+
+
+# 本地与内网地址，PAC 中始终直连
+PRIVATE_RANGES = [(int(ipaddress.IPv4Address(a)), int(ipaddress.IPv4Address(b))) for a, b in (
+    ('10.0.0.0', '10.255.255.255'), ('127.0.0.0', '127.255.255.255'), ('169.254.0.0', '169.254.255.255'),
+    ('172.16.0.0', '172.31.255.255'), ('192.168.0.0', '192.168.255.255'))]
+PRIVATE_RANGES6 = [(int(ipaddress.IPv6Network(n).network_address), int(ipaddress.IPv6Network(n).broadcast_address))
+                   for n in ('::1/128', 'fc00::/7', 'fe80::/10')]
+
+# IPv6 地址文本 → 32 位十六进制（与 echipa.ipindex.hex128 相同），两种 PAC 脚本共用；无法解析时为空字符串
+PAC_IPV6_FUNCTIONS = """
+function ipv6Hex(ip) {
+    var halves = ip.toLowerCase().split("%")[0].split("::"), parts = [], k, n;
+    if (halves.length > 2) return "";
+    for (k = 0; k < halves.length; k++) {
+        var groups = halves[k] ? halves[k].split(":") : [];
+        if (groups.length && groups[groups.length - 1].indexOf(".") >= 0) {  // ::ffff:1.2.3.4
+            n = ipToInt(groups.pop());
+            groups.push((n >>> 16).toString(16), (n & 65535).toString(16));
+        }
+        parts.push(groups);
+    }
+    groups = parts[0];
+    if (parts.length > 1) {
+        for (n = 8 - parts[0].length - parts[1].length; n > 0; n--) groups.push("0");
+        groups = groups.concat(parts[1]);
+    }
+    if (groups.length !== 8) return "";
+    for (k = 0; k < 8; k++) groups[k] = ("0000" + groups[k]).slice(-4);
+    return groups.join("");
+}
+"""
+
+PAC_TEMPLATE = """var PROXY = "%(proxy)s";
+var DIRECT_DOMAINS = %(domains)s;
+var RANGES = %(ranges)s;
+var RANGES6 = %(ranges6)s;
+
+function ipToInt(ip) {
+    var p = ip.split(".");
+    return ((+p[0]) * 16777216) + ((+p[1]) << 16) + ((+p[2]) << 8) + (+p[3]);
+}
+
+function inRanges(n) {
+    var lo = 0, hi = RANGES.length / 2 - 1;
+    while (lo <= hi) {
+        var mid = (lo + hi) >> 1;
+        if (n < RANGES[mid * 2]) hi = mid - 1;
+        else if (n > RANGES[mid * 2 + 1]) lo = mid + 1;
+        else return true;
+    }
+    return false;
+}
+%(ipv6_functions)s
+function inRanges6(h) {
+    var lo = 0, hi = RANGES6.length / 2 - 1;
+    while (lo <= hi) {
+        var mid = (lo + hi) >> 1;
+        if (h < RANGES6[mid * 2]) hi = mid - 1;
+        else if (h > RANGES6[mid * 2 + 1]) lo = mid + 1;
+        else return true;
+    }
+    return false;
+}
+
+function FindProxyForURL(url, host) {
+    host = host.replace(/^\\[(.*)\\]$/, "$1");
+    var literal = host.indexOf(":") >= 0 || /^\\d+\\.\\d+\\.\\d+\\.\\d+$/.test(host);
+    if (!literal && (isPlainHostName(host) || host === "localhost" || dnsDomainIs(host, ".local"))) return "DIRECT";
+    for (var i = 0; i < DIRECT_DOMAINS.length; i++) {
+        if (dnsDomainIs(host, DIRECT_DOMAINS[i]) || host === DIRECT_DOMAINS[i].substring(1)) return "DIRECT";
+    }
+    // 支持 dnsResolveEx 的浏览器同时得到 IPv6 地址（分号分隔），任一地址在绕过段内即直连
+    var ips = literal ? host : typeof dnsResolveEx === "function" ? dnsResolveEx(host) : dnsResolve(host);
+    ips = ips ? ips.split(";") : [];
+    for (i = 0; i < ips.length; i++) {
+        if (ips[i].indexOf(":") < 0 ? inRanges(ipToInt(ips[i])) : inRanges6(ipv6Hex(ips[i]))) return "DIRECT";
+    }
+    return PROXY;
+}
+"""
+
+
+def pac_script(listen, routing_mode, bypass_ranges=None, countries=None, rules=None):
+    """代理自动配置（PAC）脚本：按分流模式绕过的域名与 IP 段直连，其余经本地代理
+
+    IP 段以整数数组嵌入并二分查找（IPv6 段为 32 位十六进制文本，按字符串比较），
+    不受 Windows ProxyOverride 约 2000 字符的限制。
+    规则分流时由 RuleSet 生成，按规则顺序判定。
+    """
+    if routing_mode == 'rules' and rules is not None:
+        return rules.pac_script(listen)
+    proxy = listen if ':' in listen else f"127.0.0.1:{listen}"
+    codes = bypass_countries(routing_mode, countries)
+    domains = [d[1:] for d in bypass_domains(codes)]  # *.cn → .cn
+    ranges = []
+    for start, end in sorted(PRIVATE_RANGES + [tuple(r) for r in bypass_ranges or ()]):
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    from echipa.ipindex import IPv6Index, hex128
+    ipv6 = getattr(bypass_ranges, 'ipv6', None) or IPv6Index()
+    ranges6 = IPv6Index.from_ranges(PRIVATE_RANGES6 + ipv6.ranges()).ranges()
+    return PAC_TEMPLATE % {
+        'proxy': f"PROXY {proxy}; SOCKS5 {proxy}",
+        'domains': json.dumps(domains),
+        'ranges': '[' + ','.join(f'{start},{end}' for start, end in ranges) + ']',
+        'ranges6': json.dumps([hex128(n) for segment in ranges6 for n in segment], separators=(',', ':')),
+        'ipv6_functions': PAC_IPV6_FUNCTIONS,
+    }
+
+
+INTERNET_SETTINGS_KEY = r"Software\Microsoft\Windows\CurrentVersion\Internet Settings"
+# 首次开启系统代理前用户自己的设置（名称 -> (值, 类型) 或 None），关闭时恢复
+_windows_snapshot = None
+
+
+def _notify_proxy_changed():
+    """通知系统代理设置已更改（每次应用最多一次）"""
+    try:
+        from ctypes import windll
+        INTERNET_OPTION_SETTINGS_CHANGED = 39
+        INTERNET_OPTION_REFRESH = 37
+        windll.wininet.InternetSetOptionW(0, INTERNET_OPTION_SETTINGS_CHANGED, 0, 0)
+        windll.wininet.InternetSetOptionW(0, INTERNET_OPTION_REFRESH, 0, 0)
+    except Exception:
+        pass
+
+
+def apply_windows_proxy(target, log=print):
+    """把 Internet Settings 改为 target（名称 -> (值, 类型)，None 表示删除该值）
+
+    一次打开注册表键，先读取再只写入不同的值，有写入时才通知系统。
+    返回 {'previous': 修改前的值, 'reads', 'writes', 'ms'}
+    """
+    import winreg
+    start = time.perf_counter()
+    previous = {}
+    writes = 0
+    with winreg.OpenKey(winreg.HKEY_CURRENT_USER, INTERNET_SETTINGS_KEY, 0,
+                        winreg.KEY_QUERY_VALUE | winreg.KEY_SET_VALUE) as key:
+        for name, wanted in target.items():
+            try:
+                previous[name] = winreg.QueryValueEx(key, name)
+            except FileNotFoundError:
+                previous[name] = None
+            if previous[name] == wanted:
+                continue
+            if wanted is None:
+                winreg.DeleteValue(key, name)
+            else:
+                winreg.SetValueEx(key, name, 0, wanted[1], wanted[0])
+            writes += 1
+    if writes:
+        _notify_proxy_changed()
+    stats = {'previous': previous, 'reads': len(target), 'writes': writes,
+             'ms': (time.perf_counter() - start) * 1000}
+    log(f"[系统] Windows 代理: 读取 {stats['reads']} 项，写入 {writes} 项"
+        f"{'' if writes else '（无变化，未通知系统）'}，耗时 {stats['ms']:.1f}ms\n")
+    return stats
+
+
+def set_windows_proxy(enabled, listen, routing_mode, bypass_ranges=None, log=print, countries=None, rules=None):
+    """设置 Windows 系统代理；关闭时恢复开启前用户自己的代理设置"""
+    global _windows_snapshot
+    try:
+        import winreg
+
+        # Windows 11 需要直接使用 IP:端口 格式，不使用 socks= 前缀
+        proxy_server = listen if ':' in listen else f"127.0.0.1:{listen}"
+        if enabled:
+            target = {
+                'ProxyEnable': (1, winreg.REG_DWORD),
+                'ProxyServer': (proxy_server, winreg.REG_SZ),
+                # 根据分流模式设置绕过列表
+                'ProxyOverride': (windows_bypass_list(routing_mode, bypass_ranges, countries, rules),
+                                  winreg.REG_SZ),
+            }
+            stats = apply_windows_proxy(target, log)
+            if _windows_snapshot is None:
+                _windows_snapshot = stats['previous']
+                if _windows_snapshot['ProxyEnable'] == (1, winreg.REG_DWORD) and \
+                        _windows_snapshot['ProxyServer'] == target['ProxyServer']:
+                    # 上次退出时没有清理（如异常结束），恢复为关闭代理
+                    _windows_snapshot = {'ProxyEnable': (0, winreg.REG_DWORD)}
+        elif _windows_snapshot is not None:
+            apply_windows_proxy(_windows_snapshot, log)
+            _windows_snapshot = None
+        else:
+            # 关闭代理
+            apply_windows_proxy({'ProxyEnable': (0, winreg.REG_DWORD)}, log)
+        return True
+    except Exception as e:
+        log(f"[系统] Windows 代理设置失败: {e}\n")
+        return False
+
+
+def macos_bypass_list(routing_mode, bypass_ranges=None, countries=None, rules=None):
+    """获取 macOS 代理绕过列表"""
+    # 基础绕过列表（本地和内网）
+    base_bypass = [
+        "localhost", "127.*", "10.*", "172.16.*", "172.17.*", "172.18.*",
+        "172.19.*", "172.20.*", "172.21.*", "172.22.*", "172.23.*", "172.24.*",
+        "172.25.*", "172.26.*", "172.27.*", "172.28.*", "172.29.*", "172.30.*",
+        "172.31.*", "192.168.*", "*.local", "169.254.*"
+    ]
+
+    parts = _bypass_parts(routing_mode, bypass_ranges, countries, rules)
+    if parts is None:
+        # 全局代理：只绕过本地和内网
+        return base_bypass
+    # macOS也支持IP通配符
+    domains, ip_wildcards = parts
+    return base_bypass + domains + ip_wildcards
+
+
+MACOS_WORKERS = 4  # 同时运行的 networksetup 进程数
+
+
+def _networksetup(*args):
+    return subprocess.run(['networksetup', *args], capture_output=True, text=True)
+
+
+def macos_services():
+    """已启用的网络服务（跳过第一行说明和以 * 开头的已停用服务）"""
+    result = _networksetup('-listallnetworkservices')
+    return [line.strip() for line in result.stdout.strip().split('\n')[1:]
+            if line.strip() and not line.startswith('*')]
+
+
+def read_macos_proxy(service, bypass=True):
+    """读取网络服务当前的 SOCKS 代理状态：{'enabled', 'host', 'port', 'bypass'}；bypass=False 时不读取绕过列表"""
+    state = {'enabled': False, 'host': '', 'port': '', 'bypass': []}
+    for line in _networksetup('-getsocksfirewallproxy', service).stdout.splitlines():
+        name, _, value = line.partition(':')
+        value = value.strip()
+        if name == 'Enabled':
+            state['enabled'] = value == 'Yes'
+        elif name == 'Server':
+            state['host'] = value
+        elif name == 'Port':
+            state['port'] = value
+    if bypass:
+        # 没有设置时输出 "There aren't any bypass domains set on ..."
+        output = _networksetup('-getproxybypassdomains', service).stdout
+        if not output.startswith('There aren'):
+            state['bypass'] = output.split()
+    return state
+
+
+def macos_proxy_plan(service, current, enabled, host=None, port=None, bypass=None):
+    """比较当前状态与目标状态，返回需要执行的 networksetup 参数列表（无变化时为空）"""
+    if not enabled:
+        return [['-setsocksfirewallproxystate', service, 'off']] if current['enabled'] else []
+    ops = []
+    if (current['host'], current['port']) != (host, str(port)):
+        ops.append(['-setsocksfirewallproxy', service, host, str(port)])
+    if not current['enabled']:
+        ops.append(['-setsocksfirewallproxystate', service, 'on'])
+    if current['bypass'] != bypass:
+        ops.append(['-setproxybypassdomains', service] + bypass)
+    return ops
+
+
+def set_macos_proxy(enabled, listen, routing_mode, bypass_ranges=None, log=print, countries=None, rules=None):
+    """设置 macOS 系统代理：读取各网络服务的当前设置，只更新有变化的服务（并发执行）"""
+    from concurrent.futures import ThreadPoolExecutor
+    try:
+        start = time.perf_counter()
+        # 解析监听地址
+        if ':' in listen:
+            host, port = listen.rsplit(':', 1)
+        else:
+            host, port = '127.0.0.1', listen
+
+        services = macos_services()
+        bypass_list = macos_bypass_list(routing_mode, bypass_ranges, countries, rules) if enabled else None
+
+        def apply(service):
+            ops = macos_proxy_plan(service, read_macos_proxy(service, enabled), enabled, host, port, bypass_list)
+            for args in ops:
+                # 某些网络服务可能不支持代理设置，忽略错误
+                _networksetup(*args)
+            return len(ops)
+
+        with ThreadPoolExecutor(max_workers=MACOS_WORKERS) as pool:
+            counts = list(pool.map(apply, services))
+
+        changed = sum(1 for n in counts if n)
+        log(f"[系统] macOS 代理: {len(services)} 个网络服务，更新 {changed} 个"
+            f"（{sum(counts)} 次写入），耗时 {(time.perf_counter() - start) * 1000:.0f}ms\n")
+        return True
+    except Exception as e:
+        log(f"[系统] macOS 代理设置失败: {e}\n")
+        return False
+
+
+def set_system_proxy(enabled, listen, routing_mode, bypass_ranges=None, log=print, countries=None, rules=None):
+    """设置系统代理（跨平台）；countries 为 bypass_countries 模式要绕过的国家/地区，rules 为规则分流的 RuleSet"""
+    if not listen and enabled:
+        return False
+    if not routing_mode:
+        routing_mode = 'bypass_cn'  # 默认值
+    # 如果是"不改变代理"模式，不设置系统代理
+    if routing_mode == 'none':
+        if enabled:
+            log("[系统] 分流模式为\"不改变代理\"，跳过系统代理设置\n")
+        return True
+    if sys.platform == 'win32':
+        return set_windows_proxy(enabled, listen, routing_mode, bypass_ranges, log, countries, rules)
+    elif sys.platform == 'darwin':
+        return set_macos_proxy(enabled, listen, routing_mode, bypass_ranges, log, countries, rules)
+    else:
+        log("[系统] Linux 暂不支持自动设置系统代理\n")
+        return False
@@ -0,0 +1,528 @@
+"""
+Clash 风格的分流规则
+
+规则文件每行一条 `类型,值,策略[,no-resolve]`，支持 DOMAIN、DOMAIN-SUFFIX、DOMAIN-KEYWORD、IP-CIDR、IP-CIDR6、GEOIP、MATCH；
+策略为 DIRECT、REJECT 或 PROXY（其他策略组名称按 PROXY 处理）。# 开头为注释，
+也可以直接粘贴 Clash 配置中 `- DOMAIN-SUFFIX,google.com,PROXY` 形式的规则。
+
+多个规则文件按顺序编译成一个判定结构，按规则顺序取第一条匹配（first-match）：
+- 域名：DOMAIN 精确表与 DOMAIN-SUFFIX 后缀哈希，按标签从长到短查找
+- 关键字：Aho-Corasick 自动机，一次扫描得到命中关键字中序号最小的规则
+- IP：IP-CIDR（IP-CIDR6）与 GEOIP 的段按 IPv4、IPv6 分别合并为互不重叠的区间，每段保留最先出现的规则，
+  二分查找（echipa.ipindex；IPv6 地址拆成高、低两个 uint64 列）
+各结构各自给出最小规则序号，取最小者；域名只有在更靠前的 IP 规则可能命中时才解析。
+规则文件修改后只重新解析该文件，关键字或 IP 规则没有变化时不重建自动机与区间索引。
+
+    python -m echipa.rules [-pac 监听地址] [-windows] [-macos] [规则文件 ...]
+"""
+
+import argparse
+import ipaddress
+import json
+import socket
+import sys
+import threading
+from collections import deque
+from pathlib import Path
+
+from echipa.config import file_signature
+from echipa.ipindex import NO_MATCH, IntervalIndex, IPv6Index, hex128, ip_number
+
+RULES_NAME = 'rules.txt'
+RULE_TYPES = ('DOMAIN', 'DOMAIN-SUFFIX', 'DOMAIN-KEYWORD', 'IP-CIDR', 'IP-CIDR6', 'GEOIP', 'MATCH')
+IP_TYPES = ('IP-CIDR', 'IP-CIDR6', 'GEOIP')
+DIRECT, PROXY, REJECT = 0, 1, 2
+POLICIES = {'DIRECT': DIRECT, 'REJECT': REJECT}
+
+
+class Rule:
+    __slots__ = ('kind', 'value', 'policy', 'target', 'resolve', 'source', 'line')
+
+    def __init__(self, kind, value, target, resolve, source, line):
+        self.kind = kind
+        self.value = value
+        self.target = target  # 规则文件中写的策略名称
+        self.policy = POLICIES.get(target.upper(), PROXY)
+        self.resolve = resolve  # IP 规则是否为域名解析 IP（no-resolve 时不解析）
+        self.source = source
+        self.line = line
+
+    def __str__(self):
+        fields = [self.kind] + ([self.value] if self.kind != 'MATCH' else []) + [self.target]
+        return ','.join(fields + ([] if self.resolve or self.kind not in IP_TYPES else ['no-resolve']))
+
+
+def parse_line(text):
+    """解析一行规则，返回 (类型, 值, 策略, 选项列表)；空行与注释返回 None，格式错误抛出 ValueError"""
+    text = text.split('#', 1)[0].strip()
+    if text.startswith('- '):
+        text = text[2:].strip()
+    text = text.strip('\'"')
+    if not text or text.endswith(':'):  # 空行或 Clash 配置中的 rules:/payload:
+        return None
+    parts = [part.strip() for part in text.split(',')]
+    kind = parts[0].upper()
+    if kind == 'MATCH' or kind == 'FINAL':
+        if len(parts) < 2:
+            raise ValueError('缺少策略')
+        return 'MATCH', '', parts[1], parts[2:]
+    if kind not in RULE_TYPES:
+        raise ValueError(f'不支持的规则类型 {parts[0]}')
+    if len(parts) < 3:
+        raise ValueError('格式应为 类型,值,策略')
+    return kind, parts[1], parts[2], parts[3:]
+
+
+class KeywordMatcher:
+    """Aho-Corasick 自动机：扫描一次主机名，得到命中关键字的最小规则序号"""
+
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.best = [NO_MATCH]  # 该状态（含失败链）能输出的最小规则序号
+        for keyword, index in keywords:
+            node = 0
+            for ch in keyword:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.best.append(NO_MATCH)
+                node = nxt
+            self.best[node] = min(self.best[node], index)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(ch, 0)
+                self.best[child] = min(self.best[child], self.best[self.fail[child]])
+
+    def first(self, text, limit=NO_MATCH):
+        goto, fail, best = self.goto, self.fail, self.best
+        result = limit
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if best[node] < result:
+                result = best[node]
+        return result
+
+
+def ipv4_number(host):
+    """IPv4 字面量的整数值，不是 IPv4 时返回 None"""
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, host), 'big')
+    except (OSError, ValueError):
+        return None
+
+
+class RuleFile:
+    """一个规则文件的解析结果，序号相对文件开头；文件未变化时重复使用"""
+
+    def __init__(self, path, geoip_ranges):
+        self.path = Path(path)
+        self.signature = file_signature(self.path)
+        self.rules = []
+        self.errors = []
+        self.exact = {}
+        self.suffix = {}
+        self.keywords = []
+        self.ips = []  # IPv4 (起, 止, 序号, 是否解析域名)
+        self.ips6 = []  # IPv6，格式同上
+        self.match = None
+        try:
+            with open(self.path, 'r', encoding='utf-8-sig') as f:
+                lines = f.read().splitlines()
+        except OSError as e:
+            self.errors.append(f"{self.path.name}: {e.strerror or e}")
+            return
+        for number, text in enumerate(lines, 1):
+            try:
+                parsed = parse_line(text)
+                if parsed:
+                    self._add(*parsed, number, geoip_ranges)
+            except ValueError as e:
+                self.errors.append(f"{self.path.name}:{number}: {e}")
+
+    def _add(self, kind, value, target, options, line, geoip_ranges):
+        resolve = 'no-resolve' not in (option.lower() for option in options)
+        index = len(self.rules)
+        if kind in ('DOMAIN', 'DOMAIN-SUFFIX', 'DOMAIN-KEYWORD'):
+            value = value.lower().strip('.')
+            table = {'DOMAIN': self.exact, 'DOMAIN-SUFFIX': self.suffix}.get(kind)
+            if table is not None:
+                table.setdefault(value, index)
+            else:
+                self.keywords.append((value, index))
+        elif kind in ('IP-CIDR', 'IP-CIDR6'):
+            # 与 Clash 相同，两种类型都按地址本身的版本处理
+            network = ipaddress.ip_network(value, strict=False)
+            table = self.ips if network.version == 4 else self.ips6
+            table.append((int(network.network_address), int(network.broadcast_address), index, resolve))
+        elif kind == 'GEOIP':
+            value = value.upper()
+            ranges = geoip_ranges(value)
+            if ranges is None:
+                raise ValueError(f'没有 {value} 的 IP 段（需要配置目录中的国家数据库）')
+            self.ips.extend((start, end, index, resolve) for start, end in ranges[0])
+            self.ips6.extend((start, end, index, resolve) for start, end in ranges[1])
+        elif self.match is None:
+            self.match = index
+        self.rules.append(Rule(kind, value, target, resolve, self.path.name, line))
+
+
+class RuleSet:
+    """按顺序的多个规则文件编译成的判定结构；refresh() 只重新解析修改过的文件"""
+
+    def __init__(self, paths, config_dir=None, log=None):
+        self.paths = [Path(p) for p in paths]
+        self.config_dir = config_dir
+        self.log = log or (lambda text: None)
+        self.version = 0  # 每次重新编译后加一
+        self._bypass_logged = 0  # 已记录略去的直连规则的版本，同一版本只记录一次
+        self.rules = []
+        self.errors = []
+        self._files = {}
+        self._lock = threading.Lock()
+        self._geoip = {}
+        self._keyword_key = self._ip_key = None
+        self._exact = {}
+        self._suffix = {}
+        self._keywords = KeywordMatcher([])
+        self._ip = self._ip_resolve = IntervalIndex([])
+        self._ip6 = self._ip6_resolve = IPv6Index([])
+        self._resolve_min = NO_MATCH
+        self._match = NO_MATCH
+
+    def _geoip_ranges(self, code):
+        """GEOIP 代码的 (IPv4 段, IPv6 段)，没有数据时为 None"""
+        if code not in self._geoip:
+            from echipa import geoip
+            from echipa.routing import PRIVATE_RANGES, PRIVATE_RANGES6, load_china_ip_list, load_china_ipv6_list
+            reader = geoip.open_database(self.config_dir) if self.config_dir else None
+            if code == 'LAN':
+                ranges = PRIVATE_RANGES, PRIVATE_RANGES6
+            elif reader:
+                ranges = reader.country_ranges([code]), reader.country_ranges([code], 6)
+            elif code == 'CN' and self.config_dir:
+                ipv4, ipv6 = load_china_ip_list(self.config_dir), load_china_ipv6_list(self.config_dir)
+                ranges = (ipv4 or [], ipv6.ranges() if ipv6 else []) if ipv4 or ipv6 else None
+            else:
+                ranges = None
+            self._geoip[code] = ranges
+        return self._geoip[code]
+
+    def refresh(self, log=None):
+        """重新解析修改过（或新加入）的规则文件并重建判定结构；有变化时返回 True。log 默认为构造时的 log"""
+        log = log or self.log
+        with self._lock:
+            changed = []
+            for path in self.paths:
+                current = self._files.get(path)
+                if current is None or current.signature != file_signature(path):
+                    self._files[path] = RuleFile(path, self._geoip_ranges)
+                    changed.append(path.name)
+            for path in set(self._files) - set(self.paths):
+                del self._files[path]
+                changed.append(path.name)
+            if not changed and self.version:
+                return False
+            self._build()
+            self.version += 1
+        for error in self.errors:
+            log(f"[规则] {error}\n")
+        log(f"[规则] 已编译 {len(self.rules)} 条规则（重新解析: {', '.join(changed) or '无'}）\n")
+        return True
+
+    def _build(self):
+        files = [self._files[path] for path in self.paths]
+        self.rules = [rule for f in files for rule in f.rules]
+        self.errors = [error for f in files for error in f.errors]
+        exact, suffix, keywords, ips, ips6 = {}, {}, [], [], []
+        self._match = NO_MATCH
+        offset = 0
+        for f in files:
+            for name, index in f.exact.items():
+                exact.setdefault(name, offset + index)
+            for name, index in f.suffix.items():
+                suffix.setdefault(name, offset + index)
+            keywords.extend((keyword, offset + index) for keyword, index in f.keywords)
+            ips.extend((start, end, offset + index, resolve) for start, end, index, resolve in f.ips)
+            ips6.extend((start, end, offset + index, resolve) for start, end, index, resolve in f.ips6)
+            if f.match is not None and self._match == NO_MATCH:
+                self._match = offset + f.match
+            offset += len(f.rules)
+        self._exact, self._suffix = exact, suffix
+        # 自动机与区间索引的构建较慢，只在对应规则变化时重建
+        if keywords != self._keyword_key:
+            self._keywords = KeywordMatcher(keywords)
+            self._keyword_key = keywords
+        ip_key = [(f.path, f.signature, sum(len(g.rules) for g in files[:i])) for i, f in enumerate(files)
+                  if f.ips or f.ips6]
+        if ip_key != self._ip_key:
+            self._ip = IntervalIndex([(start, end, index) for start, end, index, _ in ips])
+            self._ip_resolve = IntervalIndex([(start, end, index) for start, end, index, resolve in ips if resolve])
+            self._ip6 = IPv6Index([(start, end, index) for start, end, index, _ in ips6])
+            self._ip6_resolve = IPv6Index([(start, end, index) for start, end, index, resolve in ips6 if resolve])
+            self._resolve_min = min((index for _, _, index, resolve in ips + ips6 if resolve), default=NO_MATCH)
+            self._ip_key = ip_key
+
+    # ---------- 匹配 ----------
+
+    def domain_index(self, host):
+        """只看域名规则（DOMAIN、DOMAIN-SUFFIX、DOMAIN-KEYWORD）时第一条匹配的规则序号"""
+        best = self._exact.get(host, NO_MATCH)
+        suffix = self._suffix
+        name = host
+        while True:
+            index = suffix.get(name, NO_MATCH)
+            if index < best:
+                best = index
+            dot = name.find('.')
+            if dot < 0:
+                break
+            name = name[dot + 1:]
+        return self._keywords.first(host, best)
+
+    def match_index(self, host, resolver=None):
+        """第一条匹配规则的序号（NO_MATCH 表示没有匹配）
+
+        resolver(host) 返回 IP 地址字符串（IPv4 或 IPv6）；默认使用系统解析，为 False 时不解析域名。
+        """
+        return self.match_detail(host, resolver)[0]
+
+    def match_detail(self, host, resolver=None):
+        """(第一条匹配规则的序号, 判定时解析得到的地址)；没有解析时地址为 None"""
+        host = host.lower().rstrip('.')
+        version, number = ip_number(host)
+        address = None
+        if version is not None:
+            best = (self._ip if version == 4 else self._ip6).find(number)
+        else:
+            best = self.domain_index(host)
+            if self._resolve_min < best and resolver is not False:
+                try:
+                    address = (resolver or socket.gethostbyname)(host)
+                except (OSError, UnicodeError):
+                    address = None
+                version, number = ip_number(address) if address else (None, None)
+                if version is not None:
+                    best = min(best, (self._ip_resolve if version == 4 else self._ip6_resolve).find(number))
+        return min(best, self._match), address
+
+    def match(self, host, resolver=None):
+        """第一条匹配的规则，没有匹配（也没有 MATCH 规则）时返回 None"""
+        index = self.match_index(host, resolver)
+        return None if index == NO_MATCH else self.rules[index]
+
+    def policy(self, host, resolver=None):
+        rule = self.match(host, resolver)
+        return PROXY if rule is None else rule.policy
+
+    # ---------- 输出 ----------
+
+    def bypass_patterns(self):
+        """系统代理绕过列表能表达的直连部分：(域名通配符列表, IPv4 段列表, IPv6 段列表)
+
+        绕过列表不分先后：直连域名规则覆盖的范围内（域名本身、子域名、含关键字的域名）
+        只要可能先命中更靠前的非直连规则，该规则就略去（记录日志，PAC 中仍按顺序判定）；MATCH,DIRECT 无法表达。
+        """
+        from echipa.routing import PRIVATE_RANGES6
+        domains = []
+        dropped = []
+        blocked = set()  # 更靠前的非直连 DOMAIN/DOMAIN-SUFFIX 值及其各级上级域名
+        exact_before = []  # 更靠前的非直连 DOMAIN 值
+        # 更靠前是否有非直连的后缀规则 / 关键字规则 / 解析域名的 IP 规则
+        suffix_before = keyword_before = resolve_before = False
+        for rule in self.rules:
+            if rule.policy != DIRECT:
+                if rule.kind in ('DOMAIN', 'DOMAIN-SUFFIX'):
+                    if rule.kind == 'DOMAIN':
+                        exact_before.append(rule.value)
+                    else:
+                        suffix_before = True
+                    name = rule.value
+                    while name not in blocked:
+                        blocked.add(name)
+                        dot = name.find('.')
+                        if dot < 0:
+                            break
+                        name = name[dot + 1:]
+                elif rule.kind == 'DOMAIN-KEYWORD':
+                    keyword_before = True
+                elif rule.kind in IP_TYPES and rule.resolve:
+                    resolve_before = True
+                continue
+            if rule.kind not in ('DOMAIN', 'DOMAIN-SUFFIX', 'DOMAIN-KEYWORD'):
+                continue
+            if rule.kind == 'DOMAIN':
+                # 只有这一个域名：看它本身先命中哪条域名规则即可
+                covered = self.rules[self.domain_index(rule.value)].policy != DIRECT
+            elif rule.kind == 'DOMAIN-SUFFIX':
+                # 子域名可以包含任意关键字，也可能是更靠前的非直连域名规则
+                covered = (keyword_before or rule.value in blocked
+                           or self.rules[self.domain_index(rule.value)].policy != DIRECT)
+            else:
+                # 含关键字的域名可以落在任何更靠前的非直连后缀、关键字规则中
+                covered = (keyword_before or suffix_before
+                           or any(rule.value in name for name in exact_before))
+            if covered or resolve_before:
+                dropped.append(rule)
+            elif rule.kind == 'DOMAIN-KEYWORD':
+                domains.append(f"*{rule.value}*")
+            else:
+                domains += [rule.value, f"*.{rule.value}"] if rule.kind == 'DOMAIN-SUFFIX' else [rule.value]
+        if dropped and self._bypass_logged != self.version:
+            self._bypass_logged = self.version
+            examples = '、'.join(f"{rule}（{rule.source}:{rule.line}）" for rule in dropped[:3])
+            self.log(f"[规则] {len(dropped)} 条直连规则可能先命中更靠前的代理规则，未写入系统代理绕过列表"
+                     f"（PAC 中按顺序判定）：{examples}{' 等' if len(dropped) > 3 else ''}\n")
+        ranges = [(start, end) for start, end, index in self._ip.segments() if self.rules[index].policy == DIRECT]
+        # 本地与内网 IPv6 段（fc00::/7 等）写成首段通配符会有数百条，绕过列表中略去（PAC 中仍然直连）
+        ranges6 = [(start, end) for start, end, index in self._ip6.segments() if self.rules[index].policy == DIRECT
+                   and not any(low <= start and end <= high for low, high in PRIVATE_RANGES6)]
+        return list(dict.fromkeys(domains)), ranges, ranges6
+
+    def pac_script(self, listen):
+        """与 match_index 相同判定逻辑的 PAC 脚本"""
+        from echipa.routing import PAC_IPV6_FUNCTIONS, PRIVATE_RANGES, PRIVATE_RANGES6
+        proxy = listen if ':' in listen else f"127.0.0.1:{listen}"
+        # -1：本地与内网始终直连
+        private = [(start, end, -1) for start, end in PRIVATE_RANGES]
+        private6 = [(start, end, -1) for start, end in PRIVATE_RANGES6]
+
+        def flat(segments):
+            return json.dumps([n for segment in segments for n in segment], separators=(',', ':'))
+
+        def flat6(segments):
+            # IPv6 地址写成 32 位十六进制文本，PAC 中按字符串比较
+            return flat((hex128(start), hex128(end), label) for start, end, label in segments)
+        return PAC_TEMPLATE % {
+            'results': json.dumps(['DIRECT', f"PROXY {proxy}; SOCKS5 {proxy}", 'PROXY 127.0.0.1:9']),
+            'policies': json.dumps([rule.policy for rule in self.rules], separators=(',', ':')),
+            'exact': json.dumps(self._exact, separators=(',', ':')),
+            'suffix': json.dumps(self._suffix, separators=(',', ':')),
+            'keywords': json.dumps(sorted(([k, i] for k, i in self._keyword_key or ()), key=lambda kw: kw[1]),
+                                   separators=(',', ':')),
+            'ip': flat(self._ip.segments()),
+            'ip_resolve': flat(self._ip_resolve.segments()),
+            'ip6': flat6(self._ip6.segments()),
+            'ip6_resolve': flat6(self._ip6_resolve.segments()),
+            'private': flat(private),
+            'private6': flat6(private6),
+            'ipv6_functions': PAC_IPV6_FUNCTIONS,
+            'resolve_min': self._resolve_min if self._resolve_min != NO_MATCH else -1,
+            'match': self._match if self._match != NO_MATCH else -1,
+        }
+
+
+PAC_TEMPLATE = """var RESULTS = %(results)s;
+var POLICIES = %(policies)s;
+var EXACT = %(exact)s;
+var SUFFIX = %(suffix)s;
+var KEYWORDS = %(keywords)s;
+var IP = %(ip)s;
+var IP_RESOLVE = %(ip_resolve)s;
+var IP6 = %(ip6)s;
+var IP6_RESOLVE = %(ip6_resolve)s;
+var PRIVATE = %(private)s;
+var PRIVATE6 = %(private6)s;
+var RESOLVE_MIN = %(resolve_min)s;
+var MATCH = %(match)s;
+var NONE = POLICIES.length;
+
+function ipToInt(ip) {
+    var p = ip.split(".");
+    return ((+p[0]) * 16777216) + ((+p[1]) << 16) + ((+p[2]) << 8) + (+p[3]);
+}
+
+function search(list, n) {
+    var lo = 0, hi = list.length / 3 - 1;
+    while (lo <= hi) {
+        var mid = (lo + hi) >> 1;
+        if (n < list[mid * 3]) hi = mid - 1;
+        else if (n > list[mid * 3 + 1]) lo = mid + 1;
+        else return list[mid * 3 + 2];
+    }
+    return NONE;
+}
+%(ipv6_functions)s
+function searchIP(ip, list, list6) {
+    return ip.indexOf(":") < 0 ? search(list, ipToInt(ip)) : search(list6, ipv6Hex(ip));
+}
+
+function FindProxyForURL(url, host) {
+    host = host.toLowerCase().replace(/^\\[(.*)\\]$/, "$1");
+    var literal = host.indexOf(":") >= 0 || /^\\d+\\.\\d+\\.\\d+\\.\\d+$/.test(host);
+    if (!literal && (isPlainHostName(host) || host === "localhost" || dnsDomainIs(host, ".local"))) return "DIRECT";
+    var best = NONE, i, ip;
+    if (literal) {
+        if (searchIP(host, PRIVATE, PRIVATE6) < 0) return "DIRECT";
+        best = searchIP(host, IP, IP6);
+    } else {
+        if (EXACT.hasOwnProperty(host)) best = EXACT[host];
+        for (var name = host; ; name = name.substring(i + 1)) {
+            if (SUFFIX.hasOwnProperty(name) && SUFFIX[name] < best) best = SUFFIX[name];
+            i = name.indexOf(".");
+            if (i < 0) break;
+        }
+        for (i = 0; i < KEYWORDS.length && KEYWORDS[i][1] < best; i++) {
+            if (host.indexOf(KEYWORDS[i][0]) >= 0) best = KEYWORDS[i][1];
+        }
+        if (RESOLVE_MIN >= 0 && RESOLVE_MIN < best && (ip = dnsResolve(host))) {
+            var r = searchIP(ip, IP_RESOLVE, IP6_RESOLVE);
+            if (r < best) best = r;
+        }
+    }
+    if (MATCH >= 0 && MATCH < best) best = MATCH;
+    return best === NONE ? RESULTS[1] : RESULTS[POLICIES[best]];
+}
+"""
+
+
+def rule_files(config_dir, setting=None):
+    """服务器配置 rule_files（列表或逗号分隔，相对路径相对配置目录）对应的规则文件，默认为配置目录的 rules.txt"""
+    if isinstance(setting, str):
+        setting = setting.replace('，', ',').split(',')
+    names = [name.strip() for name in setting or () if name.strip()] or [RULES_NAME]
+    return [Path(config_dir) / name for name in names]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m echipa.rules', description='编译 Clash 风格的分流规则')
+    parser.add_argument('files', nargs='*', type=Path, help='规则文件（默认使用当前服务器的 rule_files）')
+    parser.add_argument('-config-dir', type=Path, default=None, help='配置目录（默认与 gui.py 相同）')
+    parser.add_argument('-pac', default='', help='输出 PAC 脚本，代理为该监听地址')
+    parser.add_argument('-windows', action='store_true', help='输出 Windows ProxyOverride')
+    parser.add_argument('-macos', action='store_true', help='输出 macOS 绕过列表')
+    args = parser.parse_args(argv)
+
+    from echipa.config import BaseConfigManager, desktop_config_dir
+    manager = BaseConfigManager(args.config_dir or desktop_config_dir())
+    files = args.files
+    if not files:
+        manager.load_config()
+        files = rule_files(manager.config_dir, manager.get_current_server().get('rule_files'))
+    rule_set = RuleSet(files, manager.config_dir, log=sys.stderr.write)
+    rule_set.refresh()
+    if args.pac:
+        print(rule_set.pac_script(args.pac))
+    if args.windows or args.macos:
+        from echipa.routing import macos_bypass_list, windows_bypass_list
+        if args.windows:
+            print(windows_bypass_list('rules', rules=rule_set))
+        if args.macos:
+            print('\n'.join(macos_bypass_list('rules', rules=rule_set)))
+    return 1 if rule_set.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
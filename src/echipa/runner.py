@@ -0,0 +1,408 @@
+"""
+ech-workers 子进程管理（不依赖 Qt/Toga）
+
+- build_command: 由服务器配置生成命令行
+- ProxyChild: 启动子进程并逐行转发输出
+- AsyncProxyChild: 同上，在调用方的 asyncio 事件循环中运行（Toga 前端）
+- FrontListener: 本地前置监听，把新连接转发到当前子进程；切换后端不影响已建立的连接
+- ProxySupervisor: 启动、停止与平滑重启（新进程在空闲端口就绪后再切换，旧进程排空后结束）
+"""
+
+import asyncio
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from echipa.dnsproxy import parse_addr
+
+DEFAULT_DNS = 'dns.alidns.com/dns-query'
+DEFAULT_ECH = 'cloudflare-ech.com'
+READY_MARK = '[代理] 服务器启动'
+DRAIN_SECONDS = 10  # 平滑重启时旧进程的默认排空时间
+READY_TIMEOUT = 15
+RELAY_BUFFER = 64 * 1024
+STOP_TIMEOUT = 3  # 停止时等待子进程退出的秒数，超时后强制结束
+LINE_LIMIT = 1024 * 1024  # 单行输出上限
+
+
+def build_command(exe, server, listen=None, ech_file=None):
+    """生成 ech-workers 命令行；listen 不为空时覆盖配置中的监听地址"""
+    cmd = [exe]
+    if server.get('server'):
+        cmd.extend(['-f', server['server']])
+    listen = listen or server.get('listen')
+    if listen:
+        cmd.extend(['-l', listen])
+    if server.get('token'):
+        cmd.extend(['-token', server['token']])
+    if server.get('ip'):
+        cmd.extend(['-ip', server['ip']])
+    if server.get('dns') and server['dns'] != DEFAULT_DNS:
+        cmd.extend(['-dns', server['dns']])
+    if server.get('ech') and server['ech'] != DEFAULT_ECH:
+        cmd.extend(['-ech', server['ech']])
+    if ech_file:
+        cmd.extend(['-echfile', str(ech_file)])
+    return cmd
+
+
+def decode_line(line):
+    """Go 程序输出 UTF-8，无法解码的字符替换掉"""
+    return line.decode('utf-8', errors='replace')
+
+
+def local_addr(listen):
+    """监听地址对应的本机连接地址（0.0.0.0/:: 换成回环地址）"""
+    host, port = parse_addr(listen)
+    if host in ('0.0.0.0', ''):
+        host = '127.0.0.1'
+    elif host == '::':
+        host = '::1'
+    return host, port
+
+
+def free_port(host='127.0.0.1'):
+    """由系统分配一个空闲端口"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def wait_port(addr, timeout=READY_TIMEOUT, alive=None):
+    """就绪探测：端口能建立 TCP 连接即视为就绪；子进程提前退出时返回 False"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if alive is not None and not alive():
+            return False
+        try:
+            socket.create_connection(addr, timeout=0.2).close()
+            return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+
+class ProxyChild:
+    """一个 ech-workers 子进程，输出逐行交给 log"""
+
+    def __init__(self, cmd, log, on_exit=None):
+        self.cmd = cmd
+        self.log = log
+        self.on_exit = on_exit
+        self.process = None
+        self.ready_ms = None  # 从启动到输出就绪标记的耗时
+
+    def start(self):
+        popen_kwargs = {'stdout': subprocess.PIPE, 'stderr': subprocess.STDOUT}
+        # Windows: 使用 CREATE_NO_WINDOW 隐藏控制台
+        if sys.platform == 'win32':
+            popen_kwargs['creationflags'] = 0x08000000
+        self._started = time.perf_counter()
+        self.process = subprocess.Popen(self.cmd, **popen_kwargs)
+        threading.Thread(target=self._pump, daemon=True).start()
+        return self
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def pid(self):
+        return self.process.pid if self.alive else None
+
+    def _pump(self):
+        for line in iter(self.process.stdout.readline, b''):
+            text = decode_line(line)
+            self.log(text)
+            if self.ready_ms is None and READY_MARK in text:
+                self.ready_ms = (time.perf_counter() - self._started) * 1000
+                self.log(f"[系统] 启动就绪耗时: {self.ready_ms:.0f}ms\n")
+        self.process.wait()
+        if self.on_exit:
+            self.on_exit(self)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        if not self.alive:
+            return
+        try:
+            self.process.terminate()
+            self.process.wait(timeout=timeout)
+        except Exception:
+            self.process.kill()
+
+
+class AsyncProxyChild:
+    """在当前事件循环中运行的 ech-workers 子进程，不使用读取线程；log 在事件循环线程中调用"""
+
+    def __init__(self, cmd, log):
+        self.cmd = cmd
+        self.log = log
+        self.process = None
+        self.ready_ms = None
+
+    async def start(self):
+        kwargs = {}
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = 0x08000000  # CREATE_NO_WINDOW
+        self._started = time.perf_counter()
+        self.process = await asyncio.create_subprocess_exec(
+            *self.cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+            limit=LINE_LIMIT, **kwargs)
+        return self
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def pid(self):
+        return self.process.pid if self.alive else None
+
+    async def run(self):
+        """转发输出直到子进程退出，返回退出码"""
+        while True:
+            try:
+                line = await self.process.stdout.readline()
+            except ValueError:  # 超过 LINE_LIMIT 的行丢弃已缓冲的部分
+                continue
+            if not line:
+                break
+            text = decode_line(line)
+            self.log(text)
+            if self.ready_ms is None and READY_MARK in text:
+                self.ready_ms = (time.perf_counter() - self._started) * 1000
+                self.log(f"[系统] 启动就绪耗时: {self.ready_ms:.0f}ms\n")
+        return await self.process.wait()
+
+    async def stop(self, timeout=STOP_TIMEOUT):
+        """先 terminate，timeout 秒内未退出再 kill"""
+        if not self.alive:
+            return
+        try:
+            self.process.terminate()
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+        except ProcessLookupError:
+            pass
+
+
+class FrontListener:
+    """前置 TCP 监听：每个新连接转发到当时的后端地址"""
+
+    def __init__(self, listen, backend):
+        self.listen = listen
+        self.backend = backend
+        self.accepted = 0
+        self.failed = 0
+        self._active = {}  # 后端地址 -> 活动连接数
+        self._lock = threading.Lock()
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        host, port = parse_addr(self.listen)
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, port))
+            sock.listen(128)
+        except OSError:
+            sock.close()
+            raise
+        sock.settimeout(0.5)
+        self._sock = sock
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def set_backend(self, backend):
+        """之后的新连接转发到 backend，已有连接保持不变"""
+        self.backend = backend
+
+    def active(self, backend=None):
+        with self._lock:
+            if backend is None:
+                return sum(self._active.values())
+            return self._active.get(backend, 0)
+
+    def stop(self):
+        if self._sock:
+            sock, self._sock = self._sock, None
+            sock.close()
+            self._thread.join(timeout=2)
+
+    def _serve(self):
+        while self._sock:
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._relay, args=(conn,), daemon=True).start()
+
+    def _relay(self, conn):
+        backend = self.backend
+        try:
+            upstream = socket.create_connection(backend, timeout=5)
+        except OSError:
+            self.failed += 1
+            conn.close()
+            return
+        self.accepted += 1
+        upstream.settimeout(None)
+        for sock in (conn, upstream):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self._active[backend] = self._active.get(backend, 0) + 1
+        try:
+            reverse = threading.Thread(target=self._pump, args=(upstream, conn), daemon=True)
+            reverse.start()
+            self._pump(conn, upstream)
+            reverse.join()
+        finally:
+            with self._lock:
+                self._active[backend] -= 1
+            conn.close()
+            upstream.close()
+
+    @staticmethod
+    def _pump(src, dst):
+        buf = bytearray(RELAY_BUFFER)
+        view = memoryview(buf)
+        try:
+            while True:
+                n = src.recv_into(buf)
+                if not n:
+                    break
+                dst.sendall(view[:n])
+        except OSError:
+            pass
+        finally:
+            try:
+                dst.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+
+class ProxySupervisor:
+    """管理当前 ech-workers 子进程
+
+    graceful=True 时由 FrontListener 占用配置的监听地址，子进程监听本机空闲端口，
+    重启时新旧进程短暂并存，新连接不会落到已关闭的端口上。
+    """
+
+    def __init__(self, exe, log, graceful=False, drain=DRAIN_SECONDS):
+        self.exe = exe
+        self.log = log
+        self.graceful = graceful
+        self.drain = drain
+        self.server = None
+        self.child = None
+        self.front = None
+        self.restarts = 0
+        self._draining = set()
+        self._finished = threading.Event()
+
+    def _spawn(self, server, listen, ech_file):
+        cmd = build_command(self.exe, server, listen=listen, ech_file=ech_file)
+        return ProxyChild(cmd, self.log, on_exit=self._on_exit).start()
+
+    def _on_exit(self, child):
+        self._draining.discard(child)
+        if child is self.child:
+            # 当前进程意外退出
+            self.child = None
+            self._finished.set()
+
+    def start(self, server, ech_file=None):
+        self.server = server
+        self._finished.clear()
+        if self.graceful:
+            # 先占用监听地址：地址被占用时直接失败，不会留下没人转发的子进程
+            backend = ('127.0.0.1', free_port())
+            front = FrontListener(server['listen'], backend).start()
+            try:
+                self.child = self._spawn(server, f'127.0.0.1:{backend[1]}', ech_file)
+            except BaseException:
+                front.stop()
+                raise
+            self.front = front
+        else:
+            self.child = self._spawn(server, server['listen'], ech_file)
+
+    @property
+    def pid(self):
+        """当前子进程的 pid（供 echipa.monitor 采样）；未运行时为 None"""
+        child = self.child
+        return child.pid if child is not None else None
+
+    def wait(self, timeout=None):
+        """阻塞到当前子进程退出或 stop() 被调用"""
+        return self._finished.wait(timeout)
+
+    def restart(self, server, ech_file=None):
+        """按新配置重启，返回 {'mode', 'ready_ms', 'downtime_ms'}；新进程未就绪时保留旧进程并返回 None"""
+        start = time.perf_counter()
+        self.restarts += 1
+        if self.front and server['listen'] == self.server['listen']:
+            backend = ('127.0.0.1', free_port())
+            child = self._spawn(server, f'127.0.0.1:{backend[1]}', ech_file)
+            if not wait_port(backend, alive=lambda: child.alive):
+                child.stop()
+                self.log("[系统] 新进程未能就绪，继续使用原进程\n")
+                return None
+            old, old_backend = self.child, self.front.backend
+            self.child, self.server = child, server
+            self.front.set_backend(backend)
+            ready_ms = (time.perf_counter() - start) * 1000
+            if old is not None:
+                self._draining.add(old)
+                threading.Thread(target=self._drain, args=(old, old_backend), daemon=True).start()
+            result = {'mode': 'graceful', 'ready_ms': ready_ms, 'downtime_ms': 0.0}
+        else:
+            # 监听地址变化或未启用前置监听：先停后启，期间监听端口不可用
+            old, self.child = self.child, None
+            if old is not None:
+                old.stop()
+            if self.front:
+                self.front.stop()
+                self.front = None
+            stopped = time.perf_counter()
+            self.start(server, ech_file)
+            probe = self.front.backend if self.front else local_addr(server['listen'])
+            ready = wait_port(probe, alive=lambda: self.child is not None and self.child.alive)
+            now = time.perf_counter()
+            result = {'mode': 'restart', 'ready_ms': (now - start) * 1000,
+                      'downtime_ms': (now - stopped) * 1000 if ready else None}
+        downtime = result['downtime_ms']
+        self.log(f"[系统] 重启完成（{'平滑' if result['mode'] == 'graceful' else '停止后启动'}），"
+                 f"就绪 {result['ready_ms']:.0f}ms，中断 "
+                 f"{'未就绪' if downtime is None else f'{downtime:.0f}ms'}\n")
+        return result
+
+    def _drain(self, child, backend):
+        """等旧进程上的连接结束或排空时间到期后再结束它"""
+        start = time.monotonic()
+        while time.monotonic() - start < self.drain and self.front and self.front.active(backend):
+            time.sleep(0.1)
+        remaining = self.front.active(backend) if self.front else 0
+        child.stop()
+        self.log(f"[系统] 旧进程已结束，排空 {time.monotonic() - start:.1f}s，强制断开 {remaining} 个连接\n")
+
+    def stop(self):
+        child, self.child = self.child, None
+        if self.front:
+            self.front.stop()
+            self.front = None
+        for old in list(self._draining):
+            old.stop()
+        if child is not None:
+            child.stop()
+        self._finished.set()
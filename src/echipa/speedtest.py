@@ -0,0 +1,314 @@
+"""
+经本地 SOCKS5 监听端口测量当前服务器的下载与上传速度（不依赖 Qt/Toga）
+
+多条并行连接各自下载/上传一部分数据，每个连接复用一块大缓冲区（recv_into / memoryview），
+按固定间隔采样累计字节数，得到：
+- goodput: 有效载荷吞吐（不含 HTTP 头），整个测试期间的平均值
+- steady: 后半段的平均吞吐，排除建连与 TCP 慢启动
+- ramp: 每个采样间隔的吞吐曲线，ramp_up_ms 为首次达到 steady 90% 的时间
+- fairness: 各连接吞吐的 Jain 公平性指数（1 为完全均分）
+
+结果按服务器 id 保存在配置目录的 speedtest.json，供排序比较。
+测试地址默认为 speed.cloudflare.com，可替换为本地替身目标服务（echipa.standin.Sink）。
+"""
+
+import json
+import os
+import socket
+import ssl
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from echipa import doh
+from echipa.config import atomic_write
+
+DOWNLOAD_URL = 'https://speed.cloudflare.com/__down?bytes={bytes}'
+UPLOAD_URL = 'https://speed.cloudflare.com/__up'
+DOWNLOAD_MB = 25  # 各连接合计
+UPLOAD_RATIO = 0.4  # 上传数据量相对下载的比例
+STREAMS = 4
+BUFFER_SIZE = 256 * 1024
+SOCKET_BUFFER = 1024 * 1024
+SAMPLE_INTERVAL = 0.1  # 秒
+TIMEOUT = 15  # 单次读写超时
+MAX_SECONDS = 30  # 每个方向的最长测试时间，超时后按已传输的数据计算
+STEADY_RATIO = 0.9
+
+STORE_NAME = 'speedtest.json'
+HISTORY = 10  # 每台服务器保留的结果数
+RANK_SAMPLES = 3  # 排序使用最近几次结果的中位数
+
+
+def jain_fairness(values):
+    """Jain 公平性指数：(Σx)² / (n·Σx²)，全部相等时为 1"""
+    squares = sum(v * v for v in values)
+    return sum(values) ** 2 / (len(values) * squares) if squares else None
+
+
+def _mbps(nbytes, seconds):
+    return nbytes * 8 / seconds / 1e6 if seconds > 0 else 0.0
+
+
+class _Stream:
+    """一条测速连接；bytes 只由所属线程写入，采样线程读取"""
+
+    def __init__(self):
+        self.bytes = 0
+        self.first_byte = None
+        self.finished = None
+        self.error = None
+
+
+def _open(proxy, url, timeout):
+    """经 SOCKS5 连接 url 所在主机，https 时完成 TLS 握手；返回 (socket, Host 头, 路径)"""
+    parts = urlsplit(url)
+    https = parts.scheme == 'https'
+    port = parts.port or (443 if https else 80)
+    sock = doh.socks5_connect(proxy, parts.hostname, port, timeout)
+    for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+        sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER)
+    if https:
+        sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+    path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+    host = parts.hostname if parts.port is None else f'{parts.hostname}:{parts.port}'
+    return sock, host, path
+
+
+def _read_head(sock, buf):
+    """读取响应头，返回 (状态码, Content-Length 或 None, 缓冲区中已读到的响应体字节数)"""
+    view = memoryview(buf)
+    filled = 0
+    while True:
+        n = sock.recv_into(view[filled:])
+        if not n:
+            raise ConnectionError('响应头未完整即断开')
+        filled += n
+        end = buf.find(b'\r\n\r\n', 0, filled)
+        if end >= 0:
+            break
+        if filled == len(buf):
+            raise ConnectionError('响应头过大')
+    lines = bytes(buf[:end]).decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    length = None
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, length, filled - end - 4
+
+
+def _download(proxy, url, size, stream, started, deadline, timeout):
+    buf = bytearray(BUFFER_SIZE)
+    sock, host, path = _open(proxy, url.format(bytes=size), timeout)
+    try:
+        sock.sendall(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: echipa-speedtest\r\n'
+                     f'Accept-Encoding: identity\r\nConnection: close\r\n\r\n'.encode('latin-1'))
+        status, length, body = _read_head(sock, buf)
+        if status != 200:
+            raise ConnectionError(f'HTTP {status}')
+        stream.first_byte = time.perf_counter() - started
+        stream.bytes = body
+        remaining = (length if length is not None else size) - body
+        while remaining > 0 and time.perf_counter() < deadline:
+            n = sock.recv_into(buf)
+            if not n:
+                break
+            stream.bytes += n
+            remaining -= n
+    finally:
+        sock.close()
+
+
+def _upload(proxy, url, size, stream, started, deadline, timeout, block):
+    sock, host, path = _open(proxy, url, timeout)
+    try:
+        sock.sendall(f'POST {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: echipa-speedtest\r\n'
+                     f'Content-Type: application/octet-stream\r\nContent-Length: {size}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('latin-1'))
+        stream.first_byte = time.perf_counter() - started
+        remaining = size
+        while remaining > 0:
+            if time.perf_counter() >= deadline:
+                return  # 未发完，服务端不会回复
+            n = min(remaining, len(block))
+            sock.sendall(block[:n])
+            stream.bytes += n
+            remaining -= n
+        status, _, _ = _read_head(sock, bytearray(16 * 1024))
+        if status != 200:
+            raise ConnectionError(f'HTTP {status}')
+    finally:
+        sock.close()
+
+
+def measure(direction, proxy, url, total_bytes, streams=STREAMS, timeout=TIMEOUT, max_seconds=MAX_SECONDS):
+    """单个方向的测试（'download' 或 'upload'），返回结果字典"""
+    streams = max(1, streams)
+    per_stream = max(1, total_bytes // streams)
+    block = memoryview(os.urandom(BUFFER_SIZE)) if direction == 'upload' else None
+    state = [_Stream() for _ in range(streams)]
+    started = time.perf_counter()
+    deadline = started + max_seconds
+
+    def worker(stream):
+        try:
+            if direction == 'download':
+                _download(proxy, url, per_stream, stream, started, deadline, timeout)
+            else:
+                _upload(proxy, url, per_stream, stream, started, deadline, timeout, block)
+        except (OSError, ValueError, IndexError) as e:
+            stream.error = str(e) or type(e).__name__
+        stream.finished = time.perf_counter() - started
+
+    threads = [threading.Thread(target=worker, args=(s,), daemon=True) for s in state]
+    for thread in threads:
+        thread.start()
+
+    # 按固定间隔采样所有连接的累计字节数
+    totals = []
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(SAMPLE_INTERVAL)
+        totals.append(sum(s.bytes for s in state))
+    elapsed = max(s.finished for s in state)
+
+    transferred = sum(s.bytes for s in state)
+    ramp = [_mbps(b - a, SAMPLE_INTERVAL) for a, b in zip([0] + totals, totals)]
+    full = ramp[:-1] or ramp  # 最后一个间隔通常不完整
+    while len(full) > 1 and not full[-1]:  # 上传发完后等待响应的间隔
+        full.pop()
+    tail = full[len(full) // 2:]
+    steady = sum(tail) / len(tail) if tail else 0.0
+    ramp_up = next((i + 1 for i, rate in enumerate(ramp) if rate >= steady * STEADY_RATIO), None)
+    per_stream_mbps = [_mbps(s.bytes, s.finished) for s in state]
+    first_bytes = [s.first_byte for s in state if s.first_byte is not None]
+    errors = [s.error for s in state if s.error]
+    return {
+        'bytes': transferred,
+        'seconds': round(elapsed, 3),
+        'goodput_mbps': round(_mbps(transferred, elapsed), 2),
+        'steady_mbps': round(steady, 2),
+        'ramp_up_ms': round(ramp_up * SAMPLE_INTERVAL * 1000) if ramp_up and steady else None,
+        'ramp_mbps': [round(rate, 1) for rate in ramp],
+        'ttfb_ms': round(statistics.median(first_bytes) * 1000, 1) if first_bytes else None,
+        'streams': streams,
+        'per_stream_mbps': [round(rate, 2) for rate in per_stream_mbps],
+        'fairness': round(jain_fairness(per_stream_mbps), 3) if transferred else None,
+        'complete': transferred >= per_stream * streams and not errors,
+        'errors': errors,
+    }
+
+
+def run_speed_test(proxy, download_url=DOWNLOAD_URL, upload_url=UPLOAD_URL, download_mb=DOWNLOAD_MB,
+                   upload_mb=None, streams=STREAMS, log=None):
+    """先下载后上传；download_url 中的 {bytes} 替换为每个连接的字节数
+
+    upload_mb 为空时取 download_mb * UPLOAD_RATIO，为 0 时跳过上传。
+    """
+    log = log or (lambda text: None)
+    if upload_mb is None:
+        upload_mb = download_mb * UPLOAD_RATIO
+    result = {'time': time.time(), 'streams': streams}
+    for direction, url, mb in (('download', download_url, download_mb), ('upload', upload_url, upload_mb)):
+        if not mb:
+            continue
+        log(f"[测速] {'下载' if direction == 'download' else '上传'} {mb:g}MB，{streams} 个连接...\n")
+        part = result[direction] = measure(direction, proxy, url, int(mb * 1024 * 1024), streams)
+        log(f"[测速] {format_result(direction, part)}\n")
+    return result
+
+
+def test_server(server, store, download_mb=DOWNLOAD_MB, log=None):
+    """经 server 的本地监听端口测速并保存结果（server 需正在运行）
+
+    服务器配置可用 speedtest_download_url / speedtest_upload_url / speedtest_streams 覆盖默认值，
+    例如指向本地替身目标服务。
+    """
+    from echipa.runner import local_addr
+    result = run_speed_test(local_addr(server['listen']),
+                            server.get('speedtest_download_url') or DOWNLOAD_URL,
+                            server.get('speedtest_upload_url') or UPLOAD_URL,
+                            download_mb, streams=server.get('speedtest_streams') or STREAMS, log=log)
+    store.record(server['id'], result, server.get('name'))
+    return result
+
+
+def parse_size(arg):
+    """控制接口 ?mb= 参数；为空时使用默认值，无效时抛出 ValueError"""
+    try:
+        mb = float(arg) if arg else DOWNLOAD_MB
+    except ValueError:
+        mb = 0
+    if not 0 < mb <= 1024:
+        raise ValueError(f'测速数据量无效: {arg}（应为 0 到 1024 之间的 MB 数）')
+    return mb
+
+
+def format_result(direction, part):
+    name = '下载' if direction == 'download' else '上传'
+    if not part['bytes']:
+        return f"{name}失败: {'; '.join(part['errors'][:1]) or '没有数据'}"
+    text = (f"{name} {part['goodput_mbps']:.1f} Mbps（稳定 {part['steady_mbps']:.1f} Mbps，"
+            f"爬升 {part['ramp_up_ms'] or '-'}ms，首字节 {part['ttfb_ms'] or '-'}ms，公平性 {part['fairness']:.2f}）")
+    if part['errors']:
+        text += f"，{len(part['errors'])} 个连接失败: {part['errors'][0]}"
+    return text
+
+
+class SpeedTestStore:
+    """按服务器 id 保存最近 HISTORY 次测速结果"""
+
+    def __init__(self, config_dir):
+        self.path = config_dir / STORE_NAME
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._results = json.load(f)
+        except (OSError, ValueError):
+            self._results = {}
+
+    def record(self, server_id, result, name=None):
+        with self._lock:
+            history = self._results.setdefault(server_id, [])
+            history.append(dict(result, name=name) if name else result)
+            del history[:-HISTORY]
+            atomic_write(self.path, json.dumps(self._results, ensure_ascii=False))
+
+    def history(self, server_id):
+        with self._lock:
+            return list(self._results.get(server_id, ()))
+
+    def latest(self, server_id):
+        history = self.history(server_id)
+        return history[-1] if history else None
+
+    def ranking(self, direction='download'):
+        """按最近 RANK_SAMPLES 次稳定吞吐的中位数从高到低排序，返回 [(server_id, 名称, Mbps), ...]"""
+        with self._lock:
+            items = list(self._results.items())
+        ranked = []
+        for server_id, history in items:
+            rates = [r[direction]['steady_mbps'] for r in history[-RANK_SAMPLES:] if direction in r]
+            if rates:
+                ranked.append((server_id, history[-1].get('name'), statistics.median(rates)))
+        ranked.sort(key=lambda item: item[2], reverse=True)
+        return ranked
+
+    def report(self, running=None):
+        """控制接口 GET /speedtest 的内容；running 为正在测速的服务器 id"""
+        with self._lock:
+            latest = {server_id: history[-1] for server_id, history in self._results.items() if history}
+        return {
+            'running': running,
+            'latest': latest,
+            'ranking': {direction: [{'server_id': server_id, 'name': name, 'steady_mbps': rate}
+                                    for server_id, name, rate in self.ranking(direction)]
+                        for direction in ('download', 'upload')},
+        }
+
+    def forget(self, server_id):
+        with self._lock:
+            if self._results.pop(server_id, None) is not None:
+                atomic_write(self.path, json.dumps(self._results, ensure_ascii=False))
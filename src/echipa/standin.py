@@ -0,0 +1,324 @@
+"""
+本地替身服务，供离线测试与基准使用（不需要 Cloudflare）
+
+- StandInWorker: 与 _worker.js 相同的会话协议
+- Sink: 目标服务，HTTP 请求按路径返回指定大小的响应，其他数据原样回显
+- StandInDoH: DoH 服务，HTTPS 查询返回 ECHConfigList，A 查询返回固定地址
+
+    python -m echipa.standin [监听地址] [令牌]
+
+只监听明文 WebSocket（ws://），隧道引擎以 server='ws://127.0.0.1:端口' 连接。
+"""
+
+import abc
+import asyncio
+import base64
+import os
+import struct
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+from echipa import doh, ws
+from echipa.dnsproxy import parse_addr
+
+RELAY_BUFFER = 64 * 1024
+HTTP_METHODS = (b'GET ', b'HEAD ', b'POST ', b'PUT ')
+DOH_TTL = 300
+
+
+def parse_target(addr):
+    """与 _worker.js 的 parseAddress 相同：[v6]:port 或 host:port"""
+    if addr.startswith('['):
+        end = addr.index(']')
+        return addr[1:end], int(addr[end + 2:])
+    host, port = addr.rsplit(':', 1)
+    return host, int(port)
+
+
+class StandInWorker:
+    """WebSocket 服务端：CONNECT:目标|首帧 → 连接目标并回复 CONNECTED，之后双向转发"""
+
+    def __init__(self, listen='127.0.0.1:0', token=None):
+        self.listen = listen
+        self.token = token
+        self.sessions = 0
+        self.errors = 0
+        self._server = None
+
+    async def start(self):
+        host, port = parse_addr(self.listen)
+        self._server = await asyncio.start_server(self._handle, host, port, limit=ws.MAX_MESSAGE)
+        return self
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname()[:2] if self._server else None
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            socket_, _ = await ws.accept(reader, writer, self.token)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        if socket_ is None:
+            writer.close()
+            return
+        self.sessions += 1
+        remote = None
+        pump = None
+        try:
+            while True:
+                opcode, message = await socket_.recv()
+                if opcode == ws.OP_TEXT:
+                    if message.startswith(b'CONNECT:'):
+                        target, _, first_frame = message[8:].partition(b'|')
+                        host, port = parse_target(target.decode('utf-8'))
+                        try:
+                            remote_reader, remote = await asyncio.open_connection(host, port)
+                            if first_frame:
+                                remote.write(first_frame)
+                        except OSError as e:
+                            self.errors += 1
+                            await socket_.send(f'ERROR:{e}')
+                            return
+                        await socket_.send('CONNECTED')
+                        pump = asyncio.ensure_future(self._pump(remote_reader, socket_))
+                    elif message.startswith(b'DATA:') and remote:
+                        remote.write(message[5:])
+                        await remote.drain()
+                    elif message == b'CLOSE':
+                        return
+                elif remote:
+                    remote.write(message)
+                    await remote.drain()
+        except (ws.ConnectionClosed, ConnectionError, asyncio.CancelledError):  # 事件循环结束时未关闭的连接被取消
+            pass
+        finally:
+            if pump:
+                pump.cancel()
+            if remote:
+                remote.close()
+            await socket_.close()
+
+    @staticmethod
+    async def _pump(remote_reader, socket_):
+        try:
+            while True:
+                data = await remote_reader.read(RELAY_BUFFER)
+                if not data:
+                    break
+                await socket_.send(data)
+            await socket_.send('CLOSE')
+        except (ws.ConnectionClosed, ConnectionError):
+            pass
+
+
+class _Server(abc.ABC):
+    """asyncio 服务的启动、地址与停止；子类实现 _handle"""
+
+    def __init__(self, listen):
+        self.listen = listen
+        self._server = None
+
+    async def start(self):
+        host, port = parse_addr(self.listen)
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname()[:2] if self._server else None
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    @abc.abstractmethod
+    async def _handle(self, reader, writer):
+        """处理一个连接"""
+
+
+class Sink(_Server):
+    """目标服务：以 HTTP 方法开头的连接按 HTTP/1.1 处理（GET /字节数 返回该大小的响应体，请求体读取后丢弃，
+    支持 keep-alive），其他连接原样回显
+    """
+
+    def __init__(self, listen='127.0.0.1:0'):
+        super().__init__(listen)
+        self.connections = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._block = os.urandom(RELAY_BUFFER)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            first = await reader.read(RELAY_BUFFER)
+            if first.startswith(HTTP_METHODS):
+                await self._http(first, reader, writer)
+            else:
+                await self._echo(first, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _echo(self, data, reader, writer):
+        while data:
+            self.bytes_in += len(data)
+            writer.write(data)
+            self.bytes_out += len(data)
+            await writer.drain()
+            data = await reader.read(RELAY_BUFFER)
+
+    async def _http(self, data, reader, writer):
+        buffer = bytearray(data)
+        while True:
+            end = buffer.find(b'\r\n\r\n')
+            while end < 0:
+                chunk = await reader.read(RELAY_BUFFER)
+                if not chunk:
+                    return
+                buffer += chunk
+                end = buffer.find(b'\r\n\r\n')
+            head = bytes(buffer[:end]).decode('latin-1').split('\r\n')
+            del buffer[:end + 4]
+            self.bytes_in += end + 4
+            method, target = head[0].split(' ')[:2]
+            path = urlsplit(target).path.strip('/')  # 普通 HTTP 代理请求的目标是完整 URL
+            length = next((int(line.split(':', 1)[1]) for line in head[1:]
+                           if line.lower().startswith('content-length:')), 0)
+            while length > 0:  # 丢弃请求体（上传测速）
+                if not buffer:
+                    buffer += await reader.read(RELAY_BUFFER)
+                    if not buffer:
+                        return
+                n = min(length, len(buffer))
+                del buffer[:n]
+                self.bytes_in += n
+                length -= n
+            size = int(path) if path.isdigit() else 0
+            writer.write(f'HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\n'
+                         f'Content-Length: {size}\r\n\r\n'.encode('latin-1'))
+            if method != 'HEAD':
+                remaining = size
+                while remaining > 0:
+                    n = min(remaining, RELAY_BUFFER)
+                    writer.write(self._block[:n])
+                    remaining -= n
+                    await writer.drain()
+                self.bytes_out += size
+            await writer.drain()
+            if any(line.lower() == 'connection: close' for line in head[1:]):
+                return
+
+
+def fake_ech_config(public_name='cloudflare-ech.com'):
+    """格式正确的 ECHConfigList（版本 0xfe0d，X25519/HKDF-SHA256/AES-128-GCM，随机公钥）"""
+    name = public_name.encode('ascii')
+    contents = (b'\x01' + struct.pack('!HH', 0x0020, 32) + os.urandom(32)
+                + struct.pack('!HHH', 4, 0x0001, 0x0001)
+                + bytes([0, len(name)]) + name + b'\x00\x00')
+    config = struct.pack('!HH', 0xfe0d, len(contents)) + contents
+    return struct.pack('!H', len(config)) + config
+
+
+class StandInDoH(_Server):
+    """DoH 服务（RFC 8484，明文 HTTP，POST 与 GET ?dns= 均可）
+
+    HTTPS 查询返回带 ECHConfigList 的记录，A 查询返回 address，其他类型返回空应答。
+    ech-workers 与 echipa.doh 的 DoH 地址都接受 http:// 前缀。
+    """
+
+    def __init__(self, listen='127.0.0.1:0', address='127.0.0.1', ech_config=None, delay=0):
+        super().__init__(listen)
+        self.ip = bytes(int(part) for part in address.split('.'))
+        self.ech_config = ech_config or fake_ech_config()
+        self.delay = delay  # 模拟公网往返（秒）
+        self.queries = 0
+
+    @property
+    def url(self):
+        host, port = self.address
+        return f'http://{host}:{port}/dns-query'
+
+    def answer(self, query):
+        """对查询报文生成应答报文"""
+        _, qtype, _ = doh.parse_question(query)
+        question_end = query.index(b'\x00', 12) + 5  # 查询中的域名不压缩
+        header = bytearray(query[:12])
+        header[2:4] = b'\x81\x80'
+        if qtype == doh.TYPE_HTTPS:
+            rdata = struct.pack('!H', 1) + b'\x00' + struct.pack('!HH', 5, len(self.ech_config)) + self.ech_config
+        elif qtype == doh.TYPE_A:
+            rdata = self.ip
+        else:
+            rdata = None
+        header[6:12] = struct.pack('!HHH', 1 if rdata else 0, 0, 0)
+        body = bytes(header) + query[12:question_end]
+        if rdata:
+            body += b'\xc0\x0c' + struct.pack('!HHIH', qtype, 1, DOH_TTL, len(rdata)) + rdata
+        return body
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+                method, target = head[0].split(' ')[:2]
+                headers = {}
+                for line in head[1:]:
+                    if ':' in line:
+                        key, value = line.split(':', 1)
+                        headers[key.strip().lower()] = value.strip()
+                if method == 'POST':
+                    query = await reader.readexactly(int(headers.get('content-length', 0)))
+                else:
+                    param = parse_qs(urlsplit(target).query).get('dns', [''])[0]
+                    query = base64.urlsafe_b64decode(param + '=' * (-len(param) % 4))
+                self.queries += 1
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                try:
+                    body = self.answer(query)
+                    status = '200 OK'
+                except (ValueError, IndexError, struct.error):
+                    body, status = b'', '400 Bad Request'
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/dns-message\r\n'
+                             f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError,
+                asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    listen = argv[0] if argv else '127.0.0.1:8787'
+    token = argv[1] if len(argv) > 1 else None
+
+    async def run():
+        worker = await StandInWorker(listen, token).start()
+        sink = await Sink().start()
+        resolver = await StandInDoH().start()
+        print(f"替身 worker 已启动: ws://{worker.address[0]}:{worker.address[1]}")
+        print(f"目标服务: {sink.address[0]}:{sink.address[1]}")
+        print(f"DoH: {resolver.url}")
+        await asyncio.Event().wait()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+启动耗时分析
+记录启动各阶段时间点，并可像 `python -X importtime` 一样统计每个模块的导入耗时
+"""
+
+import builtins
+import json
+import sys
+import time
+
+# 以本模块被导入的时刻作为起点，应尽量在入口脚本最前面导入
+_T0 = time.perf_counter()
+
+
+class ImportTimer:
+    """包装 __import__，统计首次导入的自身/累计耗时（微秒）"""
+
+    def __init__(self):
+        self.records = []  # (模块名, 自身耗时, 累计耗时, 嵌套深度)
+        self._stack = []
+        self._original = None
+
+    def install(self):
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self.records.append((name, (elapsed - children) * 1e6, elapsed * 1e6, len(self._stack)))
+
+    def format(self, limit=None):
+        """按 -X importtime 的格式输出（按累计耗时排序时可指定 limit）"""
+        rows = self.records
+        if limit:
+            rows = sorted(rows, key=lambda r: r[2], reverse=True)[:limit]
+        lines = ['import time: self [us] | cumulative | imported package']
+        for name, own, total, depth in rows:
+            lines.append(f'import time: {own:9.0f} | {total:10.0f} | {"  " * depth}{name}')
+        return '\n'.join(lines)
+
+
+class StartupProfile:
+    """启动阶段计时"""
+
+    def __init__(self, trace_imports=False):
+        self.marks = []
+        self.imports = ImportTimer() if trace_imports else None
+        if self.imports:
+            self.imports.install()
+
+    def mark(self, phase):
+        """记录阶段完成时刻（距离起点的毫秒数）"""
+        self.marks.append((phase, (time.perf_counter() - _T0) * 1000))
+
+    def elapsed(self, phase):
+        for name, ms in self.marks:
+            if name == phase:
+                return ms
+        return None
+
+    def report(self):
+        if self.imports:
+            self.imports.uninstall()
+        data = {'phases': {name: round(ms, 2) for name, ms in self.marks}}
+        if self.imports:
+            data['imports'] = [
+                {'module': name, 'self_us': round(own), 'cumulative_us': round(total), 'depth': depth}
+                for name, own, total, depth in self.imports.records
+            ]
+        return data
+
+    def save(self, path):
+        """写入 JSON 报告，并在 stderr 打印摘要"""
+        data = self.report()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        lines = [f'[启动] {name}: {ms:.1f}ms' for name, ms in self.marks]
+        if self.imports:
+            lines.append(self.imports.format(limit=25))
+        print('\n'.join(lines), file=sys.stderr)
+        return data
@@ -0,0 +1,277 @@
+"""
+服务器订阅
+并发拉取订阅地址（条件 GET），流式解析，并按 (server, ip, token) 哈希索引去重后增量合并
+
+订阅内容支持：
+- JSON 数组: [{"name": ..., "server": ..., "ip": ..., "token": ...}, ...]
+- JSON Lines: 每行一个上述对象
+- config.json 格式: {"servers": [...]}
+"""
+
+import codecs
+import hashlib
+import json
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from echipa.config import atomic_write, default_server
+
+STATE_NAME = 'subscriptions.json'
+CHUNK_SIZE = 64 * 1024
+
+# 订阅可以提供的字段，其他字段（id、本地分流设置等）以本地为准
+SUBSCRIPTION_FIELDS = ('name', 'server', 'ip', 'token', 'dns', 'ech', 'tags')
+
+
+def dedup_key(server):
+    """去重键：(server, ip, token) 的哈希"""
+    raw = '\x00'.join((server.get('server', ''), server.get('ip', ''), server.get('token', '')))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def fingerprint(entry):
+    return hashlib.sha1(json.dumps(entry, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def iter_entries(chunks):
+    """从字节块流中逐个解析服务器对象，不必等整个订阅下载完
+
+    内容结束时仍有无法解析的文本（HTML 错误页、中途损坏的对象等）抛出 ValueError，
+    调用方不会拿到只解析了一部分的列表。
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    buf = ''
+    pos = 0
+    opened = closed = False  # 读到了数组开头的 [ / 结尾的 ]
+
+    def parse():
+        nonlocal pos, opened, closed
+        while not closed:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,[':
+                opened = opened or buf[pos] == '['
+                pos += 1
+            if pos >= len(buf):
+                return
+            if buf[pos] == ']':
+                pos += 1
+                closed = True
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                return  # 对象不完整，等待更多数据
+            pos = end
+            if isinstance(obj, dict) and isinstance(obj.get('servers'), list):
+                yield from (s for s in obj['servers'] if isinstance(s, dict))
+            elif isinstance(obj, dict):
+                yield obj
+
+    for chunk in chunks:
+        buf = buf[pos:] + text.decode(chunk)
+        pos = 0
+        yield from parse()
+    buf = buf[pos:] + text.decode(b'', final=True)
+    pos = 0
+    yield from parse()
+    rest = buf[pos:].strip()
+    if rest:
+        raise ValueError(f"订阅内容无法解析: {rest[:60]!r}")
+    if opened and not closed:
+        raise ValueError("订阅内容不完整: JSON 数组没有结束")
+
+
+def normalize(entry):
+    """只保留订阅字段，缺少服务地址的条目丢弃"""
+    if not entry.get('server'):
+        return None
+    result = {k: entry[k] for k in SUBSCRIPTION_FIELDS if k in entry and entry[k] is not None}
+    result.setdefault('name', result['server'])
+    return result
+
+
+class SubscriptionManager:
+    """订阅列表及其同步状态（保存在配置目录的 subscriptions.json）"""
+
+    def __init__(self, config_manager, log=None, max_workers=4, timeout=15):
+        self.config_manager = config_manager
+        self.state_file = config_manager.config_dir / STATE_NAME
+        self.log = log or (lambda text: None)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.subscriptions = {}
+        self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                self.subscriptions = {s['url']: s for s in json.load(f)}
+        except (OSError, ValueError):
+            self.subscriptions = {}
+
+    def _save_state(self):
+        atomic_write(self.state_file, json.dumps(list(self.subscriptions.values()),
+                                                 ensure_ascii=False, separators=(',', ':')))
+
+    def add(self, url, name=None):
+        """添加订阅地址"""
+        if url not in self.subscriptions:
+            self.subscriptions[url] = {'url': url, 'name': name or url, 'entries': {}}
+            self._save_state()
+
+    def remove(self, url):
+        """删除订阅及其导入的服务器"""
+        sub = self.subscriptions.pop(url, None)
+        if sub:
+            for sid, _, _ in sub['entries'].values():
+                self.config_manager.delete_server(sid)
+            self.config_manager.save_config()
+            self._save_state()
+
+    # ---------- 拉取 ----------
+
+    def _fetch(self, sub):
+        """条件 GET；304 时返回 None，否则返回 (解析出的条目, 内容摘要, 响应头)；内容无法完整解析时抛出 ValueError"""
+        request = urllib.request.Request(sub['url'], headers={'Accept-Encoding': 'identity'})
+        if sub.get('etag'):
+            request.add_header('If-None-Match', sub['etag'])
+        if sub.get('last_modified'):
+            request.add_header('If-Modified-Since', sub['last_modified'])
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise
+        digest = hashlib.sha1()
+        size = 0
+
+        def chunks():
+            nonlocal size
+            with response:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        return
+                    digest.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+
+        entries = [e for e in map(normalize, iter_entries(chunks())) if e]
+        if size and not entries:
+            # 多半是登录页/错误页；不能当作订阅已清空而删除它导入的全部服务器
+            raise ValueError("订阅内容中没有可用的服务器")
+        return entries, digest.hexdigest(), response.headers
+
+    def _sync_one(self, sub):
+        start = time.perf_counter()
+        result = {'url': sub['url'], 'status': 'unchanged', 'added': 0, 'updated': 0, 'removed': 0}
+        try:
+            fetched = self._fetch(sub)
+            if fetched is not None:
+                entries, digest, headers = fetched
+                sub['etag'] = headers.get('ETag')
+                sub['last_modified'] = headers.get('Last-Modified')
+                if digest != sub.get('digest'):
+                    result['fetched'] = entries
+                    result['digest'] = digest
+                    result['status'] = 'changed'
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        result['fetch_ms'] = (time.perf_counter() - start) * 1000
+        return result
+
+    # ---------- 合并 ----------
+
+    def _unique_name(self, name, pending):
+        """名称重复时追加序号；pending 为本次合并中尚未写入的名称"""
+        candidate = name
+        i = 2
+        while candidate in pending or self.config_manager.name_exists(candidate):
+            candidate = f'{name} ({i})'
+            i += 1
+        pending.add(candidate)
+        return candidate
+
+    def _merge(self, sub, entries, index):
+        """只写入新增/变化的条目，并删除订阅中已不存在的条目"""
+        cm = self.config_manager
+        old = sub['entries']
+        new = {}
+        changed = []
+        pending = set()
+        added = updated = 0
+        tag = f"sub:{sub['name']}"
+        for entry in entries:
+            key = dedup_key(entry)
+            if key in new:
+                continue
+            fp = fingerprint(entry)
+            if key in old:
+                sid, old_fp, old_name = old[key]
+                new[key] = [sid, fp, entry['name']]
+                current = cm.get_server(sid)
+                if current is None:
+                    continue  # 用户已手动删除，保留记录以免下次又被加回
+                if old_fp != fp:
+                    merged = dict(current)
+                    merged.update(entry)
+                    # 订阅里的名称没变时保留本地名称（可能已去重或被用户重命名）
+                    merged['name'] = current['name'] if entry['name'] == old_name \
+                        else self._unique_name(entry['name'], pending)
+                    merged['tags'] = sorted(set(entry.get('tags', [])) | {tag})
+                    changed.append(merged)
+                    updated += 1
+            elif key in index:
+                continue  # 已有相同的手动配置
+            else:
+                server = default_server()
+                server.update(entry)
+                server['id'] = str(uuid.uuid4())
+                server['name'] = self._unique_name(entry['name'], pending)
+                server['tags'] = sorted(set(entry.get('tags', [])) | {tag})
+                server['subscription'] = sub['url']
+                changed.append(server)
+                index[key] = server['id']
+                new[key] = [server['id'], fp, entry['name']]
+                added += 1
+        if changed:
+            cm.store.bulk_import(changed)
+        removed = [sid for key, (sid, _, _) in old.items() if key not in new]
+        for sid in removed:
+            cm.delete_server(sid)
+        sub['entries'] = new
+        return added, updated, len(removed)
+
+    def sync_all(self):
+        """并发拉取所有订阅并合并，返回每个订阅的结果"""
+        if not self.subscriptions:
+            return []
+        start = time.perf_counter()
+        subs = list(self.subscriptions.values())
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(subs))) as pool:
+            results = list(pool.map(self._sync_one, subs))
+
+        index = None
+        for sub, result in zip(subs, results):
+            if result['status'] != 'changed':
+                continue
+            if index is None:
+                index = {dedup_key(s): s['id'] for s in self.config_manager.servers}
+            added, updated, removed = self._merge(sub, result.pop('fetched'), index)
+            sub['digest'] = result.pop('digest')
+            result.update(added=added, updated=updated, removed=removed)
+            self.log(f"[订阅] {sub['name']}: 新增 {added}，更新 {updated}，删除 {removed}\n")
+        if any(r['status'] == 'changed' for r in results):
+            self.config_manager.save_config()
+        self._save_state()
+        elapsed = (time.perf_counter() - start) * 1000
+        for result in results:
+            if result['status'] == 'error':
+                self.log(f"[订阅] 同步失败 {result['url']}: {result['error']}\n")
+        self.log(f"[订阅] 同步完成，共 {len(results)} 个订阅，耗时 {elapsed:.0f}ms\n")
+        return results
@@ -0,0 +1,484 @@
+"""
+进程内隧道引擎（纯 Python asyncio），供无法运行 ech-workers 可执行文件的平台使用（如 iOS 沙盒）
+
+在 listen 地址接受 SOCKS5 与 HTTP 代理请求（CONNECT 及 GET/POST 等），每个连接建立一条
+WebSocket，使用与 _worker.js 相同的协议：
+
+    → 文本 CONNECT:目标|首帧      ← 文本 CONNECTED 或 ERROR:原因
+    ↔ 二进制数据                  → / ← 文本 CLOSE
+
+与 ech-workers 的差异：
+- Python 的 ssl 模块不支持 ECH，TLS 握手中的 SNI 是明文的 worker 域名
+- SOCKS5 不等待 100ms 收集首帧，CONNECTED 之后直接以二进制发送（首帧按文本发送会被 worker 按 UTF-8 解码）；
+  HTTP 代理请求不是合法 UTF-8（如二进制请求体）时同样在 CONNECTED 之后以二进制发送
+- 不支持 SOCKS5 UDP ASSOCIATE
+
+本地连接的数据直接读入每个连接预分配的缓冲区（asyncio.BufferedProtocol），发往 worker 前不再复制；
+任一方向的发送缓冲积压时暂停读取另一端，内存占用与连接数成正比而与流量无关。
+
+也可以作为独立进程运行，参数与 ech-workers 相同：
+
+    python -m echipa.tunnel -f 服务器 -l 127.0.0.1:30000 [-token 令牌] [-ip 优选IP]
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import socket
+import ssl
+import struct
+import sys
+import time
+from collections import deque
+
+from echipa import ws
+from echipa.dnsproxy import parse_addr
+
+RELAY_BUFFER = 32 * 1024  # 与 ech-workers 的读取缓冲一致
+HANDSHAKE_TIMEOUT = 30
+PING_INTERVAL = 10
+MAX_HTTP_HEADER = 64 * 1024
+MAX_HTTP_BODY = 10 * 1024 * 1024
+LATENCY_SAMPLES = 1000
+
+SOCKS_OK = b'\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00'
+SOCKS_FAIL = b'\x05\x04\x00\x01\x00\x00\x00\x00\x00\x00'
+SOCKS_BAD_COMMAND = b'\x05\x07\x00\x01\x00\x00\x00\x00\x00\x00'
+SOCKS_BAD_ADDRESS = b'\x05\x08\x00\x01\x00\x00\x00\x00\x00\x00'
+
+MODE_SOCKS5 = 1
+MODE_HTTP_CONNECT = 2
+MODE_HTTP_PROXY = 3
+
+
+def parse_server(server):
+    """'host:port/path'（与 ech-workers 的 -f 相同）→ (tls, host, port, path)；ws:// 前缀表示不使用 TLS"""
+    tls = True
+    for scheme, secure in (('wss://', True), ('ws://', False)):
+        if server.startswith(scheme):
+            server, tls = server[len(scheme):], secure
+    path = '/'
+    if '/' in server:
+        server, path = server[:server.index('/')], server[server.index('/'):]
+    host, port = parse_addr(server, default_host='')
+    if not host:
+        raise ValueError(f'无效的服务器地址: {server}')
+    return tls, host, port, path
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class LocalConnection(asyncio.BufferedProtocol):
+    """本地客户端连接：数据读入预分配的缓冲区，由协程按需取用
+
+    缓冲区写满（上游发送慢）时暂停读取；向客户端写入积压时 drain() 等待。
+    """
+
+    def __init__(self, size, on_connect):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # 未取用数据为 buffer[start:end]
+        self.end = 0
+        self.eof = False
+        self.transport = None
+        self.on_connect = on_connect
+        self._waiter = None
+        self._read_paused = False
+        self._write_paused = None  # 发送缓冲积压时为 Future
+
+    # ---------- asyncio 回调 ----------
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.on_connect(self)
+
+    def get_buffer(self, sizehint):
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buffer):
+            # 把未取用的数据移到开头
+            n = self.end - self.start
+            self.buffer[:n] = self.view[self.start:self.end]
+            self.start, self.end = 0, n
+        return self.view[self.end:]
+
+    def buffer_updated(self, nbytes):
+        self.end += nbytes
+        if self.end == len(self.buffer) and self.start == 0:
+            self.transport.pause_reading()
+            self._read_paused = True
+        self._wake()
+
+    def eof_received(self):
+        self.eof = True
+        self._wake()
+        return True  # 保持连接以便继续发送（半关闭）
+
+    def connection_lost(self, exc):
+        self.eof = True
+        self._wake()
+        if self._write_paused is not None and not self._write_paused.done():
+            self._write_paused.set_result(None)
+
+    def pause_writing(self):
+        self._write_paused = asyncio.get_event_loop().create_future()
+
+    def resume_writing(self):
+        if self._write_paused is not None and not self._write_paused.done():
+            self._write_paused.set_result(None)
+        self._write_paused = None
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    # ---------- 协程接口 ----------
+
+    async def _wait(self):
+        self._waiter = asyncio.get_event_loop().create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    def consume(self, n):
+        self.start += n
+        if self._read_paused and not self.transport.is_closing():
+            self._read_paused = False
+            self.transport.resume_reading()
+
+    async def read_view(self):
+        """等待并返回未取用数据的视图（连接结束时为空）；处理完后调用 consume()"""
+        while self.start == self.end and not self.eof:
+            await self._wait()
+        return self.view[self.start:self.end]
+
+    async def readexactly(self, n):
+        while self.end - self.start < n:
+            if self.eof:
+                raise asyncio.IncompleteReadError(bytes(self.view[self.start:self.end]), n)
+            if self.end == len(self.buffer) and self.start == 0:
+                raise ValueError('请求过大')
+            await self._wait()
+        data = bytes(self.view[self.start:self.start + n])
+        self.consume(n)
+        return data
+
+    async def readuntil(self, separator, limit):
+        while True:
+            index = self.buffer.find(separator, self.start, self.end)
+            if index >= 0:
+                return await self.readexactly(index + len(separator) - self.start)
+            if self.end - self.start >= limit or (self.end == len(self.buffer) and self.start == 0):
+                raise ValueError('请求头过大')
+            if self.eof:
+                raise asyncio.IncompleteReadError(bytes(self.view[self.start:self.end]), None)
+            await self._wait()
+
+    def write(self, data):
+        if not self.transport.is_closing():
+            self.transport.write(data)
+
+    async def drain(self):
+        if self._write_paused is not None:
+            await self._write_paused
+
+    def close(self):
+        self.transport.close()
+
+
+class TunnelEngine:
+    """本地 SOCKS5/HTTP 代理，经 WebSocket 隧道转发（与 ech-workers 的 -f/-l/-token/-ip 参数对应）"""
+
+    def __init__(self, server, listen, token='', ip='', log=print, buffer_size=RELAY_BUFFER, verify=True):
+        self.server = server
+        self.listen = listen
+        self.token = token or None
+        self.ip = ip or None
+        self.log = log
+        self.buffer_size = buffer_size
+        self.tls, self.host, self.port, self.path = parse_server(server)
+        self.ssl = None
+        if self.tls:
+            self.ssl = ssl.create_default_context()
+            if not verify:
+                self.ssl.check_hostname = False
+                self.ssl.verify_mode = ssl.CERT_NONE
+        self.connections = 0
+        self.failed = 0
+        self.active = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self.connect_ms = deque(maxlen=LATENCY_SAMPLES)  # 从收到请求到 CONNECTED 的耗时
+        self._server = None
+        self._tasks = set()
+
+    # ---------- 生命周期 ----------
+
+    async def start(self):
+        host, port = parse_addr(self.listen)
+        loop = asyncio.get_event_loop()
+        self._server = await loop.create_server(
+            lambda: LocalConnection(self.buffer_size, self._on_connect), host, port,
+            reuse_address=True)
+        self.log(f"[代理] 服务器启动: {self.listen} (支持 SOCKS5 和 HTTP，进程内引擎)\n")
+        self.log(f"[代理] 后端服务器: {self.server}\n")
+        if self.tls:
+            self.log("[代理] 注意: 进程内引擎不支持 ECH，TLS 握手中的 SNI 为明文\n")
+        return self
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname() if self._server else None
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._server = None
+
+    def stats(self):
+        samples = list(self.connect_ms)
+        return {
+            'connections_total': self.connections,
+            'connections_failed_total': self.failed,
+            'connections_active': self.active,
+            'bytes_up': self.bytes_up,
+            'bytes_down': self.bytes_down,
+            'connect_p50_ms': percentile(samples, 0.5),
+            'connect_p99_ms': percentile(samples, 0.99),
+        }
+
+    def _on_connect(self, conn):
+        task = asyncio.ensure_future(self._handle(conn))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # ---------- 本地协议 ----------
+
+    async def _handle(self, conn):
+        peer = conn.transport.get_extra_info('peername')
+        client = f'{peer[0]}:{peer[1]}' if peer else '?'
+        try:
+            try:
+                request = await asyncio.wait_for(self._read_request(conn), HANDSHAKE_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                return
+            if request is None:
+                return
+            target, mode, first_frame, accepted = request
+            await self._tunnel(conn, client, target, mode, first_frame, accepted)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.log(f"[代理] {client} 处理失败: {e}\n")
+        finally:
+            conn.close()
+
+    async def _read_request(self, conn):
+        """返回 (目标, 模式, 首帧, 收到请求的时间)；不支持的请求返回 None"""
+        first = (await conn.readexactly(1))[0]
+        accepted = time.perf_counter()
+        if first == 0x05:
+            return await self._read_socks5(conn, accepted)
+        if chr(first) in 'CGPHDOT':
+            return await self._read_http(conn, bytes([first]), accepted)
+        return None
+
+    async def _read_socks5(self, conn, accepted):
+        nmethods = (await conn.readexactly(1))[0]
+        await conn.readexactly(nmethods)
+        conn.write(b'\x05\x00')  # 无需认证
+        version, command, _, atyp = await conn.readexactly(4)
+        if version != 5:
+            return None
+        if atyp == 0x01:
+            host = str(ipaddress.IPv4Address(await conn.readexactly(4)))
+        elif atyp == 0x03:
+            host = (await conn.readexactly((await conn.readexactly(1))[0])).decode('idna')
+        elif atyp == 0x04:
+            host = str(ipaddress.IPv6Address(await conn.readexactly(16)))
+        else:
+            conn.write(SOCKS_BAD_ADDRESS)
+            return None
+        port = struct.unpack('!H', await conn.readexactly(2))[0]
+        if command != 0x01:
+            conn.write(SOCKS_BAD_COMMAND)
+            return None
+        target = f'[{host}]:{port}' if atyp == 0x04 else f'{host}:{port}'
+        return target, MODE_SOCKS5, b'', accepted
+
+    async def _read_http(self, conn, first, accepted):
+        head = first + await conn.readuntil(b'\r\n\r\n', MAX_HTTP_HEADER)
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split()
+        if len(parts) < 3:
+            return None
+        method, url, version = parts[:3]
+        header_lines = [line for line in lines[1:] if line]
+        headers = {}
+        for line in header_lines:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        if method == 'CONNECT':
+            return url, MODE_HTTP_CONNECT, b'', accepted
+        if method not in ('GET', 'POST', 'PUT', 'DELETE', 'HEAD', 'OPTIONS', 'PATCH', 'TRACE'):
+            conn.write(b'HTTP/1.1 405 Method Not Allowed\r\n\r\n')
+            return None
+        # 普通 HTTP 代理：改写为相对路径的请求，作为首帧发送
+        if url.startswith('http://'):
+            rest = url[7:]
+            index = rest.find('/')
+            target, path = (rest[:index], rest[index:]) if index > 0 else (rest, '/')
+        else:
+            target, path = headers.get('host', ''), url
+        if not target:
+            conn.write(b'HTTP/1.1 400 Bad Request\r\n\r\n')
+            return None
+        if ':' not in target.rsplit(']', 1)[-1]:
+            target += ':80'
+        request = [f'{method} {path} {version}']
+        request += [line for line in header_lines
+                    if line.split(':', 1)[0].strip().lower() not in ('proxy-connection', 'proxy-authorization')]
+        # 请求头按 latin-1 解码，编码回去即原始字节；首帧保持为字节，由 _tunnel 决定怎样发送
+        first_frame = ('\r\n'.join(request) + '\r\n\r\n').encode('latin-1')
+        length = int(headers.get('content-length') or 0)
+        if 0 < length < MAX_HTTP_BODY:
+            first_frame += await conn.readexactly(length)
+        return target, MODE_HTTP_PROXY, first_frame, accepted
+
+    @staticmethod
+    def _reply(conn, mode, ok):
+        if mode == MODE_SOCKS5:
+            conn.write(SOCKS_OK if ok else SOCKS_FAIL)
+        elif mode == MODE_HTTP_CONNECT:
+            conn.write(b'HTTP/1.1 200 Connection Established\r\n\r\n' if ok else
+                       b'HTTP/1.1 502 Bad Gateway\r\n\r\n')
+        elif not ok:
+            conn.write(b'HTTP/1.1 502 Bad Gateway\r\n\r\n')
+
+    # ---------- 隧道 ----------
+
+    async def _tunnel(self, conn, client, target, mode, first_frame, accepted):
+        try:
+            socket_ = await ws.connect(self.host, self.port, self.path, ssl=self.ssl,
+                                       protocol=self.token, addr=self.ip)
+        except (OSError, asyncio.TimeoutError, ws.WebSocketError) as e:
+            self.failed += 1
+            self._reply(conn, mode, False)
+            self.log(f"[代理] {client} 连接服务器失败: {e or type(e).__name__}\n")
+            return
+        try:
+            # worker 按 UTF-8 解码文本帧：首帧是合法 UTF-8 时随 CONNECT 发送，否则 CONNECTED 之后以二进制发送
+            try:
+                first_frame.decode('utf-8')
+                text, first_frame = first_frame, b''
+            except UnicodeDecodeError:
+                text = b''
+            await socket_.send(b'CONNECT:' + target.encode('utf-8') + b'|' + text, ws.OP_TEXT)
+            opcode, message = await asyncio.wait_for(socket_.recv(), HANDSHAKE_TIMEOUT)
+            if opcode != ws.OP_TEXT or message != b'CONNECTED':
+                self.failed += 1
+                self._reply(conn, mode, False)
+                self.log(f"[代理] {client} 代理失败: {message[:200].decode('utf-8', 'replace')}\n")
+                return
+            self.connect_ms.append((time.perf_counter() - accepted) * 1000)
+            self.connections += 1
+            self.active += 1
+            self._reply(conn, mode, True)
+            try:
+                if first_frame:
+                    await socket_.send(first_frame)
+                await self._relay(conn, socket_)
+            finally:
+                self.active -= 1
+        except (ws.ConnectionClosed, asyncio.TimeoutError):
+            self.failed += 1
+            self._reply(conn, mode, False)
+        finally:
+            await socket_.close()
+
+    async def _relay(self, conn, socket_):
+        """双向转发，任一方向结束即结束整条隧道（与 ech-workers 相同）"""
+        up = asyncio.ensure_future(self._pump_up(conn, socket_))
+        down = asyncio.ensure_future(self._pump_down(conn, socket_))
+        ping = asyncio.ensure_future(self._keepalive(socket_))
+        try:
+            await asyncio.wait((up, down), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (up, down, ping):
+                task.cancel()
+            await asyncio.gather(up, down, ping, return_exceptions=True)
+
+    async def _pump_up(self, conn, socket_):
+        """本地 → worker：直接发送缓冲区视图，发送等待期间缓冲写满会暂停读取"""
+        while True:
+            view = await conn.read_view()
+            if not view:
+                await socket_.send('CLOSE')
+                return
+            n = len(view)
+            await socket_.send(view)
+            conn.consume(n)
+            self.bytes_up += n
+
+    async def _pump_down(self, conn, socket_):
+        """worker → 本地：客户端接收慢时等待写缓冲排空，期间不再读取 WebSocket"""
+        while True:
+            opcode, message = await socket_.recv()
+            if opcode == ws.OP_TEXT and message == b'CLOSE':
+                return
+            conn.write(message)
+            self.bytes_down += len(message)
+            await conn.drain()
+
+    @staticmethod
+    async def _keepalive(socket_):
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            await socket_.ping()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m echipa.tunnel', description='进程内隧道引擎（ech-workers 的纯 Python 替代）')
+    parser.add_argument('-f', dest='server', required=True, help='服务端地址（wss:// 或 ws://，省略时为 wss）')
+    parser.add_argument('-l', dest='listen', default='127.0.0.1:30000', help='代理监听地址')
+    parser.add_argument('-token', default='', help='身份验证令牌')
+    parser.add_argument('-ip', default='', help='指定服务端 IP')
+    # 以下参数与 ech-workers 的命令行兼容，进程内引擎不使用 ECH，忽略
+    for name in ('-dns', '-ech', '-echfile'):
+        parser.add_argument(name, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    async def run():
+        engine = TunnelEngine(args.server, args.listen, args.token, args.ip,
+                              log=lambda text: print(text, end='', flush=True))
+        await engine.start()
+        await engine.serve_forever()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"[代理] 启动失败: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
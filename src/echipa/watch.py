@@ -0,0 +1,124 @@
+"""
+文件变化监视
+Linux 上通过 ctypes 调用 inotify 监视所在目录（原子改名写入也能收到），其他平台轮询 mtime
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+
+# 连续写入（先截断再写、写临时文件再改名）合并为一次通知
+SETTLE_DELAY = 0.05
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _load_inotify():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class FileWatcher:
+    """文件内容发生变化时在后台线程调用 callback()"""
+
+    def __init__(self, path, callback, interval=1.0):
+        self.path = path
+        self.callback = callback
+        self.interval = interval  # 轮询间隔（秒）
+        self.mode = None  # 'inotify' 或 'poll'
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = -1
+
+    def start(self):
+        libc = _load_inotify()
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0 and libc.inotify_add_watch(
+                    fd, os.fsencode(os.path.dirname(os.path.abspath(self.path))),
+                    IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE) >= 0:
+                self._fd = fd
+            elif fd >= 0:
+                os.close(fd)
+        self.mode = 'inotify' if self._fd >= 0 else 'poll'
+        target = self._run_inotify if self._fd >= 0 else self._run_poll
+        self._thread = threading.Thread(target=target, name='config-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _notify(self):
+        try:
+            self.callback()
+        except Exception as e:
+            print(f"配置监视回调失败: {e}")
+
+    def _run_poll(self):
+        last = _signature(self.path)
+        while not self._stop.wait(self.interval):
+            current = _signature(self.path)
+            if current != last:
+                last = current
+                self._notify()
+
+    def _read_events(self):
+        """读取并丢弃已排队的事件，返回是否有与目标文件相关的事件"""
+        name = os.fsencode(os.path.basename(self.path))
+        matched = False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return matched
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                _, _, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                if data[offset:offset + length].rstrip(b'\0') == name:
+                    matched = True
+                offset += length
+
+    def _run_inotify(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._fd], [], [], 0.5)
+            if not readable or not self._read_events():
+                continue
+            # 等写入方完成后续操作，再把期间的事件一并丢弃
+            if self._stop.wait(SETTLE_DELAY):
+                return
+            self._read_events()
+            self._notify()
@@ -0,0 +1,222 @@
+"""
+极简 WebSocket（RFC 6455），基于 asyncio 流
+只实现本项目用到的部分：客户端/服务端握手、文本与二进制消息、ping/pong 与关闭；不支持扩展
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+MAX_MESSAGE = 16 * 1024 * 1024
+MAX_HANDSHAKE = 16 * 1024
+
+
+class WebSocketError(Exception):
+    pass
+
+
+class ConnectionClosed(WebSocketError):
+    pass
+
+
+def accept_key(key):
+    """Sec-WebSocket-Key 对应的 Sec-WebSocket-Accept"""
+    return base64.b64encode(hashlib.sha1(key.encode('ascii') + GUID).digest()).decode('ascii')
+
+
+def apply_mask(data, key):
+    """按 4 字节掩码异或（作为大整数一次完成，比逐字节循环快两个数量级）"""
+    n = len(data)
+    if not n:
+        return b''
+    repeated = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(repeated, 'little')).to_bytes(n, 'little')
+
+
+def _parse_headers(lines):
+    headers = {}
+    for line in lines:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+class WebSocket:
+    """一条已完成握手的 WebSocket 连接；client=True 时发送的帧加掩码"""
+
+    def __init__(self, reader, writer, client=True, protocol=None):
+        self.reader = reader
+        self.writer = writer
+        self.client = client
+        self.protocol = protocol  # 协商的子协议（ech-workers 用作令牌）
+        self.closed = False
+
+    def _frame(self, opcode, data):
+        n = len(data)
+        first = 0x80 | opcode
+        mask_bit = 0x80 if self.client else 0
+        if n < 126:
+            header = struct.pack('!BB', first, mask_bit | n)
+        elif n < 65536:
+            header = struct.pack('!BBH', first, mask_bit | 126, n)
+        else:
+            header = struct.pack('!BBQ', first, mask_bit | 127, n)
+        if self.client:
+            key = os.urandom(4)
+            return header + key + apply_mask(data, key)
+        return header + bytes(data)
+
+    async def send(self, data, opcode=None):
+        """发送一条消息：str 为文本，bytes/memoryview 为二进制；等待发送缓冲排空（背压）"""
+        if self.closed:
+            raise ConnectionClosed('连接已关闭')
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+            opcode = opcode or OP_TEXT
+        self.writer.write(self._frame(opcode or OP_BINARY, data))
+        await self.writer.drain()
+
+    async def ping(self, data=b''):
+        await self.send(data, OP_PING)
+
+    async def _read_frame(self):
+        head = await self.reader.readexactly(2)
+        fin = head[0] & 0x80
+        opcode = head[0] & 0x0F
+        masked = head[1] & 0x80
+        n = head[1] & 0x7F
+        if n == 126:
+            n = struct.unpack('!H', await self.reader.readexactly(2))[0]
+        elif n == 127:
+            n = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+        if n > MAX_MESSAGE:
+            raise WebSocketError(f'消息过大: {n}')
+        key = await self.reader.readexactly(4) if masked else None
+        payload = await self.reader.readexactly(n) if n else b''
+        if key:
+            payload = apply_mask(payload, key)
+        return fin, opcode, payload
+
+    async def recv(self):
+        """接收下一条文本或二进制消息，返回 (opcode, payload bytes)；ping 自动回复，对方关闭时抛出 ConnectionClosed"""
+        fragments = None
+        message_opcode = None
+        while True:
+            try:
+                fin, opcode, payload = await self._read_frame()
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                self.closed = True
+                raise ConnectionClosed(str(e) or '连接已断开')
+            if opcode == OP_PING:
+                await self.send(payload, OP_PONG)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                if not self.closed:
+                    self.closed = True
+                    try:
+                        self.writer.write(self._frame(OP_CLOSE, payload[:2]))
+                    except Exception:
+                        pass
+                raise ConnectionClosed('对方已关闭')
+            if opcode == OP_CONTINUATION:
+                if fragments is None:
+                    raise WebSocketError('意外的后续帧')
+                fragments.append(payload)
+            else:
+                fragments, message_opcode = [payload], opcode
+            if fin:
+                data = fragments[0] if len(fragments) == 1 else b''.join(fragments)
+                return message_opcode, data
+
+    async def close(self, code=1000):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.writer.write(self._frame(OP_CLOSE, struct.pack('!H', code)))
+                await self.writer.drain()
+            except Exception:
+                pass
+        self.writer.close()
+
+
+async def connect(host, port, path='/', ssl=None, server_hostname=None, protocol=None, addr=None, timeout=10):
+    """建立 WebSocket 客户端连接
+
+    addr 不为空时连接该地址而不是 host（与 ech-workers 的 -ip 相同），Host 头和 SNI 仍为 host。
+    """
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(
+        addr or host, port, ssl=ssl,
+        server_hostname=(server_hostname or host) if ssl else None,
+        limit=MAX_MESSAGE), timeout)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    default_port = 443 if ssl else 80
+    host_header = host if port == default_port else f'{host}:{port}'
+    if ':' in host and not host.startswith('['):
+        host_header = f'[{host}]' if port == default_port else f'[{host}]:{port}'
+    request = (f'GET {path} HTTP/1.1\r\nHost: {host_header}\r\nUpgrade: websocket\r\n'
+               f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n')
+    if protocol:
+        request += f'Sec-WebSocket-Protocol: {protocol}\r\n'
+    writer.write((request + '\r\n').encode('latin-1'))
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+        writer.close()
+        raise WebSocketError(f'握手失败: {e}')
+    lines = head.decode('latin-1').split('\r\n')
+    status = lines[0].split(' ', 2)
+    if len(status) < 2 or status[1] != '101':
+        writer.close()
+        raise WebSocketError(f'握手失败: {lines[0]}')
+    headers = _parse_headers(lines[1:])
+    if headers.get('sec-websocket-accept') != accept_key(key):
+        writer.close()
+        raise WebSocketError('握手失败: Sec-WebSocket-Accept 不匹配')
+    return WebSocket(reader, writer, client=True, protocol=headers.get('sec-websocket-protocol'))
+
+
+async def accept(reader, writer, token=None):
+    """服务端握手；token 不为空时要求 Sec-WebSocket-Protocol 与之相同（与 _worker.js 一致）
+
+    返回 (WebSocket, 请求路径)；不是 WebSocket 请求或校验失败时回复错误并返回 (None, 路径)
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    if len(head) > MAX_HANDSHAKE:
+        writer.close()
+        return None, None
+    lines = head.decode('latin-1').split('\r\n')
+    parts = lines[0].split(' ')
+    path = parts[1] if len(parts) > 1 else '/'
+    headers = _parse_headers(lines[1:])
+
+    def reply(status, extra=''):
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Length: 0\r\n{extra}\r\n'.encode('latin-1'))
+
+    if headers.get('upgrade', '').lower() != 'websocket' or 'sec-websocket-key' not in headers:
+        reply('426 Upgrade Required')
+        return None, path
+    protocol = headers.get('sec-websocket-protocol')
+    if token and protocol != token:
+        reply('401 Unauthorized')
+        return None, path
+    extra = (f'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+             f'Sec-WebSocket-Accept: {accept_key(headers["sec-websocket-key"])}\r\n')
+    if token:
+        extra += f'Sec-WebSocket-Protocol: {token}\r\n'
+    writer.write(f'HTTP/1.1 101 Switching Protocols\r\n{extra}\r\n'.encode('latin-1'))
+    await writer.drain()
+    return WebSocket(reader, writer, client=False, protocol=protocol), path